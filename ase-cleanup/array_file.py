@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+# Shared module, only edited in ase-cleanup and copied to the other packages by scripts/sync_shared_modules.py
+
+import os
+import json
+import struct
+import tempfile
+import contextlib
+import numpy as np
+
+
+# Binary layout of the array files: an 8 byte magic, the little-endian offset of the JSON header, the arrays aligned to
+# ARRAY_ALIGNMENT from DATA_START on, then the JSON header up to the end of the file. The header is written last, so
+# the arrays can be filled in place before all of it is known. Its "arrays" entry maps the array names to their
+# [offset, shape, dtype], the arrays are in Fortran order.
+ARRAY_ALIGNMENT = 64
+DATA_START = 64
+
+
+@contextlib.contextmanager
+def create(path, magic, layout):
+    """
+    Create an array file of the arrays in layout, a dict of name -> (shape, dtype), under a temporary name.
+
+    Yields the arrays, memory-mapped for writing, and a dict of the JSON header to fill. When the block ends, the
+    header is written and the file moved to path, so concurrent readers never see a partial file.
+    """
+    offsets, end = {}, DATA_START
+    for name, (shape, dtype) in layout.items():
+        offsets[name] = [end, list(shape), np.dtype(dtype).str]
+        end = _aligned(end + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as array_file:
+            array_file.truncate(end)
+        arrays = {name: np.memmap(tmp_path, dtype=np.dtype(dtype), mode="r+", offset=offset, shape=tuple(shape),
+                                  order="F") for name, (offset, shape, dtype) in offsets.items() if np.prod(shape) > 0}
+        header = {}
+        yield arrays, header
+        for array in arrays.values():
+            array.flush()
+        del arrays
+
+        header["arrays"] = offsets
+        with open(tmp_path, "r+b") as array_file:
+            array_file.write(magic)
+            array_file.write(struct.pack("<Q", end))
+            array_file.seek(end)
+            array_file.write(json.dumps(header).encode())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def save(path, magic, header, arrays):
+    """Write the arrays of a dict of name -> array and the JSON header of a dict to an array file."""
+    arrays = {name: np.asarray(array) for name, array in arrays.items()}
+    layout = {name: (array.shape, array.dtype) for name, array in arrays.items()}
+    with create(path, magic, layout) as (mapped, file_header):
+        for name, array in mapped.items():
+            array[...] = arrays[name]
+        file_header.update(header)
+
+
+def load(path, magic, description):
+    """
+    Open an array file, returning its JSON header and its arrays, memory-mapped rather than read.
+
+    description names the kind of file in the error raised when the magic is not the given one.
+    """
+    with open(path, "rb") as array_file:
+        if array_file.read(len(magic)) != magic:
+            raise Exception(f"{path} is not a {description} file.")
+        header_offset, = struct.unpack("<Q", array_file.read(8))
+        array_file.seek(header_offset)
+        header = json.loads(array_file.read())
+
+    arrays = {}
+    for name, (offset, shape, dtype) in header.pop("arrays").items():
+        if np.prod(shape) > 0:
+            arrays[name] = np.memmap(path, dtype=np.dtype(dtype), mode="r", offset=offset, shape=tuple(shape),
+                                     order="F")
+        else:
+            arrays[name] = np.empty(shape, dtype=np.dtype(dtype), order="F")
+    return header, arrays
+
+
+def _aligned(size):
+    return -(-size // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+import numpy as np
+
+
+# Layout of matplotlib's default figure: 6.4 x 4.8 inches at 100 dpi, axes from 12.5% to 90% of the width and from
+# 11% to 88% of the height, bars in the first color of the default cycle.
+WIDTH, HEIGHT = 640, 480
+LEFT, RIGHT, BOTTOM, TOP = 0.125, 0.9, 0.11, 0.88
+BAR_COLOR = "#1f77b4"
+TICK_LENGTH = 4
+
+
+def write_histogram(values, plot_file, bins, xticks, xlabel, ylabel):
+    """Bin the values with NumPy and write the histogram as an SVG file, the bins are the ones of matplotlib's hist."""
+    values = np.asarray(values, dtype="float")
+    values = values[~np.isnan(values)]
+    counts, edges = np.histogram(values, bins=bins)
+    with open(plot_file, "w") as plot:
+        plot.write(_svg(counts, edges, xticks, xlabel, ylabel))
+
+
+def _limits(counts, edges, xticks):
+    # the data range with matplotlib's 5% margins, widened to show all of the requested ticks
+    x0, x1 = min(edges[0], xticks[0]), max(edges[-1], xticks[-1])
+    pad = (x1 - x0) * 0.05 or 0.5
+    y1 = max(counts.max(initial=0), 1) * 1.05
+    return x0 - pad, x1 + pad, y1
+
+
+def _frame():
+    return (int(round(LEFT * WIDTH)), int(round(RIGHT * WIDTH)),
+            int(round((1 - TOP) * HEIGHT)), int(round((1 - BOTTOM) * HEIGHT)))
+
+
+def _svg(counts, edges, xticks, xlabel, ylabel):
+    x0, x1, y1 = _limits(counts, edges, xticks)
+    left, right, top, bottom = _frame()
+    to_x = lambda x: left + (x - x0) / (x1 - x0) * (right - left)
+    to_y = lambda y: bottom - y / y1 * (bottom - top)
+
+    elements = []
+    for count, lo, hi in zip(counts, edges[:-1], edges[1:]):
+        if count > 0:
+            elements.append(f'<rect x="{to_x(lo):.2f}" y="{to_y(count):.2f}" width="{to_x(hi) - to_x(lo):.2f}" '
+                            f'height="{bottom - to_y(count):.2f}" fill="{BAR_COLOR}"/>')
+    elements.append(f'<rect x="{left}" y="{top}" width="{right - left}" height="{bottom - top}" fill="none" '
+                    f'stroke="black"/>')
+    for tick in xticks:
+        x = to_x(tick)
+        if left <= x <= right:
+            elements.append(f'<line x1="{x:.2f}" y1="{bottom}" x2="{x:.2f}" y2="{bottom + TICK_LENGTH}" stroke="black"/>')
+            elements.append(f'<text x="{x:.2f}" y="{bottom + 18}" text-anchor="middle">{tick:g}</text>')
+    for tick in _nice_ticks(y1):
+        y = to_y(tick)
+        elements.append(f'<line x1="{left - TICK_LENGTH}" y1="{y:.2f}" x2="{left}" y2="{y:.2f}" stroke="black"/>')
+        elements.append(f'<text x="{left - 7}" y="{y + 4:.2f}" text-anchor="end">{tick:g}</text>')
+    elements.append(f'<text x="{(left + right) / 2}" y="{HEIGHT - 12}" text-anchor="middle">{xlabel}</text>')
+    elements.append(f'<text x="16" y="{(top + bottom) / 2}" text-anchor="middle" '
+                    f'transform="rotate(-90 16 {(top + bottom) / 2})">{ylabel}</text>')
+
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" '
+            f'font-family="sans-serif" font-size="10">\n'
+            f'<rect width="{WIDTH}" height="{HEIGHT}" fill="white"/>\n' + "\n".join(elements) + "\n</svg>\n")
+
+
+def _nice_ticks(top):
+    """Round y ticks from 0 to top, at most about eight of them."""
+    step = 10 ** np.floor(np.log10(top / 8)) if top > 8 else 1
+    for factor in [1, 2, 5, 10]:
+        if top / (step * factor) <= 8:
+            step *= factor
+            break
+    return np.arange(0, top, step)
@@ -29,7 +29,7 @@
 /* this block is auto-generated based on info from pkg.json where   */
 /* changes can be made if needed, do NOT modify this block manually */
 nextflow.enable.dsl = 2
-version = '0.1.0'  // package version
+version = '0.2.0'  // package version
 
 container = [
     'ghcr.io': 'ghcr.io/icgc-argo-workflows/allele-specific-expression.ase-cleanup'
@@ -51,9 +51,15 @@ params.publish_dir = ""  // set to empty string will disable publishDir
 // tool specific parmas go here, add / change as needed
 params.input_file = ""
 params.mapp_file = "/home/ubuntu/k50.umap.bedgraph.gz"
-params.genome_file = "/home/ubuntu/GRCh38_Verily_v1.genome.fa.gz.genome"
+params.mapp_cache_dir = ""  // directory of the binary mappability index, empty string uses the bedgraph directory
 params.min_mappability = 0.05
 params.min_SNP_depth = 16
+params.chunk_size = 0  // read the ASE table in chunks of this many sites, 0 reads the whole table
+params.plot_backend = "matplotlib"  // VAF plot writer, "numpy" skips the matplotlib import and writes the plot as SVG
+params.parquet = false  // write the cleaned table as Parquet instead of tab separated, for ase-gene-annotation to read
+params.regions = ""  // BED file of the regions to clean, empty string keeps all sites
+params.ref_bias_summary = ""  // cohort reference bias summary merged by aseRefBiasCohort, empty string estimates the bias per sample
+params.count_matrix_dir = ""  // directory keeping the count matrix of aseCleanupCohort across runs, empty string builds it in the work directory
 
 
 process aseCleanup {
@@ -67,18 +73,106 @@ process aseCleanup {
     path(ase)
 
     output:
-    path("*.clean"), emit: output_file
+    path(params.parquet ? "*.parquet" : "*.clean"), emit: output_file
     path("*.log"), emit: log_file
-    path("*.vaf.png"), emit: vaf_file
+    path("*.vaf.{png,svg}"), emit: vaf_file
+    path("*.metrics.json"), emit: metrics_file
+    path("*.refbias.tsv"), emit: ref_bias_file
 
     script:
-      var name = ase.baseName
+      mapp_cache = params.mapp_cache_dir ? "--mappability_cache ${params.mapp_cache_dir}" : ""
+      chunk_size = params.chunk_size ? "--chunk_size ${params.chunk_size}" : ""
+      output = params.parquet ? "--output_parquet ${ase.baseName}.parquet" : "--output ${ase.baseName}.clean"
+      plot_format = params.plot_backend == "numpy" ? "svg" : "png"
+      regions = params.regions ? "--regions ${params.regions}" : ""
+      ref_bias = params.ref_bias_summary ? "--ref_bias_summary ${params.ref_bias_summary}" : ""
       """ 
-      awk -v OFS=\"\\t\" \"{print \\\$1,\\\$2-1,\\\$2 }\" $ase | tail -n+2 | sort -k1,1V -s > ${name}.bed
-      echo -e \"contig\tpos\tmappability\" > ${name}.mapp
-      bedtools map -a ${name}.bed -b $params.mapp_file -o min -c 4 -g $params.genome_file | cut -f1,3,4 >> ${name}.mapp
-      main.py --ase $ase --min_SNP_depth $params.min_SNP_depth  --output ${ase.baseName}.clean --mappability ${name}.mapp --filter_mapp $params.min_mappability --plot ${ase.baseName}.vaf.png
+      main.py --ase $ase --min_SNP_depth $params.min_SNP_depth  $output --ref_bias_output ${ase.baseName}.refbias.tsv $ref_bias --mappability_bedgraph $params.mapp_file $mapp_cache --filter_mapp $params.min_mappability --plot ${ase.baseName}.vaf.${plot_format} --plot_backend $params.plot_backend $chunk_size $regions
       mv ase_cleanup.log ${ase.baseName}.ase.log
+      mv ase_cleanup.metrics.json ${ase.baseName}.ase.metrics.json
+      """
+}
+
+
+// processes many ASE tables in one task, with a worker per cpu, for cohort reruns
+process aseCleanupBatch {
+  container "${params.container ?: container[params.container_registry ?: default_container_registry]}:${params.container_version ?: version}"
+  publishDir "${params.publish_dir}/${task.process.replaceAll(':', '_')}", mode: "copy", enabled: params.publish_dir
+
+  cpus params.cpus
+  memory "${params.mem} GB"
+
+    input:
+    path(ases)
+
+    output:
+    path(params.parquet ? "*.parquet" : "*.clean"), emit: output_file
+    path("*.ase.log"), emit: log_file
+    path("*.vaf.{png,svg}"), emit: vaf_file
+    path("*.ase.metrics.json"), emit: metrics_file
+    path("*.refbias.tsv"), emit: ref_bias_file
+
+    script:
+      mapp_cache = params.mapp_cache_dir ? "--mappability_cache ${params.mapp_cache_dir}" : ""
+      chunk_size = params.chunk_size ? "--chunk_size ${params.chunk_size}" : ""
+      parquet = params.parquet ? "--parquet" : ""
+      regions = params.regions ? "--regions ${params.regions}" : ""
+      ref_bias = params.ref_bias_summary ? "--ref_bias_summary ${params.ref_bias_summary}" : ""
+      """ 
+      main.py --ase $ases --workers $task.cpus --output_dir . $parquet --write_ref_bias $ref_bias --min_SNP_depth $params.min_SNP_depth --mappability_bedgraph $params.mapp_file $mapp_cache --filter_mapp $params.min_mappability --plot_backend $params.plot_backend $chunk_size $regions
+      """
+}
+
+
+// tests many ASE tables together over their site x sample count matrix, which is published for cross-sample queries
+process aseCleanupCohort {
+  container "${params.container ?: container[params.container_registry ?: default_container_registry]}:${params.container_version ?: version}"
+  publishDir "${params.publish_dir}/${task.process.replaceAll(':', '_')}", mode: "copy", enabled: params.publish_dir
+
+  cpus params.cpus
+  memory "${params.mem} GB"
+
+    input:
+    path(ases)
+
+    output:
+    path(params.parquet ? "*.parquet" : "*.clean"), emit: output_file
+    path("ase_cleanup.log"), emit: log_file
+    path("*.vaf.{png,svg}"), emit: vaf_file
+    path("ase_cleanup.metrics.json"), emit: metrics_file
+    path("*.refbias.tsv"), emit: ref_bias_file
+    path("cohort.counts"), emit: count_matrix
+
+    script:
+      mapp_cache = params.mapp_cache_dir ? "--mappability_cache ${params.mapp_cache_dir}" : ""
+      parquet = params.parquet ? "--parquet" : ""
+      regions = params.regions ? "--regions ${params.regions}" : ""
+      ref_bias = params.ref_bias_summary ? "--ref_bias_summary ${params.ref_bias_summary}" : ""
+      count_matrix = params.count_matrix_dir ? "${params.count_matrix_dir}/cohort.counts" : "cohort.counts"
+      """ 
+      main.py --ase $ases --cohort_matrix $count_matrix --output_dir . $parquet --write_ref_bias $ref_bias --min_SNP_depth $params.min_SNP_depth --mappability_bedgraph $params.mapp_file $mapp_cache --filter_mapp $params.min_mappability --plot_backend $params.plot_backend $regions
+      if [ ! -e cohort.counts ]; then ln -s $count_matrix cohort.counts; fi
+      """
+}
+
+
+// merges the reference bias summaries of samples, and of an earlier cohort to update it, into a cohort summary
+process aseRefBiasCohort {
+  container "${params.container ?: container[params.container_registry ?: default_container_registry]}:${params.container_version ?: version}"
+  publishDir "${params.publish_dir}/${task.process.replaceAll(':', '_')}", mode: "copy", enabled: params.publish_dir
+
+  cpus params.cpus
+  memory "${params.mem} GB"
+
+    input:
+    path(summaries, stageAs: "summaries/*")
+
+    output:
+    path("cohort.refbias.tsv"), emit: ref_bias_summary
+
+    script:
+      """
+      ref_bias.py -O cohort.refbias.tsv $summaries
       """
 }
 
@@ -23,76 +23,268 @@
 """
 
 
+import os
+import sys
 import pandas as pd
 import numpy as np
 import argparse
-import scipy as sp
-import statsmodels.api as sm
+import multiprocessing
+import contextlib
 import logging
-import matplotlib.pyplot as plt
+import metrics
+from ase_stats import binom_test_batch, bh_adjust, bh_adjust_columns
+from table_io import write_parquet, ParquetWriter
+from mappability import MappabilityIndex
+from schema import READ_DTYPES, CLEAN_DTYPES, MAPPABILITY_DTYPES, dtypes
+from regions import Regions
+from ref_bias import RefBiasSummary
+from count_matrix import CountMatrix
+
+
+# ASEReadCounter columns that are not part of the cleaned table
+DROPPED_READ_COLUMNS = ["lowMAPQDepth", "lowBaseQDepth", "rawDepth", "otherBases", "improperPairs"]
+DROPPED_COLUMNS = DROPPED_READ_COLUMNS + ["het_padj"]
 
 
 def main():
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s %(levelname)-8s %(message)s',
-        datefmt='%a, %d %b %Y %H:%M:%S',
-        handlers=[
-            logging.FileHandler("ase_cleanup.log"),
-            logging.StreamHandler()
-        ],
-        force=True)
+    setup_logging("ase_cleanup.log")
 
     parser = argparse.ArgumentParser(description="merge mappability table, filter mappability score, calculate allelic imbalance and reference bias, test heterozygosity, and clean up ase table by given threshold")
-    parser.add_argument("--ase", dest="ase",
-                        help="input ASE table created by ASEReadCounter")
+    parser.add_argument("--ase", dest="ase", nargs="+", default=[],
+                        help="input ASE table(s) created by ASEReadCounter")
+    parser.add_argument("--manifest", dest="manifest",
+                        help="file listing input ASE tables, one per line")
     parser.add_argument("--ref_ratio", dest="ref_ratio", type=float,
                         help="Numeric, ref_ratio for calculating allelic imbalance in binomial test, default=pipeline-calculated ref bias from data")
+    parser.add_argument("--ref_bias_summary", dest="ref_bias_summary",
+                        help="reference bias summary of a cohort merged by ref_bias.py, used instead of the ref bias calculated from data")
+    parser.add_argument("--ref_bias_output", dest="ref_bias_output",
+                        help="write the summary of the ref bias calculated from data, for merging into a cohort summary with ref_bias.py")
     parser.add_argument("--min_SNP_depth", dest="filter_total_read", default=20, type=int,
                         help="Numeric, threshold of total read at SNPs")
     parser.add_argument("--mappability", dest="mapp",
                         help="mappability file of the format (contig, pos, mappability)")
+    parser.add_argument("--mappability_bedgraph", dest="mapp_bedgraph",
+                        help="mappability bedgraph, the minimum score over each site is looked up in a binary index of the bedgraph")
+    parser.add_argument("--mappability_cache", dest="mapp_cache",
+                        help="directory of the binary mappability index, created on first use, default=the bedgraph directory")
+    parser.add_argument("--regions", dest="regions",
+                        help="BED file of the regions to process, the sites outside of them are dropped as the table is read")
     parser.add_argument("--filter_mapp", dest="filter_mapp_score", default=0.05, type=float,
                         help="Numeric, minimum required mappability, only used if mappability file is provided")
     parser.add_argument("--pvalue_het", dest="het_perror", type=float, 
                         help="Numeric, p value threshold for testing heterozygosity, suggest=0.02, default=otherBases.sum()/rawDepth.sum()")
     parser.add_argument("--output", dest="output_file",
 						help="output table")
+    parser.add_argument("--output_parquet", dest="output_parquet",
+                        help="output table as Parquet, which gene_annotation.py reads without parsing the text, with or instead of --output")
     parser.add_argument("--plot", dest="plot_file",
 						help="VAF plot file")
+    parser.add_argument("--plot_backend", dest="plot_backend", default="matplotlib", choices=["matplotlib", "numpy"],
+                        help="VAF plot writer, numpy bins the VAFs and writes an SVG plot file without importing matplotlib")
+    parser.add_argument("--output_dir", dest="output_dir", default=".",
+                        help="directory of the <name>.clean, <name>.vaf.png, .vaf.svg with the numpy plot backend, and <name>.ase.log outputs when processing multiple tables")
+    parser.add_argument("--parquet", dest="parquet", action="store_true",
+                        help="write <name>.parquet instead of <name>.clean tables when processing multiple tables")
+    parser.add_argument("--write_ref_bias", dest="write_ref_bias", action="store_true",
+                        help="also write <name>.refbias.tsv reference bias summaries when processing multiple tables")
+    parser.add_argument("--workers", dest="workers", default=1, type=int,
+                        help="Numeric, number of tables processed in parallel when processing multiple tables")
+    parser.add_argument("--cohort_matrix", dest="cohort_matrix",
+                        help="count matrix file of the input tables, built unless it was built from the same tables, the tables are then tested together over the matrix with the outputs in --output_dir")
+    parser.add_argument("--chunk_size", dest="chunk_size", type=int,
+                        help="Numeric, read the ASE table in chunks of this many sites to bound the memory use, default=read the whole table")
     args = parser.parse_args()
 
-    ase = read_ase(args.ase)
+    ase_files = args.ase + (read_manifest(args.manifest) if args.manifest else [])
+    if len(ase_files) == 0:
+        parser.error("no input ASE table given, use --ase or --manifest")
+
+    if args.plot_backend == "numpy" and args.plot_file is not None and not args.plot_file.lower().endswith(".svg"):
+        parser.error("--plot_backend numpy writes SVG, name the --plot file .svg")
+
+    if args.cohort_matrix is not None:
+        if args.output_file is not None or args.plot_file is not None or args.output_parquet is not None or args.ref_bias_output is not None:
+            parser.error("--output, --output_parquet, --ref_bias_output and --plot take a single input, use --output_dir with --cohort_matrix")
+        metrics.reset("ase_cleanup")
+        try:
+            clean_cohort(args, ase_files)
+        finally:
+            metrics.write("ase_cleanup.metrics.json")
+    elif len(ase_files) == 1 and (args.output_file is not None or args.output_parquet is not None):
+        args.ase = ase_files[0]
+        metrics.reset("ase_cleanup")
+        try:
+            clean_sample(args)
+        finally:
+            metrics.write("ase_cleanup.metrics.json")
+    elif args.output_file is not None or args.plot_file is not None or args.output_parquet is not None or args.ref_bias_output is not None:
+        parser.error("--output, --output_parquet, --ref_bias_output and --plot take a single input, use --output_dir for multiple tables")
+    else:
+        clean_batch(args, ase_files)
+
+
+def setup_logging(log_file):
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        datefmt='%a, %d %b %Y %H:%M:%S',
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ],
+        force=True)
+
+
+def read_manifest(manifest_file):
+    with open(manifest_file) as manifest:
+        return [line.strip() for line in manifest if line.strip() and not line.startswith("#")]
+
+
+def clean_sample(args):
+    if args.chunk_size:
+        clean_chunked(args)
+        return
+
+    ase = read_ase(args.ase, load_regions(args.regions))
     if args.mapp is not None:
         ase = add_mapp(ase, args.mapp)
+    elif args.mapp_bedgraph is not None:
+        ase = add_mapp_bedgraph(ase, args.mapp_bedgraph, args.mapp_cache)
     ref_source_cutoff = args.filter_total_read // 2
-    ref_bias_table = calc_ref_bias(ase, ref_source_cutoff) if args.ref_ratio is None else insert_ref_bias(args.ref_ratio)
-    ase_rb = pd.merge(ase, ref_bias_table, how="left", left_on=["refAllele", "altAllele"], right_on=["refAllele", "altAllele"])
-    ase_rb["ref_bias"].fillna(float(0.5), inplace=True)
-    ase_rb.set_index(ase.index, inplace=True)
+    if args.ref_bias_output is not None:
+        write_ref_bias_summary(ase["refAllele"], ase["altAllele"], ase["refCount"], ase["altCount"], ase["ase_ratio"],
+                               ref_source_cutoff, args.ref_bias_output)
+    if args.ref_ratio is not None:
+        ref_bias_table = insert_ref_bias(args.ref_ratio)
+    elif args.ref_bias_summary is not None:
+        ref_bias_table = load_ref_bias_summary(args.ref_bias_summary)
+    else:
+        ref_bias_table = calc_ref_bias(ase, ref_source_cutoff)
+    with metrics.stage("merge_ref_bias", len(ase)) as record:
+        ase_rb = pd.merge(ase, ref_bias_table, how="left", left_on=["refAllele", "altAllele"], right_on=["refAllele", "altAllele"])
+        ase_rb["ref_bias"].fillna(float(0.5), inplace=True)
+        ase_rb.set_index(ase.index, inplace=True)
+        record["rows_out"] = len(ase_rb)
     ase_ai = allelic_imbalance(ase_rb)
     perror = args.het_perror if args.het_perror else ase.otherBases.sum() / ase.rawDepth.sum()
     ase_het = het_test(ase_ai, perror)
     logging.info(f"args.filter_mapp_score = {args.filter_mapp_score}")
     ase_clean = clean_up(ase_het, args.filter_mapp_score, args.filter_total_read, perror)
-    ase_clean.to_csv(args.output_file, sep="\t", index=True, header=True)
-    vaf_plot(ase_clean, args.plot_file)
-
-
-def vaf_plot(ase, plot_file):
+    with metrics.stage("write_output", len(ase_clean)) as record:
+        if args.output_file is not None:
+            ase_clean.to_csv(args.output_file, sep="\t", index=True, header=True)
+        if args.output_parquet is not None:
+            write_parquet(ase_clean, args.output_parquet, index=True)
+        record["rows_out"] = len(ase_clean)
+    vaf_plot(ase_clean, args.plot_file, args.plot_backend)
+
+
+def output_names(ase_files):
+    names = [os.path.splitext(os.path.basename(ase_file))[0] for ase_file in ase_files]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise Exception(f"Input tables with the same name would overwrite each other's outputs: {', '.join(duplicates)}")
+    return names
+
+
+def clean_batch(args, ase_files):
+    names = output_names(ase_files)
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs = []
+    for ase_file, name in zip(ase_files, names):
+        output = os.path.join(args.output_dir, name)
+        sample_args = argparse.Namespace(**vars(args))
+        sample_args.ase, sample_args.plot_file = ase_file, f"{output}.{plot_suffix(args.plot_backend)}"
+        sample_args.output_file = None if args.parquet else f"{output}.clean"
+        sample_args.output_parquet = f"{output}.parquet" if args.parquet else None
+        sample_args.ref_bias_output = f"{output}.refbias.tsv" if args.write_ref_bias else None
+        jobs.append((sample_args, f"{output}.ase.log", f"{output}.ase.metrics.json"))
+
+    # build the mappability index once rather than in every worker
+    if args.mapp_bedgraph is not None:
+        MappabilityIndex.open(args.mapp_bedgraph, args.mapp_cache)
+
+    logging.info(f"Processing {len(jobs)} ASE tables with {args.workers} worker(s).")
+    if args.workers > 1:
+        with multiprocessing.Pool(args.workers) as pool:
+            results = pool.starmap(clean_batch_sample, jobs, chunksize=1)
+    else:
+        results = [clean_batch_sample(*job) for job in jobs]
+
+    setup_logging("ase_cleanup.log")
+    failed = [(ase_file, error) for ase_file, error in results if error is not None]
+    for ase_file, error in failed:
+        logging.error(f"Processing {ase_file} failed: {error}")
+    logging.info(f"{len(results) - len(failed)} / {len(results)} ASE tables processed.")
+    if failed:
+        sys.exit(1)
+
+
+def clean_batch_sample(sample_args, log_file, metrics_file):
+    setup_logging(log_file)
+    metrics.reset("ase_cleanup")
+    try:
+        clean_sample(sample_args)
+        return sample_args.ase, None
+    except Exception as e:
+        logging.exception(f"Processing {sample_args.ase} failed.")
+        return sample_args.ase, str(e)
+    finally:
+        metrics.write(metrics_file)
+
+
+def plot_suffix(backend):
+    """Suffix of the VAF plots written in the output directory, the numpy backend writes SVG."""
+    return "vaf.svg" if backend == "numpy" else "vaf.png"
+
+
+@metrics.timed("vaf_plot")
+def vaf_plot(ase, plot_file, backend="matplotlib"):
     step_val = 1/8
+    if backend == "numpy":
+        from histogram import write_histogram
+        write_histogram(ase["ase_ratio"], plot_file, 32, np.arange(0, 1+step_val, step=step_val),
+                        "B-Allele Frequency", "Number of Positions")
+        return
+
+    # matplotlib is imported only here, it takes longer to import than small tables take to process
+    import matplotlib.pyplot as plt
+    # a new figure for every plot, so that the histograms of consecutive samples are not drawn over each other
+    figure = plt.figure()
     plt.xticks(np.arange(0, 1+step_val, step=step_val))
     plt.hist(ase["ase_ratio"], bins=32)
     plt.xlabel("B-Allele Frequency")
     plt.ylabel("Number of Positions")
     plt.savefig(plot_file)
+    plt.close(figure)
     
 
-def read_ase(ase_file):
-    ase = pd.read_csv(ase_file, sep="\t", index_col=(0, 1))
+def load_regions(bed_file):
+    if bed_file is None:
+        return None
+    regions = Regions.from_bed(bed_file)
+    logging.info(f"Processing the sites in {len(regions)} regions of {bed_file}.")
+    return regions
+
+
+def in_regions(ase, regions):
+    """The sites of the table that lie in the regions."""
+    return ase[regions.contains(ase.index.get_level_values(0), ase.index.get_level_values(1))]
+
+
+@metrics.timed("read_ase")
+def read_ase(ase_file, regions=None):
+    ase = pd.read_csv(ase_file, sep="\t", index_col=(0, 1), dtype=READ_DTYPES)
+    metrics.count("sites_read", len(ase))
 
     if len(ase) <= 0:
         raise Exception("The ASE table is empty.")
+    if regions is not None:
+        ase = in_regions(ase, regions)
+        metrics.count("sites_in_regions", len(ase))
+        if len(ase) <= 0:
+            raise Exception("The ASE table has no sites in the regions.")
 
     # the reference allele specific expression ratio
     ase = ase[ase["totalCount"] > 0]
@@ -104,20 +296,29 @@ def read_ase(ase_file):
 # Castel et al. 2015: In previous work [5, 8, 29–31] and in this paper, unless mentioned otherwise, we remove about
 # 20 % of het-SNPs that either fall within regions of low mappability (ENCODE 50 bp mappability score < 1) or show
 # mapping bias in simulations [27]. This reduces the number of sites with strong bias by about 50 %.
+@metrics.timed("add_mapp")
 def add_mapp(ase, mappability_file):
-    mapp = pd.read_csv(mappability_file, sep="\t", index_col=(0, 1))
+    mapp = pd.read_csv(mappability_file, sep="\t", index_col=(0, 1), dtype=MAPPABILITY_DTYPES)
     ase['mappability'] = pd.to_numeric(mapp['mappability'], errors='coerce')
     return ase
 
 
+@metrics.timed("add_mapp_bedgraph")
+def add_mapp_bedgraph(ase, bedgraph_file, cache_dir):
+    mapp = MappabilityIndex.open(bedgraph_file, cache_dir)
+    ase['mappability'] = mapp.lookup(ase.index.get_level_values(0), ase.index.get_level_values(1))
+    return ase
+
+
 # Castel et al. 2015: he genome-wide reference ratio remaining slightly above 0.5 indicates residual bias (Figure S6a
 # in Additional file 6). Using this ratio as a null in statistical tests instead of 0.5 [5, 6] can improve results (
 # Figure S6b–e in Additional file 6).
+@metrics.timed("calc_ref_bias")
 def calc_ref_bias(ase, cutoff):
     logging.info("Computing reference bias")  # equals to mapping bias
 
     ref_bias_table = ase.query(f"altCount >= {cutoff} and refCount >= {cutoff}")\
-        .groupby(['refAllele', 'altAllele'], as_index=False)['ase_ratio'] \
+        .groupby(['refAllele', 'altAllele'], as_index=False, observed=True)['ase_ratio'] \
         .mean() \
         .rename(columns={"ase_ratio": "ref_bias"})
 
@@ -126,6 +327,23 @@ def calc_ref_bias(ase, cutoff):
     return ref_bias_table
 
 
+@metrics.timed("ref_bias_summary")
+def write_ref_bias_summary(ref_alleles, alt_alleles, ref_count, alt_count, ratio, cutoff, summary_file):
+    """Write the sums behind calc_ref_bias, over the same source sites, as a summary that merges into a cohort one."""
+    source = np.asarray((alt_count >= cutoff) & (ref_count >= cutoff))
+    summary = RefBiasSummary.from_sites(np.asarray(ref_alleles)[source], np.asarray(alt_alleles)[source],
+                                        np.asarray(ratio)[source])
+    summary.save(summary_file)
+    logging.info(f"Reference bias summary of {summary.n_sites} sites written to {summary_file}.")
+
+
+def load_ref_bias_summary(summary_file):
+    summary = RefBiasSummary.load(summary_file)
+    ref_bias_table = summary.table()
+    logging.info("Cohort mean reference bias of %d sites: %.4f" % (summary.n_sites, ref_bias_table["ref_bias"].mean()))
+    return ref_bias_table
+
+
 def insert_ref_bias(bias_param):
     bases = pd.DataFrame(list("ACGT"))
     ref_bias_table = pd.merge(bases, bases, how="cross").rename(columns={"0_x": "refAllele", "0_y": "altAllele"})
@@ -134,12 +352,13 @@ def insert_ref_bias(bias_param):
     return ref_bias_table
 
 
+@metrics.timed("allelic_imbalance")
 def allelic_imbalance(ase):
     logging.info("Computing allelic expression imballance")
 
     # allelic epxression (effect size)
-    ase['AEI_pval'] = np.array([sp.stats.binom_test(ase.refCount[idx], n=ase.totalCount[idx], p=ase.ref_bias[idx]) for idx in ase.index], dtype="float")
-    ase['AEI_padj'] = sm.stats.multipletests(ase['AEI_pval'], method="fdr_bh")[1]
+    ase['AEI_pval'] = binom_test_batch(ase['refCount'].to_numpy(), ase['totalCount'].to_numpy(), ase['ref_bias'].to_numpy())
+    ase['AEI_padj'] = bh_adjust(ase['AEI_pval'])
 
     return ase
 
@@ -156,26 +375,308 @@ def allelic_imbalance(ase):
 # monoallelic expression in every tissue. In the Geuvadis data set with 1000 Genomes phase 1 genotypes and sites
 # covered by eight or more reads, an average of 4.3 % of sites per sample are excluded by these criteria [1 % false
 # discovery rate (FDR)].
+@metrics.timed("het_test")
 def het_test(ase, perror):
-    het_pvals = [sp.stats.binom_test(np.minimum(ase.altCount[idx], ase.refCount[idx]), n=ase.totalCount[idx], p=perror, alternative="greater") for idx in ase.index]
-    het_padj = sm.stats.multipletests(np.array(het_pvals, dtype="float"), method="fdr_bh")[1]
+    het_pvals = binom_test_batch(np.minimum(ase['altCount'].to_numpy(), ase['refCount'].to_numpy()), ase['totalCount'].to_numpy(), perror, alternative="greater")
+    het_padj = bh_adjust(het_pvals)
 
     ase['het_padj'] = het_padj
 
     return ase
 
 
+@metrics.timed("clean_up")
 def clean_up(ase, filter_mapp_score, filter_total, perror):
+    has_mappability = 'mappability' in ase
+    keep = filter_sites(ase['mappability'] if has_mappability else None, ase["totalCount"], ase["AEI_padj"],
+                        ase['het_padj'], filter_mapp_score, filter_total, perror)
+    ase = ase[keep]
+
+    if has_mappability:
+        ase = ase.drop(columns=["mappability"])
+    return ase.drop(columns=DROPPED_COLUMNS)
+
+
+def clean_chunked(args):
+    logging.info(f"Processing {args.ase} in chunks of {args.chunk_size} sites.")
+    regions = load_regions(args.regions)
+    if args.mapp is not None:
+        mapp = pd.to_numeric(pd.read_csv(args.mapp, sep="\t", index_col=(0, 1), dtype=MAPPABILITY_DTYPES)['mappability'], errors='coerce')
+        lookup_mapp = lambda chunk: mapp.reindex(chunk.index).to_numpy()
+    elif args.mapp_bedgraph is not None:
+        mapp = MappabilityIndex.open(args.mapp_bedgraph, args.mapp_cache)
+        lookup_mapp = lambda chunk: mapp.lookup(chunk.index.get_level_values(0), chunk.index.get_level_values(1))
+    else:
+        lookup_mapp = None
+
+    # Pass one: the compact per-site columns the tests need, the allele pairs and the sums for perror
+    sites = {"refCount": [], "altCount": [], "totalCount": [], "pair": [], "mappability": []}
+    pairs = {}
+    other_bases, raw_depth = 0, 0
+    with metrics.stage("read_ase") as record:
+        for chunk in read_ase_chunks(args.ase, args.chunk_size, regions):
+            # a chunk of sites without reads or outside of the regions has nothing to add
+            if chunk.empty:
+                continue
+            pair_codes, chunk_pairs = pd.factorize(pd.MultiIndex.from_arrays([chunk["refAllele"], chunk["altAllele"]]))
+            codes = np.array([pairs.setdefault(pair, len(pairs)) for pair in chunk_pairs], dtype=np.int16)
+            sites["pair"].append(codes[pair_codes] if len(codes) else np.empty(0, dtype=np.int16))
+            for column in ["refCount", "altCount", "totalCount"]:
+                sites[column].append(chunk[column].to_numpy(dtype=np.int32))
+            if lookup_mapp is not None:
+                sites["mappability"].append(lookup_mapp(chunk))
+            other_bases += int(chunk["otherBases"].sum())
+            raw_depth += int(chunk["rawDepth"].sum())
+        sites = {column: np.concatenate(values) if values else None for column, values in sites.items()}
+        ratio = sites["refCount"] / sites["totalCount"]
+        record["rows_out"] = len(ratio)
+
+    pair_names = pd.MultiIndex.from_tuples(list(pairs), names=["refAllele", "altAllele"])
+    if args.ref_bias_output is not None:
+        write_ref_bias_summary(pair_names.get_level_values(0)[sites["pair"]], pair_names.get_level_values(1)[sites["pair"]],
+                               sites["refCount"], sites["altCount"], ratio, args.filter_total_read // 2,
+                               args.ref_bias_output)
+    if args.ref_ratio is None and args.ref_bias_summary is None:
+        with metrics.stage("calc_ref_bias", len(ratio)) as record:
+            logging.info("Computing reference bias")
+            cutoff = args.filter_total_read // 2
+            source = (sites["altCount"] >= cutoff) & (sites["refCount"] >= cutoff)
+            pair_bias = pd.Series(ratio[source]).groupby(sites["pair"][source]).mean()
+            logging.info("Estimated mean reference bias: %.4f" % pair_bias.mean())
+            record["rows_out"] = len(pair_bias)
+    else:
+        ref_bias_table = insert_ref_bias(args.ref_ratio) if args.ref_ratio is not None else load_ref_bias_summary(args.ref_bias_summary)
+        pair_bias = pd.Series(ref_bias_table.set_index(["refAllele", "altAllele"])["ref_bias"].reindex(pair_names).to_numpy())
+    bias = pair_bias.reindex(np.arange(len(pairs))).fillna(float(0.5)).to_numpy()[sites["pair"]]
+
+    # Pass two: p-values and their adjustment over the compact arrays
+    with metrics.stage("allelic_imbalance", len(ratio)) as record:
+        logging.info("Computing allelic expression imballance")
+        aei_pval = binom_test_batch(sites["refCount"], sites["totalCount"], bias)
+        aei_padj = bh_adjust(aei_pval)
+        record["rows_out"] = len(aei_padj)
+    with metrics.stage("het_test", len(ratio)) as record:
+        perror = args.het_perror if args.het_perror else other_bases / raw_depth
+        het_pval = binom_test_batch(np.minimum(sites["altCount"], sites["refCount"]), sites["totalCount"], perror, alternative="greater")
+        het_padj = bh_adjust(het_pval)
+        del het_pval
+        record["rows_out"] = len(het_padj)
+
+    logging.info(f"args.filter_mapp_score = {args.filter_mapp_score}")
+    with metrics.stage("clean_up", len(ratio)) as record:
+        keep = filter_sites(sites["mappability"], sites["totalCount"], aei_padj, het_padj, args.filter_mapp_score,
+                            args.filter_total_read, perror)
+        record["rows_out"] = int(np.sum(keep))
+    del het_padj
+    vaf_plot(pd.DataFrame({"ase_ratio": ratio[keep]}), args.plot_file, args.plot_backend)
+
+    # Stream the kept sites of a second read of the table to the output
+    offset = 0
+    header = True
+    parquet = ParquetWriter(args.output_parquet, index=True) if args.output_parquet is not None else None
+    with metrics.stage("write_output", len(ratio)) as record, \
+            (open(args.output_file, "w") if args.output_file is not None else contextlib.nullcontext()) as output:
+        for chunk in read_ase_chunks(args.ase, args.chunk_size, regions):
+            block = slice(offset, offset + len(chunk))
+            offset += len(chunk)
+            chunk["ref_bias"] = bias[block]
+            chunk["AEI_pval"] = aei_pval[block]
+            chunk["AEI_padj"] = aei_padj[block]
+            # het_padj is only kept in the compact arrays
+            chunk = chunk[keep[block]].drop(columns=DROPPED_READ_COLUMNS)
+            if output is not None:
+                chunk.to_csv(output, sep="\t", index=True, header=header)
+            if parquet is not None:
+                parquet.write(chunk)
+            header = False
+        if parquet is not None:
+            parquet.close()
+        record["rows_out"] = int(np.sum(keep))
+
+
+def clean_cohort(args, ase_files):
+    """
+    Clean many tables together over their count matrix, with the tests of a block of samples run at once.
+
+    The entries of every sample are processed in the order of its table and its statistics are computed the same way
+    as in clean_sample, so its outputs are the same as those of cleaning its table on its own.
+    """
+    names = output_names(ase_files)
+    os.makedirs(args.output_dir, exist_ok=True)
+    with metrics.stage("count_matrix") as record:
+        matrix = CountMatrix.open(ase_files, args.cohort_matrix)
+        record["rows_out"] = len(matrix.positions)
+
+    site_contigs = matrix.site_contigs()
+    regions = load_regions(args.regions)
+    site_in_regions = regions.contains(site_contigs, matrix.positions) if regions is not None else None
+    with metrics.stage("add_mapp", len(site_contigs)):
+        if args.mapp is not None:
+            mapp = pd.to_numeric(pd.read_csv(args.mapp, sep="\t", index_col=(0, 1), dtype=MAPPABILITY_DTYPES)['mappability'], errors='coerce')
+            site_mapp = mapp.reindex(pd.MultiIndex.from_arrays([site_contigs, np.asarray(matrix.positions)])).to_numpy()
+        elif args.mapp_bedgraph is not None:
+            site_mapp = MappabilityIndex.open(args.mapp_bedgraph, args.mapp_cache).lookup(site_contigs, matrix.positions)
+        else:
+            site_mapp = None
+
+    # the allele pair of every label
+    labels = pd.DataFrame(matrix.labels, columns=["variantID", "refAllele", "altAllele"])
+    label_pair, pairs = pd.MultiIndex.from_frame(labels[["refAllele", "altAllele"]]).factorize()
+    if args.ref_ratio is not None or args.ref_bias_summary is not None:
+        ref_bias_table = insert_ref_bias(args.ref_ratio) if args.ref_ratio is not None else load_ref_bias_summary(args.ref_bias_summary)
+        pair_bias = ref_bias_table.set_index(["refAllele", "altAllele"])["ref_bias"].reindex(pairs).to_numpy()
+    else:
+        pair_bias = None
+
+    logging.info(f"Processing {len(names)} ASE tables over a count matrix of {len(matrix.positions)} sites.")
+    for block in matrix.sample_blocks():
+        entries = cohort_entries(matrix, block, [ase_files[sample] for sample in block], site_in_regions)
+        entries["pair"] = label_pair[entries["label"]]
+        perror = cohort_tests(args, entries, len(pairs), pair_bias)
+        for i, sample in enumerate(block):
+            logging.info(f"Cleaning {ase_files[sample]}.")
+            sample_entries = {column: values[entries["offsets"][i]:entries["offsets"][i + 1]]
+                              for column, values in entries.items() if column != "offsets"}
+            write_cohort_sample(args, sample_entries, perror[i], site_contigs, matrix.positions, site_mapp, labels,
+                                os.path.join(args.output_dir, names[sample]))
+
+
+@metrics.timed("read_ase")
+def cohort_entries(matrix, block, ase_files, site_in_regions):
+    """The entries of the samples of a block in the order of their tables, sample after sample, as in read_ase."""
+    sites, columns, offsets = [], [], [0]
+    for i, (sample, ase_file) in enumerate(zip(block, ase_files)):
+        rows = np.asarray(matrix.sample_rows(sample), dtype=np.int64)
+        metrics.count("sites_read", len(rows))
+        if len(rows) <= 0:
+            raise Exception(f"The ASE table {ase_file} is empty.")
+        if site_in_regions is not None:
+            rows = rows[site_in_regions[rows]]
+            metrics.count("sites_in_regions", len(rows))
+            if len(rows) <= 0:
+                raise Exception(f"The ASE table {ase_file} has no sites in the regions.")
+        rows = rows[matrix["totalCount"][rows, sample] > 0]
+        sites.append(rows)
+        columns.append(np.full(len(rows), sample, dtype=np.int64))
+        offsets.append(offsets[-1] + len(rows))
+
+    entries = {"site": np.concatenate(sites), "sample": np.concatenate(columns) - block[0],
+               "offsets": np.array(offsets, dtype=np.int64)}
+    for name in ["refCount", "altCount", "totalCount", "otherBases", "rawDepth", "label"]:
+        entries[name] = np.asarray(matrix[name][entries["site"], entries["sample"] + block[0]])
+    entries["ase_ratio"] = entries["refCount"] / entries["totalCount"]
+    return entries
+
+
+def cohort_tests(args, entries, n_pairs, pair_bias):
+    """The reference bias, allelic imbalance and heterozygosity tests of all samples of a block at once."""
+    n_samples = len(entries["offsets"]) - 1
+    sample, ratio = entries["sample"], entries["ase_ratio"]
+    ref_count, alt_count, total_count = entries["refCount"], entries["altCount"], entries["totalCount"]
+
+    with metrics.stage("calc_ref_bias", len(ratio)) as record:
+        if pair_bias is None:
+            logging.info("Computing reference bias")
+            cutoff = args.filter_total_read // 2
+            source = (alt_count >= cutoff) & (ref_count >= cutoff)
+            # the ratios of each sample and pair are averaged in the order of the table, like calc_ref_bias does
+            means = pd.Series(ratio[source]).groupby([sample[source], entries["pair"][source]]).mean()
+            sample_bias = np.full((n_samples, n_pairs), np.nan)
+            sample_bias[means.index.get_level_values(0), means.index.get_level_values(1)] = means.to_numpy()
+            for sample_mean in means.groupby(level=0).mean():
+                logging.info("Estimated mean reference bias: %.4f" % sample_mean)
+        else:
+            sample_bias = np.tile(pair_bias, (n_samples, 1))
+        entries["ref_bias"] = np.nan_to_num(sample_bias[sample, entries["pair"]], nan=0.5)
+        record["rows_out"] = len(ratio)
+
+    # the samples of the block are the columns of the p-values, each padded to the longest one
+    counts = np.diff(entries["offsets"])
+    row = np.arange(len(sample)) - np.repeat(entries["offsets"][:-1], counts)
+    padded = np.full((counts.max(initial=0), n_samples), np.nan)
+
+    def adjusted(pvals):
+        padded[row, sample] = pvals
+        return bh_adjust_columns(padded)[row, sample]
+
+    with metrics.stage("allelic_imbalance", len(ratio)) as record:
+        logging.info("Computing allelic expression imballance")
+        entries["AEI_pval"] = binom_test_batch(ref_count, total_count, entries["ref_bias"])
+        entries["AEI_padj"] = adjusted(entries["AEI_pval"])
+        record["rows_out"] = len(ratio)
+    with metrics.stage("het_test", len(ratio)) as record:
+        if args.het_perror:
+            perror = np.full(n_samples, args.het_perror)
+        else:
+            starts = entries["offsets"][:-1]
+            perror = np.add.reduceat(entries["otherBases"].astype(np.int64), starts) / np.add.reduceat(entries["rawDepth"].astype(np.int64), starts)
+        entries["het_padj"] = adjusted(binom_test_batch(np.minimum(alt_count, ref_count), total_count, perror[sample], alternative="greater"))
+        record["rows_out"] = len(ratio)
+    return perror
+
+
+def write_cohort_sample(args, entries, perror, site_contigs, site_positions, site_mapp, labels, output):
+    """Filter the tested entries of a sample and write its outputs like clean_sample."""
+    if args.write_ref_bias:
+        label = labels.iloc[entries["label"]]
+        write_ref_bias_summary(label["refAllele"].to_numpy(), label["altAllele"].to_numpy(), entries["refCount"],
+                               entries["altCount"], entries["ase_ratio"], args.filter_total_read // 2,
+                               f"{output}.refbias.tsv")
+
+    logging.info(f"args.filter_mapp_score = {args.filter_mapp_score}")
+    with metrics.stage("clean_up", len(entries["site"])) as record:
+        keep = filter_sites(site_mapp[entries["site"]] if site_mapp is not None else None, entries["totalCount"],
+                            entries["AEI_padj"], entries["het_padj"], args.filter_mapp_score, args.filter_total_read,
+                            perror)
+        record["rows_out"] = int(np.sum(keep))
+
+    with metrics.stage("write_output", int(np.sum(keep))) as record:
+        sites = entries["site"][keep]
+        label = labels.iloc[entries["label"][keep]].reset_index(drop=True)
+        ase_clean = pd.DataFrame({"contig": site_contigs[sites], "position": np.asarray(site_positions)[sites], **label})
+        for column in ["refCount", "altCount", "totalCount", "ase_ratio", "ref_bias", "AEI_pval", "AEI_padj"]:
+            ase_clean[column] = entries[column][keep]
+        ase_clean = ase_clean.astype(dtypes(CLEAN_DTYPES, ase_clean.columns)).set_index(["contig", "position"])
+        if args.parquet:
+            write_parquet(ase_clean, f"{output}.parquet", index=True)
+        else:
+            ase_clean.to_csv(f"{output}.clean", sep="\t", index=True, header=True)
+        record["rows_out"] = len(ase_clean)
+    vaf_plot(ase_clean, f"{output}.{plot_suffix(args.plot_backend)}", args.plot_backend)
+
+
+def read_ase_chunks(ase_file, chunk_size, regions=None):
+    n_rows, n_in_regions = 0, 0
+    for chunk in pd.read_csv(ase_file, sep="\t", index_col=(0, 1), dtype=READ_DTYPES, chunksize=chunk_size):
+        n_rows += len(chunk)
+        if regions is not None:
+            chunk = in_regions(chunk, regions)
+            n_in_regions += len(chunk)
+        # the reference allele specific expression ratio
+        chunk = chunk[chunk["totalCount"] > 0].copy()
+        chunk['ase_ratio'] = chunk['refCount']/chunk['totalCount']
+        yield chunk
+
+    metrics.count("sites_read", n_rows)
+    if regions is not None:
+        metrics.count("sites_in_regions", n_in_regions)
+    if n_rows <= 0:
+        raise Exception("The ASE table is empty.")
+    if regions is not None and n_in_regions <= 0:
+        raise Exception("The ASE table has no sites in the regions.")
+
+
+def filter_sites(mappability, total, aei_padj, het_padj, filter_mapp_score, filter_total, perror):
     ai_padj = 0.05
     het_test_fdr = 0.05
-    has_mappability = 'mappability' in ase
+    has_mappability = mappability is not None
 
-    is_mapp = ase['mappability'] >= filter_mapp_score if has_mappability else True
-    is_enough_reads = ase["totalCount"] >= filter_total
-    is_allelic_imbalance = ase["AEI_padj"] < ai_padj
-    is_statistically_biallelic = ase['het_padj'] < het_test_fdr
+    is_mapp = mappability >= filter_mapp_score if has_mappability else True
+    is_enough_reads = total >= filter_total
+    is_allelic_imbalance = aei_padj < ai_padj
+    is_statistically_biallelic = het_padj < het_test_fdr
 
-    nsites_original = ase.shape[0]
+    nsites_original = len(total)
 
     if has_mappability:
         logging.info("%d / %d (%.2f%%) of sites removed due to mappability (mappability < %.2f)."
@@ -187,15 +688,20 @@ def clean_up(ase, filter_mapp_score, filter_total, perror):
     logging.info("%d / %d (%.2f%%) of do not have allelic  imbalance (ai_padj > %.2f)."
                  % (np.sum(~is_allelic_imbalance), nsites_original, 100 * np.sum(~is_allelic_imbalance) / nsites_original, ai_padj))
 
-    ase = ase[is_mapp & is_statistically_biallelic & is_enough_reads]
-    nsites_now = ase.shape[0]
+    keep = is_mapp & is_statistically_biallelic & is_enough_reads
+    nsites_now = np.sum(keep)
+
+    if has_mappability:
+        metrics.count("removed_mappability", int(np.sum(~is_mapp)))
+    metrics.count("removed_low_depth", int(np.sum(~is_enough_reads)))
+    metrics.count("removed_homozygous", int(np.sum(~is_statistically_biallelic)))
+    metrics.count("no_allelic_imbalance", int(np.sum(~is_allelic_imbalance)))
+    metrics.count("removed_total", int(nsites_original - nsites_now))
 
     logging.info("%d / %d (%.2f%%) of sites removed in total." % (nsites_original -
                  nsites_now, nsites_original, (1-nsites_now/nsites_original) * 100))
 
-    if has_mappability:
-        ase = ase.drop(columns=["mappability"])
-    return ase.drop(columns=["lowMAPQDepth", "lowBaseQDepth", "rawDepth", "otherBases", "improperPairs", "het_padj"])
+    return keep
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+import os
+import sys
+import gzip
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+import array_file
+
+
+# Magic of the array file of the index, part of the cache key so that indices of an older layout are not opened
+INDEX_MAGIC = b"ASEMIDX2"
+ARRAYS = ["start", "end", "maxend", "value"]
+READ_CHUNK_SIZE = 5000000
+
+
+class MappabilityIndex:
+    """
+    Intervals of a mappability bedgraph, kept as per-contig arrays sorted by start.
+
+    Next to the 0-based half-open interval bounds, each contig keeps the running maximum of the ends so that the
+    intervals overlapping a site form a contiguous range of candidates that can be found by binary search.
+    """
+
+    def __init__(self, contigs, start, end, value, maxend=None):
+        # contig -> (first interval, last interval + 1)
+        self.contigs = contigs
+        self.start = start
+        self.end = end
+        self.value = value
+        self.maxend = _running_max(end, contigs) if maxend is None else maxend
+
+    @classmethod
+    def from_bedgraph(cls, bedgraph_file):
+        logging.info(f"Indexing mappability bedgraph {bedgraph_file}.")
+        chunks = {}
+        reader = pd.read_csv(bedgraph_file, sep="\t", header=None, usecols=[0, 1, 2, 3],
+                             names=["contig", "start", "end", "value"],
+                             dtype={"contig": str, "start": np.int32, "end": np.int32, "value": np.float32},
+                             skiprows=_header_lines(bedgraph_file), chunksize=READ_CHUNK_SIZE,
+                             compression="gzip" if _is_gzip(bedgraph_file) else None)
+        for chunk in reader:
+            for contig, intervals in chunk.groupby("contig", sort=False):
+                chunks.setdefault(contig, []).append(intervals)
+
+        contigs, starts, ends, values = {}, [], [], []
+        offset = 0
+        for contig in sorted(chunks):
+            intervals = pd.concat(chunks.pop(contig)).sort_values(["start", "end"], kind="stable")
+            starts.append(intervals["start"].to_numpy())
+            ends.append(intervals["end"].to_numpy())
+            values.append(intervals["value"].to_numpy())
+            contigs[contig] = (offset, offset + len(intervals))
+            offset += len(intervals)
+
+        def joined(arrays, dtype):
+            return np.concatenate(arrays) if arrays else np.empty(0, dtype=dtype)
+
+        return cls(contigs, joined(starts, np.int32), joined(ends, np.int32), joined(values, np.float32))
+
+    @classmethod
+    def open(cls, bedgraph_file, cache_dir=None):
+        """
+        Open the cached index of a bedgraph, building it on first use.
+
+        The cache entry is keyed by the size and modification time of the bedgraph, so an index built from a different
+        version of the file is never used. If the cache directory is not writable, the index is only kept in memory.
+        """
+        cache_dir = cache_dir or os.path.dirname(os.path.abspath(bedgraph_file))
+        index_file = os.path.join(cache_dir, f"{os.path.basename(bedgraph_file)}.{_cache_key(bedgraph_file)}.idx")
+        if os.path.exists(index_file):
+            logging.info(f"Opening mappability index {index_file}.")
+            return cls.load(index_file)
+
+        index = cls.from_bedgraph(bedgraph_file)
+        try:
+            index.save(index_file)
+            logging.info(f"Mappability index saved to {index_file}.")
+        except OSError as e:
+            logging.warning(f"Mappability index could not be saved to {cache_dir}: {e}")
+        return index
+
+    @classmethod
+    def load(cls, path):
+        """Open a binary index written by save, the interval arrays are memory-mapped rather than read."""
+        header, arrays = array_file.load(path, INDEX_MAGIC, "mappability index")
+        contigs = {contig: tuple(bounds) for contig, bounds in header["contigs"].items()}
+        return cls(contigs, **arrays)
+
+    def save(self, path):
+        """
+        Write the index as an array file of the interval arrays and a JSON header of the contigs.
+
+        The file is written under a temporary name and moved in place, so concurrent tasks never see a partial index.
+        """
+        array_file.save(path, INDEX_MAGIC, {"contigs": self.contigs}, {name: getattr(self, name) for name in ARRAYS})
+
+    def lookup(self, contigs, positions):
+        """Minimum mappability over the intervals overlapping each 1-based site, NaN where there is none."""
+        positions = np.asarray(positions, dtype=np.int64)
+        result = np.full(len(positions), np.inf)
+        contig_names, contig_idx = np.unique(np.asarray(contigs, dtype=object), return_inverse=True)
+        contig_idx = contig_idx.reshape(-1)
+
+        for i, contig in enumerate(contig_names):
+            bounds = self.contigs.get(contig)
+            if bounds is None:
+                continue
+            lo, hi = bounds
+            selected = np.nonzero(contig_idx == i)[0]
+            # the site covers the 0-based interval [position - 1, position)
+            site = positions[selected] - 1
+            first = np.searchsorted(self.maxend[lo:hi], site, side="right")
+            last = np.maximum(np.searchsorted(self.start[lo:hi], site, side="right"), first)
+            counts = last - first
+            sites = np.repeat(np.arange(len(site)), counts)
+            offsets = np.cumsum(counts) - counts
+            candidates = first[sites] + np.arange(counts.sum()) - offsets[sites]
+            hit = np.asarray(self.end[lo:hi])[candidates] > site[sites]
+            np.minimum.at(result, selected[sites[hit]], np.asarray(self.value[lo:hi])[candidates[hit]])
+
+        result[np.isinf(result)] = np.nan
+        return result
+
+
+def _header_lines(bedgraph_file):
+    """Number of leading track, browser and comment lines of a bedgraph."""
+    opener = gzip.open if _is_gzip(bedgraph_file) else open
+    count = 0
+    with opener(bedgraph_file, "rt") as bedgraph:
+        for line in bedgraph:
+            if not line.startswith(("track", "browser", "#")):
+                break
+            count += 1
+    return count
+
+
+def _is_gzip(path):
+    with open(path, "rb") as raw:
+        return raw.read(2) == b"\x1f\x8b"
+
+
+def _cache_key(bedgraph_file):
+    stat = os.stat(bedgraph_file)
+    return hashlib.sha1(INDEX_MAGIC + f":{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:16]
+
+
+def _running_max(ends, contigs):
+    """Running maximum of the interval ends, restarted at the beginning of every contig."""
+    maxend = np.empty(len(ends), dtype=np.int32)
+    for lo, hi in contigs.values():
+        maxend[lo:hi] = np.maximum.accumulate(ends[lo:hi]) if hi > lo else ends[lo:hi]
+    return maxend
+
+
+if __name__ == "__main__":
+    # Build the cached index of a bedgraph ahead of time: mappability.py <bedgraph> [cache dir]
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s')
+    MappabilityIndex.open(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
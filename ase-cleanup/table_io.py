@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+import pandas as pd
+
+
+# Parquet files start and end with this magic
+PARQUET_MAGIC = b"PAR1"
+
+
+def is_parquet(path):
+    with open(path, "rb") as table_file:
+        return table_file.read(len(PARQUET_MAGIC)) == PARQUET_MAGIC
+
+
+def read_table(path, **csv_args):
+    """Read a tab-separated or a Parquet table, the format is detected from the content of the file."""
+    if is_parquet(path):
+        _require_pyarrow()
+        import pyarrow.parquet as pq
+        # usecols and dtype apply to the Parquet columns like to the text ones
+        usecols = csv_args.get("usecols")
+        columns = None if usecols is None else [column for column in pq.read_schema(path).names if column in usecols]
+        table = pd.read_parquet(path, columns=columns)
+        dtype = csv_args.get("dtype") or {}
+        return table.astype({column: dtype[column] for column in table.columns if column in dtype})
+    return pd.read_csv(path, sep="\t", **csv_args)
+
+
+def write_parquet(table, path, index=False):
+    """Write a table as Parquet with its dtypes, the index levels become columns like in the tab-separated output."""
+    _require_pyarrow()
+    if index:
+        table = table.reset_index()
+    table.to_parquet(path, index=False)
+
+
+class ParquetWriter:
+    """Write a table chunk by chunk to a single Parquet file, with the schema of the first chunk."""
+
+    def __init__(self, path, index=False):
+        _require_pyarrow()
+        self.path = path
+        self.index = index
+        self.writer = None
+
+    def write(self, chunk):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(chunk.reset_index() if self.index else chunk, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        elif not table.schema.equals(self.writer.schema, check_metadata=False):
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise Exception("Parquet tables require the pyarrow package.")
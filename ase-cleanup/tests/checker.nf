@@ -34,7 +34,7 @@
 /* this block is auto-generated based on info from pkg.json where   */
 /* changes can be made if needed, do NOT modify this block manually */
 nextflow.enable.dsl = 2
-version = '0.1.0'  // package version
+version = '0.2.0'  // package version
 
 container = [
     'ghcr.io': 'ghcr.io/icgc-argo-workflows/allele-specific-expression.ase-cleanup'
@@ -50,9 +50,11 @@ params.container = ""
 // tool specific parmas go here, add / change as needed
 params.input_file = ""
 params.mapp_file = "/home/ubuntu/k50.umap.bedgraph.gz"
-params.genome_file = "/home/ubuntu/GRCh38_Verily_v1.genome.fa.gz.genome"
+params.mapp_cache_dir = ""
 params.min_mappability = 0.05
 params.min_SNP_depth = 16
+params.regions = ""
+params.ref_bias_summary = ""
 
 include { aseCleanup } from '../main'
 
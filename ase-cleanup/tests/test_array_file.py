@@ -0,0 +1,72 @@
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+# Shared module, only edited in ase-cleanup and copied to the other packages by scripts/sync_shared_modules.py
+
+import os
+import numpy as np
+import pytest
+import array_file
+
+
+def test_save_load(tmp_path):
+    path = str(tmp_path / "test.arrays")
+    arrays = {"positions": np.arange(5, dtype=np.int64), "empty": np.empty(0, dtype=np.float32),
+              "matrix": np.arange(12, dtype=np.int32).reshape(3, 4)}
+    array_file.save(path, b"TESTARR1", {"names": ["a", "b"]}, arrays)
+
+    header, loaded = array_file.load(path, b"TESTARR1", "test")
+    assert header == {"names": ["a", "b"]}
+    assert set(loaded) == set(arrays)
+    for name, array in arrays.items():
+        assert loaded[name].dtype == array.dtype and np.array_equal(loaded[name], array)
+    assert isinstance(loaded["positions"], np.memmap)
+    assert loaded["positions"].offset % array_file.ARRAY_ALIGNMENT == 0
+    assert loaded["matrix"].offset % array_file.ARRAY_ALIGNMENT == 0
+
+
+def test_create_in_place(tmp_path):
+    path = str(tmp_path / "test.arrays")
+    with array_file.create(path, b"TESTARR1", {"counts": ((4, 2), np.int32)}) as (arrays, header):
+        # the file only appears once the header is written
+        assert not os.path.exists(path)
+        arrays["counts"][:, 1] = [1, 2, 3, 4]
+        header["samples"] = ["first", "second"]
+
+    header, loaded = array_file.load(path, b"TESTARR1", "test")
+    assert header == {"samples": ["first", "second"]}
+    assert np.array_equal(loaded["counts"], [[0, 1], [0, 2], [0, 3], [0, 4]])
+    assert os.listdir(tmp_path) == ["test.arrays"]
+
+
+def test_failed_create(tmp_path):
+    with pytest.raises(ValueError):
+        with array_file.create(str(tmp_path / "test.arrays"), b"TESTARR1", {"counts": ((4,), np.int32)}):
+            raise ValueError("failed")
+    assert os.listdir(tmp_path) == []
+
+
+def test_wrong_magic(tmp_path):
+    path = str(tmp_path / "test.arrays")
+    array_file.save(path, b"TESTARR1", {}, {"positions": np.arange(3)})
+    with pytest.raises(Exception, match="not a test file"):
+        array_file.load(path, b"OTHERAR1", "test")
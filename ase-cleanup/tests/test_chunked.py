@@ -0,0 +1,124 @@
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Columns of the read counts in the ASEReadCounter table
+REF_COUNT, ALT_COUNT, TOTAL_COUNT = 5, 6, 7
+
+
+def zero_count_table(source, path, rows):
+    """Copy an ASE table with the reads of the given data rows set to zero."""
+    with open(source) as table:
+        lines = table.readlines()
+    for row in rows:
+        fields = lines[row + 1].split("\t")
+        fields[REF_COUNT] = fields[ALT_COUNT] = fields[TOTAL_COUNT] = "0"
+        lines[row + 1] = "\t".join(fields)
+    with open(path, "w") as table:
+        table.writelines(lines)
+    return path
+
+
+def assert_same_files(first, second):
+    with open(first, "rb") as a, open(second, "rb") as b:
+        assert a.read() == b.read()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 7, 1000])
+def test_chunk_of_zero_count_rows(run_cleanup, input_file, tmp_path, chunk_size):
+    # the second chunk of 4 sites has no reads at all
+    table = zero_count_table(input_file("sim_sample1.read"), tmp_path / "zero.read", range(4, 8))
+    run_cleanup("--ase", table, "--output", "whole.clean", "--plot", "whole.svg", "--plot_backend", "numpy")
+    run_cleanup("--ase", table, "--output", "chunked.clean", "--plot", "chunked.svg", "--plot_backend", "numpy",
+                "--chunk_size", chunk_size)
+
+    assert_same_files(tmp_path / "whole.clean", tmp_path / "chunked.clean")
+    assert_same_files(tmp_path / "whole.svg", tmp_path / "chunked.svg")
+
+
+def test_chunked_parquet(run_cleanup, input_file, tmp_path):
+    pytest.importorskip("pyarrow")
+    table = zero_count_table(input_file("sim_sample1.read"), tmp_path / "zero.read", range(0, 4))
+    run_cleanup("--ase", table, "--output", "whole.clean", "--output_parquet", "whole.parquet",
+                "--plot", "whole.svg", "--plot_backend", "numpy")
+    run_cleanup("--ase", table, "--output", "chunked.clean", "--output_parquet", "chunked.parquet",
+                "--plot", "chunked.svg", "--plot_backend", "numpy", "--chunk_size", 4)
+
+    whole = pd.read_parquet(tmp_path / "whole.parquet")
+    chunked = pd.read_parquet(tmp_path / "chunked.parquet")
+    assert list(whole.columns) == list(chunked.columns)
+    assert whole.astype(str).equals(chunked.astype(str))
+
+
+
+@pytest.mark.parametrize("chunk_size", [None, 4])
+def test_parquet_only(run_cleanup, input_file, tmp_path, chunk_size):
+    pytest.importorskip("pyarrow")
+    chunk_args = ["--chunk_size", chunk_size] if chunk_size else []
+    run_cleanup("--ase", input_file("sim_sample1.read"), "--output", "both.clean", "--output_parquet", "both.parquet",
+                "--plot", "both.svg", "--plot_backend", "numpy", *chunk_args)
+    # the Parquet table alone skips the tab separated one
+    run_cleanup("--ase", input_file("sim_sample1.read"), "--output_parquet", "only.parquet",
+                "--plot", "only.svg", "--plot_backend", "numpy", *chunk_args)
+
+    assert sorted(path.name for path in tmp_path.glob("*.clean")) == ["both.clean"]
+    assert_same_files(tmp_path / "both.parquet", tmp_path / "only.parquet")
+
+
+def test_chunked_columns(run_cleanup, input_file, tmp_path):
+    import main
+    run_cleanup("--ase", input_file("sim_sample1.read"), "--output", "chunked.clean", "--plot", "chunked.svg",
+                "--plot_backend", "numpy", "--chunk_size", 10)
+    columns = pd.read_csv(tmp_path / "chunked.clean", sep="\t", nrows=0).columns
+    assert not set(main.DROPPED_COLUMNS) & set(columns)
+    assert list(columns[-4:]) == ["ase_ratio", "ref_bias", "AEI_pval", "AEI_padj"]
+    assert np.all(pd.read_csv(tmp_path / "chunked.clean", sep="\t")["totalCount"] > 0)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 1000])
+def test_chunked_regions(run_cleanup, input_file, tmp_path, chunk_size):
+    # most chunks have no sites in the regions
+    regions = tmp_path / "regions.bed"
+    regions.write_text("chr1\t100000\t101000\nchr6\t100000\t110000\nchr19\t0\t1000000\n")
+    table = zero_count_table(input_file("sim_sample1.read"), tmp_path / "zero.read", range(0, 2))
+    run_cleanup("--ase", table, "--regions", regions, "--output", "whole.clean", "--plot", "whole.svg",
+                "--plot_backend", "numpy")
+    run_cleanup("--ase", table, "--regions", regions, "--output", "chunked.clean", "--plot", "chunked.svg",
+                "--plot_backend", "numpy", "--chunk_size", chunk_size)
+
+    assert_same_files(tmp_path / "whole.clean", tmp_path / "chunked.clean")
+    assert_same_files(tmp_path / "whole.svg", tmp_path / "chunked.svg")
+    contigs = set(pd.read_csv(tmp_path / "chunked.clean", sep="\t")["contig"])
+    assert contigs and contigs <= {"chr1", "chr6", "chr19"}
+
+
+@pytest.mark.parametrize("chunk_size", [None, 4])
+def test_no_sites_in_regions(run_cleanup, input_file, tmp_path, chunk_size):
+    regions = tmp_path / "regions.bed"
+    regions.write_text("chrUn\t0\t1000000\n")
+    args = ["--chunk_size", chunk_size] if chunk_size else []
+    with pytest.raises(Exception, match="no sites in the regions"):
+        run_cleanup("--ase", input_file("sim_sample1.read"), "--regions", regions, "--output", "out.clean",
+                    "--plot", "out.svg", "--plot_backend", "numpy", *args)
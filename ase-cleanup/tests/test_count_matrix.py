@@ -0,0 +1,109 @@
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from count_matrix import CountMatrix
+
+# Columns of the read counts in the ASEReadCounter table
+REF_COUNT, ALT_COUNT = 5, 6
+
+
+def duplicate_rows_table(source, path, rows):
+    """Copy an ASE table with a second row of the sites of the given data rows, its read counts swapped, after the first."""
+    with open(source) as table:
+        lines = table.readlines()
+    for row in sorted(rows, reverse=True):
+        fields = lines[row + 1].split("\t")
+        fields[REF_COUNT], fields[ALT_COUNT] = fields[ALT_COUNT], fields[REF_COUNT]
+        lines.insert(row + 2, "\t".join(fields))
+    with open(path, "w") as table:
+        table.writelines(lines)
+    return str(path)
+
+
+def read_table(path):
+    return pd.read_csv(path, sep="\t", dtype={"contig": str})
+
+
+def test_matrix(input_file, tmp_path):
+    tables = [duplicate_rows_table(input_file("sim_sample1.read"), tmp_path / "sample1.read", [0, 3, 3]),
+              input_file("sim_sample2.read")]
+    matrix = CountMatrix.open(tables, str(tmp_path / "cohort.counts"))
+
+    assert matrix.samples == ["sample1", "sim_sample2"]
+    site_contigs = matrix.site_contigs()
+    for sample, path in enumerate(tables):
+        table = read_table(path)
+        rows = np.asarray(matrix.sample_rows(sample))
+        assert len(np.unique(rows)) == len(rows)
+        assert list(site_contigs[rows]) == list(table["contig"])
+        assert list(np.asarray(matrix.positions)[rows]) == list(table["position"])
+        for name in ["refCount", "altCount", "totalCount", "otherBases", "rawDepth"]:
+            assert list(matrix[name][rows, sample]) == list(table[name])
+        labels = [matrix.labels[label] for label in matrix["label"][rows, sample]]
+        assert labels == list(zip(table["variantID"], table["refAllele"], table["altAllele"]))
+
+    # the site of the fourth row of sample1 has three slots, the first one located
+    contig, position = read_table(tables[0]).loc[5, ["contig", "position"]]
+    slots = np.flatnonzero((site_contigs == contig) & (np.asarray(matrix.positions) == position))
+    assert len(slots) == 3
+    assert matrix.locate(contig, [position, 1])[0] == slots[0] and matrix.locate(contig, [1])[0] == -1
+
+
+def test_matrix_moved_tables(input_file, tmp_path, monkeypatch):
+    for directory in ["a", "b"]:
+        os.makedirs(tmp_path / directory)
+        for name in ["sim_sample1.read", "sim_sample2.read"]:
+            shutil.copy2(input_file(name), tmp_path / directory / name)
+    tables = lambda directory: [str(tmp_path / directory / name) for name in ["sim_sample1.read", "sim_sample2.read"]]
+    CountMatrix.open(tables("a"), str(tmp_path / "cohort.counts"))
+
+    built = []
+    build = CountMatrix.build
+    monkeypatch.setattr(CountMatrix, "build", classmethod(lambda cls, *args: built.append(args) or build(*args)))
+    # the same tables staged in another directory
+    CountMatrix.open(tables("b"), str(tmp_path / "cohort.counts"))
+    assert not built
+    # a table changed since the matrix was built
+    with open(tables("b")[1], "a") as table:
+        table.write("chr1\t1\t.\tA\tC\t1\t1\t2\t0\t0\t2\t0\t0\n")
+    matrix = CountMatrix.open(tables("b"), str(tmp_path / "cohort.counts"))
+    assert len(built) == 1
+    assert len(matrix.sample_rows(1)) == 165
+
+
+def test_cohort_duplicate_sites(run_cleanup, input_file, tmp_path):
+    tables = [duplicate_rows_table(input_file("sim_sample1.read"), tmp_path / "sample1.read", [0, 3, 3, 40]),
+              duplicate_rows_table(input_file("sim_sample2.read"), tmp_path / "sample2.read", [3, 100])]
+    run_cleanup("--ase", *tables, "--output_dir", "batch", "--plot_backend", "numpy", "--write_ref_bias")
+    run_cleanup("--ase", *tables, "--output_dir", "cohort", "--plot_backend", "numpy", "--write_ref_bias",
+                "--cohort_matrix", "cohort.counts")
+
+    for name in ["sample1", "sample2"]:
+        for suffix in [".clean", ".vaf.svg", ".refbias.tsv"]:
+            with open(tmp_path / "batch" / f"{name}{suffix}", "rb") as batch, \
+                    open(tmp_path / "cohort" / f"{name}{suffix}", "rb") as cohort:
+                assert batch.read() == cohort.read()
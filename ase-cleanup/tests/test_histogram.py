@@ -0,0 +1,47 @@
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+import numpy as np
+import pytest
+import xml.etree.ElementTree as ElementTree
+from histogram import write_histogram
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+
+def test_svg(tmp_path):
+    values = np.random.default_rng(1).uniform(0.1, 0.9, 500)
+    write_histogram(np.append(values, np.nan), str(tmp_path / "vaf.svg"), 32, np.arange(0, 1.125, 0.125),
+                    "B-Allele Frequency", "Number of Positions")
+    svg = ElementTree.parse(tmp_path / "vaf.svg").getroot()
+
+    counts, _ = np.histogram(values, bins=32)
+    # the background, a bar per non-empty bin and the axes frame
+    assert len(svg.findall(f"{SVG}rect")) == 1 + np.count_nonzero(counts) + 1
+    texts = [text.text for text in svg.findall(f"{SVG}text")]
+    assert {"0", "0.5", "1", "B-Allele Frequency", "Number of Positions"} <= set(texts)
+
+
+def test_numpy_backend_png(run_cleanup, input_file):
+    with pytest.raises(SystemExit):
+        run_cleanup("--ase", input_file("sim_sample1.read"), "--output", "out.clean", "--plot", "out.png",
+                    "--plot_backend", "numpy")
@@ -0,0 +1,113 @@
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+import os
+import gzip
+import numpy as np
+import pytest
+from mappability import MappabilityIndex
+
+# Unsorted and overlapping intervals, 0-based and half-open like the umap bedgraphs
+BEDGRAPH = "track type=bedGraph\nchr1\t100\t200\t0.5\nchr1\t0\t50\t1\nchr1\t150\t300\t0.25\nchr1\t300\t301\t0\n" \
+           "chr2\t10\t20\t0.75\n"
+SITES = [("chr1", position) for position in [1, 50, 51, 100, 101, 150, 151, 200, 201, 300, 301, 302]] + \
+        [("chr2", 10), ("chr2", 11), ("chr2", 20), ("chr2", 21), ("chr3", 15)]
+
+
+def expected_lookup():
+    intervals = [line.split("\t") for line in BEDGRAPH.splitlines()[1:]]
+    values = []
+    for contig, position in SITES:
+        hits = [float(value) for name, start, end, value in intervals
+                if name == contig and int(start) < position <= int(end)]
+        values.append(min(hits) if hits else np.nan)
+    return values
+
+
+@pytest.fixture(params=["plain", "gzip"])
+def bedgraph_file(request, tmp_path):
+    path = tmp_path / "map.bedgraph"
+    if request.param == "gzip":
+        with gzip.open(path, "wt") as bedgraph:
+            bedgraph.write(BEDGRAPH)
+    else:
+        path.write_text(BEDGRAPH)
+    return str(path)
+
+
+def lookup(index):
+    contigs, positions = zip(*SITES)
+    return index.lookup(contigs, positions)
+
+
+def test_lookup(bedgraph_file):
+    assert np.allclose(lookup(MappabilityIndex.from_bedgraph(bedgraph_file)), expected_lookup(), equal_nan=True)
+
+
+def test_cached_index(bedgraph_file, tmp_path):
+    os.makedirs(tmp_path / "cache")
+    index = MappabilityIndex.open(bedgraph_file, str(tmp_path / "cache"))
+    cached = os.listdir(tmp_path / "cache")
+    assert len(cached) == 1 and cached[0].startswith("map.bedgraph.") and cached[0].endswith(".idx")
+
+    loaded = MappabilityIndex.open(bedgraph_file, str(tmp_path / "cache"))
+    assert isinstance(loaded.start, np.memmap)
+    assert loaded.contigs == index.contigs
+    for name in ["start", "end", "maxend", "value"]:
+        assert np.array_equal(getattr(loaded, name), getattr(index, name))
+    assert np.allclose(lookup(loaded), expected_lookup(), equal_nan=True)
+
+    # another version of the bedgraph gets its own index
+    os.utime(bedgraph_file, ns=(0, 0))
+    MappabilityIndex.open(bedgraph_file, str(tmp_path / "cache"))
+    assert len(os.listdir(tmp_path / "cache")) == 2
+
+
+def test_not_an_index(tmp_path):
+    (tmp_path / "other.idx").write_bytes(b"ASEGIDX1" + bytes(64))
+    with pytest.raises(Exception, match="not a mappability index"):
+        MappabilityIndex.load(str(tmp_path / "other.idx"))
+
+
+def test_mappability_table(run_cleanup, input_file, tmp_path):
+    # bedtools map writes "." for the sites without a mappability score
+    with open(input_file("sim_sample1.read")) as table:
+        sites = [line.split("\t")[:2] for line in table.readlines()[1:]]
+    scores = ["." if i % 10 == 3 else "0.01" if i % 10 == 7 else "1" for i in range(len(sites))]
+    with open(tmp_path / "sites.mapp", "w") as mapp:
+        mapp.write("contig\tpos\tmappability\n")
+        mapp.writelines(f"{contig}\t{position}\t{score}\n" for (contig, position), score in zip(sites, scores))
+
+    common = ["--mappability", tmp_path / "sites.mapp", "--plot_backend", "numpy"]
+    run_cleanup("--ase", input_file("sim_sample1.read"), "--output", "whole.clean", "--plot", "whole.svg", *common)
+    run_cleanup("--ase", input_file("sim_sample1.read"), "--output", "chunked.clean", "--plot", "chunked.svg",
+                "--chunk_size", 7, *common)
+    run_cleanup("--ase", input_file("sim_sample1.read"), "--output_dir", "cohort", "--cohort_matrix", "cohort.counts",
+                *common)
+
+    with open(tmp_path / "whole.clean", "rb") as whole:
+        output = whole.read()
+    for path in ["chunked.clean", "cohort/sim_sample1.clean"]:
+        with open(tmp_path / path, "rb") as other:
+            assert other.read() == output
+    kept = {tuple(line.split("\t")[:2]) for line in output.decode().splitlines()[1:]}
+    assert kept and all(score == "1" for site, score in zip(map(tuple, sites), scores) if site in kept)
@@ -0,0 +1,84 @@
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+# Shared module, only edited in ase-cleanup and copied to the other packages by scripts/sync_shared_modules.py
+
+import gzip
+import pytest
+from regions import Regions
+
+BED = """track name=regions
+# comment
+chr2\t100\t200\textra\tcolumns
+chr1\t50\t60
+chr1\t10\t20
+
+chr1\t15\t30
+chr1\t30\t40
+chr1\t45\t46
+"""
+# 1-based sites and whether they lie in the regions of BED
+SITES = [
+    ("chr1", 10, False), ("chr1", 11, True), ("chr1", 20, True), ("chr1", 31, True), ("chr1", 40, True),
+    ("chr1", 41, False), ("chr1", 45, False), ("chr1", 46, True), ("chr1", 47, False), ("chr1", 51, True),
+    ("chr1", 60, True), ("chr1", 61, False), ("chr2", 100, False), ("chr2", 101, True), ("chr2", 200, True),
+    ("chr2", 201, False), ("chr3", 101, False), ("1", 11, False),
+]
+
+
+@pytest.fixture(params=["plain", "gzip"])
+def bed_file(request, tmp_path):
+    if request.param == "gzip":
+        path = tmp_path / "regions.bed.gz"
+        with gzip.open(path, "wt") as bed:
+            bed.write(BED)
+    else:
+        path = tmp_path / "regions.bed"
+        path.write_text(BED)
+    return str(path)
+
+
+def test_merged_intervals(bed_file):
+    regions = Regions.from_bed(bed_file)
+    # unsorted, overlapping and touching intervals are merged, the header, comment and blank lines are skipped
+    assert {contig: (list(starts), list(ends)) for contig, (starts, ends) in regions.intervals.items()} == {
+        "chr1": ([10, 45, 50], [40, 46, 60]),
+        "chr2": ([100], [200]),
+    }
+    assert len(regions) == 4
+
+
+def test_contains_site(bed_file):
+    regions = Regions.from_bed(bed_file)
+    assert [regions.contains_site(contig, position) for contig, position, _ in SITES] == [
+        inside for _, _, inside in SITES]
+
+
+def test_contains(bed_file):
+    np = pytest.importorskip("numpy")
+    regions = Regions.from_bed(bed_file)
+    contigs = np.array([contig for contig, _, _ in SITES], dtype=object)
+    positions = np.array([position for _, position, _ in SITES])
+    assert regions.contains(contigs, positions).tolist() == [inside for _, _, inside in SITES]
+    # the arrays of a contig are built once and reused
+    assert regions.contains(contigs[::-1], positions[::-1]).tolist() == [inside for _, _, inside in SITES[::-1]]
+    assert regions.contains(np.array([], dtype=object), np.array([], dtype=int)).tolist() == []
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import numpy as np
+
+
+# Sites kept by default, about 60 bytes each
+DEFAULT_MAX_SITES = 10000000
+# Seconds a task waits for another one holding the write lock
+LOCK_TIMEOUT = 600
+HASH_CHUNK_SIZE = 1 << 20
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotations (id INTEGER PRIMARY KEY, checksum TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS checksums (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, checksum TEXT);
+CREATE TABLE IF NOT EXISTS sites (
+    annotation INTEGER, contig TEXT, position INTEGER, genes TEXT, exons TEXT, last_used REAL,
+    PRIMARY KEY (annotation, contig, position)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sites_last_used ON sites (last_used);
+"""
+
+
+class AnnotationCache:
+    """
+    Persistent SQLite cache of the genes overlapping each site, shared by the runs annotating against the same GTF.
+
+    Sites are keyed by the checksum of the GTF, the contig and the position, and keep the ids of their genes and
+    whether the site is exonic in each, in the order of GeneIndex.annotate. Sites without genes are cached too.
+    Beyond max_sites, the least recently used sites are evicted when the cache is closed. The database is in WAL
+    mode, so concurrent tasks on a node read it while one of them writes.
+    """
+
+    def __init__(self, path, gtf, max_sites=DEFAULT_MAX_SITES):
+        self.max_sites = max_sites
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.db.execute("CREATE TEMP TABLE query (site INTEGER, contig TEXT, position INTEGER)")
+        checksum = self._checksum(gtf)
+        self.db.execute("INSERT OR IGNORE INTO annotations (checksum) VALUES (?)", (checksum,))
+        self.annotation, = self.db.execute("SELECT id FROM annotations WHERE checksum = ?", (checksum,)).fetchone()
+
+    def get(self, contigs, positions):
+        """
+        Cached annotation of the sites, as the site indices, gene ids and exon flags of GeneIndex.annotate, and a
+        mask of the sites found in the cache. The sites found are marked as used.
+        """
+        # the queried sites only go to the connection's temporary table, which takes no lock on the cache
+        self.db.execute("BEGIN")
+        self.db.execute("DELETE FROM query")
+        self.db.executemany("INSERT INTO query VALUES (?, ?, ?)",
+                            zip(range(len(positions)), map(str, contigs), map(int, positions)))
+        rows = self.db.execute(
+            "SELECT q.site, s.genes, s.exons FROM query q JOIN sites s "
+            "ON s.annotation = ? AND s.contig = q.contig AND s.position = q.position", (self.annotation,)).fetchall()
+        self.db.execute("COMMIT")
+        if rows:
+            self._write("UPDATE sites SET last_used = ? WHERE annotation = ? AND (contig, position) IN "
+                        "(SELECT contig, position FROM query)", (time.time(), self.annotation))
+
+        found = np.zeros(len(positions), dtype=bool)
+        sites, gene_ids, exonic = [], [], []
+        for site, genes, exons in rows:
+            found[site] = True
+            if genes:
+                genes = genes.split("\t")
+                sites += [site] * len(genes)
+                gene_ids += genes
+                exonic += [flag == "1" for flag in exons]
+        self.hits += int(found.sum())
+        self.misses += int(len(found) - found.sum())
+        return (np.asarray(sites, dtype=np.int64), np.asarray(gene_ids, dtype=object), np.asarray(exonic, dtype=bool),
+                found)
+
+    def put(self, contigs, positions, sites, gene_ids, exonic):
+        """Store the annotation of the sites, given as the output of GeneIndex.annotate for them."""
+        genes = [[] for _ in range(len(positions))]
+        exons = [[] for _ in range(len(positions))]
+        for site, gene_id, is_exon in zip(sites, gene_ids, exonic):
+            genes[site].append(gene_id)
+            exons[site].append("1" if is_exon else "0")
+        now = time.time()
+        self._write_many("INSERT OR REPLACE INTO sites VALUES (?, ?, ?, ?, ?, ?)",
+                         [(self.annotation, str(contig), int(position), "\t".join(site_genes), "".join(site_exons), now)
+                          for contig, position, site_genes, site_exons in zip(contigs, positions, genes, exons)])
+
+    def close(self):
+        """Evict the least recently used sites above the size cap and close the database."""
+        try:
+            n_sites, = self.db.execute("SELECT COUNT(*) FROM sites").fetchone()
+            if n_sites > self.max_sites:
+                logging.info("Evicting %s least recently used sites from the annotation cache.", n_sites - self.max_sites)
+                self._write("DELETE FROM sites WHERE (annotation, contig, position) IN (SELECT annotation, contig, "
+                            "position FROM sites ORDER BY last_used LIMIT ?)", (n_sites - self.max_sites,))
+        finally:
+            self.db.close()
+
+    def _checksum(self, gtf):
+        """SHA-1 of the GTF content, remembered for the path as long as its size and modification time match."""
+        stat = os.stat(gtf)
+        path = os.path.realpath(gtf)
+        row = self.db.execute("SELECT checksum FROM checksums WHERE path = ? AND size = ? AND mtime_ns = ?",
+                              (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row is not None:
+            return row[0]
+
+        logging.info("Computing the checksum of %s.", gtf)
+        sha1 = hashlib.sha1()
+        with open(gtf, "rb") as gtf_file:
+            for chunk in iter(lambda: gtf_file.read(HASH_CHUNK_SIZE), b""):
+                sha1.update(chunk)
+        checksum = sha1.hexdigest()
+        self._write("INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?)",
+                    (path, stat.st_size, stat.st_mtime_ns, checksum))
+        return checksum
+
+    def _write(self, sql, parameters):
+        self._write_many(sql, [parameters])
+
+    def _write_many(self, sql, rows):
+        # the write lock is taken at the start, so that waiting for another writer never fails the transaction
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.executemany(sql, rows)
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
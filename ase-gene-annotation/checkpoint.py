@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import os
+import time
+import pickle
+import struct
+import logging
+
+
+CHECKPOINT_MAGIC = b"ASEGCKP1"
+# Seconds between two writes of the checkpoint
+DEFAULT_INTERVAL = 60
+
+
+class Checkpoint:
+    """
+    Append-only checkpoint of a computation over consecutive blocks, for resuming it after the process is killed.
+
+    The file starts with the fingerprint of the inputs, followed by records of the blocks completed since the previous
+    record together with the state after them. Each record is written with its length and flushed to disk, a record
+    cut short by the end of the process is ignored when the checkpoint is read.
+    """
+
+    def __init__(self, path, fingerprint, interval=DEFAULT_INTERVAL):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.interval = interval
+        self.pending = []
+        self.state = None
+        self.last_write = time.monotonic()
+        self.file = None
+
+    def load(self):
+        """Blocks and state saved by an earlier run with the same fingerprint, ([], None) if there are none."""
+        blocks, state, valid_size = [], None, 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as checkpoint_file:
+                records = _read_records(checkpoint_file)
+                header = next(records, None)
+                if header is not None and header[0] == self.fingerprint:
+                    valid_size = header[1]
+                    for record, end in records:
+                        blocks += record["blocks"]
+                        state, valid_size = record["state"], end
+                elif header is not None:
+                    logging.warning("Checkpoint %s was written for different inputs, starting over.", self.path)
+
+        # continue the checkpoint after its last complete record, or start a new one
+        if valid_size > 0:
+            self.file = open(self.path, "r+b")
+            self.file.truncate(valid_size)
+            self.file.seek(valid_size)
+        else:
+            self.file = open(self.path, "wb")
+            self.file.write(CHECKPOINT_MAGIC)
+            self._write_record(self.fingerprint)
+        return blocks, state
+
+    def add(self, block, state):
+        """Add a completed block and the state after it, the checkpoint is written once the interval has passed."""
+        self.pending.append(block)
+        self.state = state
+        if time.monotonic() - self.last_write >= self.interval:
+            self.save()
+
+    def save(self):
+        if self.pending:
+            self._write_record({"blocks": self.pending, "state": self.state})
+            self.pending = []
+        self.last_write = time.monotonic()
+
+    def remove(self):
+        """Delete the checkpoint once the computation is complete."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write_record(self, record):
+        data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.write(struct.pack("<Q", len(data)) + data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+
+def _read_records(checkpoint_file):
+    """The complete records of a checkpoint file, each with the offset of its end."""
+    if checkpoint_file.read(len(CHECKPOINT_MAGIC)) != CHECKPOINT_MAGIC:
+        return
+    while True:
+        size = checkpoint_file.read(8)
+        if len(size) < 8:
+            return
+        length, = struct.unpack("<Q", size)
+        data = checkpoint_file.read(length)
+        if len(data) < length:
+            return
+        try:
+            record = pickle.loads(data)
+        except Exception:
+            return
+        yield record, checkpoint_file.tell()
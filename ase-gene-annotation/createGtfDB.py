@@ -27,6 +27,10 @@
 
 import sys
 import pyensembl
+from gene_index import GeneIndex, index_path
 
 data = pyensembl.Genome(reference_name=f"{sys.argv[1]}", annotation_name='genome_annotation', gtf_path_or_url=f'{sys.argv[2]}')
-data.index()
\ No newline at end of file
+data.index()
+
+# Compact memory-mapped gene/exon intervals used by gene_annotation.py instead of the database
+GeneIndex.from_genome(data).save(index_path(sys.argv[2]))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+import metrics
+from ase_stats import fisher_combine, bh_adjust_columns
+from table_io import read_table, write_parquet
+from schema import ANNOTATED_DTYPES, GENE_ASE_COLUMNS
+from gene_map import GeneMap
+
+
+def main():
+    setup_logging("gene_ase.log")
+
+    parser = argparse.ArgumentParser(description='Construct a table of the allelic imbalance of the genes from the allelic imbalance of their positions, without the phase of the positions.')
+    parser.add_argument("-I", "--input_file", required=True, help="Gene-annotated ASE read counter result file, tab-separated or Parquet.")
+    parser.add_argument("-O", "--output_file", required=True, help="Gene table output file.")
+    parser.add_argument("--output_parquet", help="Also write the gene table as Parquet.")
+    parser.add_argument("--gene_map", help="Site-to-gene mapping written by gene_annotation.py --gene_map, the input file is then the site table written with it.")
+    args = parser.parse_args()
+
+    metrics.reset("gene_ase")
+    try:
+        gene_ase_table(args)
+    finally:
+        metrics.write("gene_ase.metrics.json")
+
+
+def setup_logging(log_file):
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        datefmt='%a, %d %b %Y %H:%M:%S', 
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ], 
+        force=True)
+
+
+def gene_ase_table(args):
+    gene_map = None
+    with metrics.stage("read_input") as record:
+        if args.gene_map:
+            gene_map = GeneMap.load(args.gene_map)
+            ase = read_table(args.input_file, usecols=[column for column in GENE_ASE_COLUMNS if column != "gene_id"],
+                             dtype=ANNOTATED_DTYPES)
+            if len(ase) != gene_map.n_sites:
+                raise Exception(f"The mapping {args.gene_map} has {gene_map.n_sites} sites, the input {len(ase)}.")
+        else:
+            ase = read_table(args.input_file, usecols=GENE_ASE_COLUMNS, dtype=ANNOTATED_DTYPES)
+        record["rows_out"] = len(ase)
+
+    write_gene_ase(ase, args.output_file, args.output_parquet, gene_map)
+
+
+def write_gene_ase(ase, output_file, output_parquet=None, gene_map=None):
+    """
+    Write the gene-level allelic imbalance of the gene-annotated sites. With a site-to-gene mapping, the sites are the
+    rows of its site table, otherwise the rows of the annotated table, one per site and gene.
+    """
+    if gene_map is None:
+        gene_map = row_gene_map(ase)
+        sites = np.arange(len(ase))
+    else:
+        sites = ase.index.to_numpy()
+
+    with metrics.stage("gene_imbalance", len(ase)) as record:
+        logging.info("Computing the allelic imbalance of the genes.")
+        gene_table = gene_imbalance(ase, gene_map, sites)
+        record["rows_out"] = len(gene_table)
+    if len(gene_table) <= 0:
+        logging.warning("No gene-annotated positions, the gene table is empty.")
+
+    with metrics.stage("write_output", len(gene_table)) as record:
+        logging.info(f"Exporting data to file {output_file}.")
+        rounded = gene_table.round(4)
+        rounded.to_csv(output_file, sep="\t", index=False)
+        if output_parquet is not None:
+            write_parquet(rounded, output_parquet)
+        record["rows_out"] = len(gene_table)
+    logging.info("Done.")
+
+
+def row_gene_map(annotated):
+    """Mapping of the rows of a gene-annotated table to the gene of each row, the unmatched rows map to none."""
+    rows = np.nonzero(annotated["gene_id"].notna().to_numpy())[0]
+    exonic = annotated["feature"].to_numpy()[rows] == "exon" if "feature" in annotated else np.zeros(len(rows), bool)
+    return GeneMap.from_annotation(len(annotated), rows, annotated["gene_id"].to_numpy()[rows], exonic)
+
+
+def gene_imbalance(ase, gene_map, sites):
+    """
+    Combine the allelic imbalance of the sites of each gene, whose phase is unknown.
+
+    The reference and alternative counts are summed, the major allele ratio sums the counts of the more expressed
+    allele of every site, and the AEI p-values of the sites are combined with Fisher's method. All of them are sums
+    over the sites of each gene, computed as products of the transposed sites x genes matrix of the rows of the given
+    site indices and the site values.
+    """
+    genes = gene_map.matrix(sites).T.tocsr()
+    positions = genes @ np.ones(len(ase), dtype=np.int64)
+    found = np.nonzero(positions > 0)[0]
+
+    def gene_sums(values):
+        return (genes @ values)[found]
+
+    ref = ase["refCount"].to_numpy().astype(np.int64)
+    alt = ase["altCount"].to_numpy().astype(np.int64)
+    pvals = ase["AEI_pval"].to_numpy(dtype="float")
+    tested = ~np.isnan(pvals)
+    with np.errstate(divide="ignore"):
+        log_pvals = np.where(tested, np.log(np.where(tested, pvals, 1.0)), 0.0)
+
+    gene_table = pd.DataFrame({
+        "gene_id": gene_map.gene_ids[found],
+        "refCount": gene_sums(ref),
+        "altCount": gene_sums(alt),
+        "totalCount": gene_sums(ase["totalCount"].to_numpy().astype(np.int64)),
+        "positions": positions[found],
+    })
+    gene_table["ase_ratio"] = gene_table["refCount"] / gene_table["totalCount"]
+    gene_table["major_ratio"] = gene_sums(np.maximum(ref, alt)) / gene_table["totalCount"]
+    gene_table["AEI_pval"] = fisher_combine(gene_sums(log_pvals), gene_sums(tested.astype(np.int64)))
+    # the genes without tested sites are left out of the adjustment
+    gene_table["AEI_padj"] = bh_adjust_columns(gene_table["AEI_pval"].to_numpy()[:, None])[:, 0]
+    return gene_table
+
+
+if __name__ == '__main__':
+    main()
@@ -25,96 +25,277 @@
     Adam Streck
 """
 
-import vcf
+import os
+import re
+import gzip
 import argparse
+import pysam
 import pandas as pd
 import numpy as np
-import scipy as sp
 import logging
-import statsmodels.api as sm
+import metrics
+from ase_stats import binom_test_batch, bh_adjust
+from table_io import read_table, write_parquet
+from schema import ANNOTATED_DTYPES, HAP_COLUMNS
+from regions import Regions
+from gene_map import GeneMap
+
+
+# VCF columns
+CHROM, POS, FORMAT = 0, 1, 8
+# ASE sites closer than this are fetched from a tabix-indexed VCF as a single region
+REGION_GAP = 100000
+ALLELE_DELIMITER = re.compile(r"[|/]")
+# Phase of the diploid het genotypes, 1 if the reference allele is on haplotype 1 and -1 if the alternative one is
+PHASE = {"0|1": 1, "1|0": -1}
+
 
 def main():
+    setup_logging("hap_table.log")
+
+    parser = argparse.ArgumentParser(description='Construct a table counting expression of either parental haplotype across gene-mapped positions.')
+    parser.add_argument("-I", "--input_file", required=True, help="Gene-annotated ASE read counter result file, tab-separated or Parquet.")
+    parser.add_argument("-V", "--variants_file", required=True, help="Variants Calling File with genotype annotation (GT).")
+    parser.add_argument("-O", "--output_file", required=True, help="Gene table output file.")
+    parser.add_argument("--output_parquet", help="Also write the gene table as Parquet.")
+    parser.add_argument("--gene_map", help="Site-to-gene mapping written by gene_annotation.py --gene_map, the input file is then the site table written with it.")
+    parser.add_argument("--regions", help="BED file of the regions to process, the positions outside of them are dropped as the input is read.")
+    args = parser.parse_args()
+
+    metrics.reset("hap_table")
+    try:
+        hap_table(args)
+    finally:
+        metrics.write("hap_table.metrics.json")
+
+
+def setup_logging(log_file):
     logging.basicConfig(
         level=logging.DEBUG,
         format='%(asctime)s %(levelname)-8s %(message)s',
         datefmt='%a, %d %b %Y %H:%M:%S', 
         handlers=[
-            logging.FileHandler("hap_table.log"),
+            logging.FileHandler(log_file),
             logging.StreamHandler()
         ], 
         force=True)
 
-    parser = argparse.ArgumentParser(description='Construct a table counting expression of either parental haplotype across gene-mapped positions.')
-    parser.add_argument("-I", "--input_file", required=True, help="Gene-annotated ASE read counter result file.")
-    parser.add_argument("-V", "--variants_file", required=True, help="Variants Calling File with genotype annotation (GT).")
-    parser.add_argument("-O", "--output_file", required=True, help="Gene table output file.")
-    args = parser.parse_args()
 
-    ase = pd.read_csv(args.input_file, sep="\t")
-    vcf_reader = vcf.Reader(open(args.variants_file))
+def hap_table(args):
+    gene_map = None
+    with metrics.stage("read_input") as record:
+        if args.gene_map:
+            gene_map = GeneMap.load(args.gene_map)
+            ase = read_table(args.input_file, usecols=[column for column in HAP_COLUMNS if column != "gene_id"],
+                             dtype=ANNOTATED_DTYPES)
+            if len(ase) != gene_map.n_sites:
+                raise Exception(f"The mapping {args.gene_map} has {gene_map.n_sites} sites, the input {len(ase)}.")
+        else:
+            ase = read_table(args.input_file, usecols=HAP_COLUMNS, dtype=ANNOTATED_DTYPES)
+        if args.regions:
+            ase = in_regions(ase, args.regions)
+        record["rows_out"] = len(ase)
+
+    write_hap_table(ase, args.variants_file, args.output_file, args.output_parquet, gene_map)
+
+
+def in_regions(ase, bed_file):
+    regions = Regions.from_bed(bed_file)
+    logging.info(f"Processing the positions in {len(regions)} regions of {bed_file}.")
+    inside = regions.contains(ase["contig"].to_numpy(), ase["position"].to_numpy())
+    metrics.count("sites_in_regions", int(inside.sum()))
+    # the index keeps the row of each site in the site table of a site-to-gene mapping
+    return ase[inside]
 
-    ase_filered = filter_unmatched(ase)
+
+def write_hap_table(ase, variants_file, output_file, output_parquet=None, gene_map=None):
+    """
+    Write the haplotype table of the gene-annotated sites. With a site-to-gene mapping, the sites are the rows of its
+    site table, identified by their index, and are summed into their genes through the mapping.
+    """
+    if gene_map is None:
+        ase_filered = filter_unmatched(ase)
+    else:
+        ase_filered = filter_unmapped(ase.assign(site=ase.index.to_numpy()), gene_map)
     if len(ase_filered) <= 0:
         logging.warning("No ASE positions. Skipping hap_table process.")
         return
 
-    gts = get_genotypes(vcf_reader)
-    genotyped = pd.merge(ase_filered, gts, how='inner', left_on=["position", "contig"], right_on=["position", "contig"])
+    gts = get_genotypes(variants_file, ase_filered)
+    with metrics.stage("merge_genotypes", len(ase_filered)) as record:
+        genotyped = pd.merge(ase_filered, gts, how='inner', left_on=["position", "contig"], right_on=["position", "contig"])
+        record["rows_out"] = len(genotyped)
     gen_filtered = filter_genotypes(genotyped)
     if len(gen_filtered) <= 0:
         logging.warning("No genotype positions. Skipping hap_table process.")
         return
 
-    simplified = gen_filtered.copy().drop(columns=["position", "variantID", "refAllele", "altAllele", "ase_ratio", "ref_bias", "AEI_pval", "AEI_padj"])
+    # the site columns are only present if the whole annotated table was read
+    simplified = gen_filtered.copy().drop(columns=["position", "variantID", "refAllele", "altAllele", "ase_ratio", "ref_bias", "AEI_pval", "AEI_padj"], errors="ignore")
     counted = count_hap(simplified)
-    grouped = counted.groupby(["gene_id"], as_index=False)
-    gene_table = pd.merge(grouped.sum(), grouped.size()).rename(columns={"size": "positions"})
-    haplotype_imbalance(gene_table, counted)
+    gene_table = gene_sums(counted) if gene_map is None else mapped_gene_sums(counted, gene_map)
+    with metrics.stage("haplotype_imbalance", len(gene_table)) as record:
+        haplotype_imbalance(gene_table)
+        record["rows_out"] = len(gene_table)
 
-    logging.info(f"Exporting data to file {args.output_file}.")
-    gene_table.round(4).to_csv(args.output_file, sep="\t", index=False)
+    with metrics.stage("write_output", len(gene_table)) as record:
+        logging.info(f"Exporting data to file {output_file}.")
+        rounded = gene_table.round(4)
+        rounded.to_csv(output_file, sep="\t", index=False)
+        if output_parquet is not None:
+            write_parquet(rounded, output_parquet)
+        record["rows_out"] = len(gene_table)
     logging.info("Done.")
 
 
+@metrics.timed("filter_unmatched")
 def filter_unmatched(ase):
     ase_filter = ase["gene_id"].notna()
     logging.info(f"Removing {len(ase) - ase_filter.sum()}/{len(ase)} unmatched positions.")
+    metrics.count("removed_unmatched", int(len(ase) - ase_filter.sum()))
+    return ase[ase_filter]
+
+
+@metrics.timed("filter_unmatched")
+def filter_unmapped(ase, gene_map):
+    ase_filter = gene_map.genes_per_site()[ase["site"].to_numpy()] > 0
+    logging.info(f"Removing {len(ase) - ase_filter.sum()}/{len(ase)} unmatched positions.")
+    metrics.count("removed_unmatched", int(len(ase) - ase_filter.sum()))
     return ase[ase_filter]
 
 
+@metrics.timed("filter_genotypes")
 def filter_genotypes(genotyped):
-    phased_filter = genotyped["GT"].str.contains("|")
+    phased_filter = genotyped["GT"].str.contains("|", regex=False)
     print(f"Removing {len(genotyped) - phased_filter.sum()}/{len(genotyped)} unphased positions.")
+    metrics.count("removed_unphased", int(len(genotyped) - phased_filter.sum()))
     genotyped = genotyped[phased_filter]
-    dip_het_filter = (genotyped["GT"] == "0|1") | (genotyped["GT"] == "1|0") 
+    dip_het_filter = genotyped["GT"].isin(list(PHASE))
     print(f"Removing {len(genotyped) - dip_het_filter.sum()}/{len(genotyped)} non-diploid positions.")
-    return genotyped
+    metrics.count("removed_non_diploid", int(len(genotyped) - dip_het_filter.sum()))
+    return genotyped[dip_het_filter]
 
 
-def get_genotypes(vcf_reader):
+@metrics.timed("get_genotypes")
+def get_genotypes(variants_file, ase):
     logging.info(f"Reeading GT info.")
+    sites = set(zip(ase["contig"], ase["position"]))
+    if os.path.exists(f"{variants_file}.tbi") or os.path.exists(f"{variants_file}.csi"):
+        records = fetch_records(variants_file, sites)
+    else:
+        records = read_records(variants_file)
+
     gts_list = []
-    for record in vcf_reader:
-        hets = record.get_hets()
-        if len(hets) > 0 and hets[0].phased: 
-            gts_list.append([record.POS, record.CHROM, hets[0].data.GT])      
+    n_records = 0
+    for line in records:
+        n_records += 1
+        # split off only the site until we know it is one of the ASE positions
+        chrom, pos, rest = line.split("\t", 2)
+        if (chrom, int(pos)) not in sites:
+            continue
+        gt = first_het_genotype(rest.rstrip("\n").split("\t")[FORMAT - 2:])
+        if gt is not None and "|" in gt:
+            gts_list.append([int(pos), chrom, gt])
+    metrics.count("variants_read", n_records)
     return pd.DataFrame(gts_list, columns=["position", "contig", "GT"])
 
 
+def read_records(variants_file):
+    """Stream the data lines of a plain, gzipped or bgzipped VCF."""
+    with open(variants_file, "rb") as raw:
+        is_gzip = raw.read(2) == b"\x1f\x8b"
+    with (gzip.open(variants_file, "rt") if is_gzip else open(variants_file)) as vcf_file:
+        for line in vcf_file:
+            if not line.startswith("#"):
+                yield line
+
+
+def fetch_records(variants_file, sites):
+    """Fetch from a tabix-indexed VCF only the records of the regions spanned by the ASE sites."""
+    by_contig = {}
+    for contig, position in sites:
+        by_contig.setdefault(contig, []).append(position)
+
+    with pysam.TabixFile(variants_file) as tabix_file:
+        for contig in by_contig:
+            if contig not in tabix_file.contigs:
+                continue
+            positions = sorted(by_contig[contig])
+            start = positions[0]
+            for previous, position in zip(positions, positions[1:] + [None]):
+                if position is not None and position - previous <= REGION_GAP:
+                    continue
+                # records overlapping the region but starting before it belong to the previous region
+                for line in tabix_file.fetch(contig, start - 1, previous):
+                    if start <= int(line.split("\t", 2)[POS]) <= previous:
+                        yield line
+                start = position
+
+
+def first_het_genotype(calls):
+    """GT of the first heterozygous call of the FORMAT and sample columns, as PyVCF's record.get_hets()[0]."""
+    keys = calls[0].split(":")
+    if "GT" not in keys:
+        return None
+    gt_idx = keys.index("GT")
+    for call in calls[1:]:
+        values = call.split(":")
+        if gt_idx >= len(values):
+            continue
+        gt = values[gt_idx]
+        alleles = ALLELE_DELIMITER.split(gt)
+        called = any(allele != "." for allele in alleles)
+        if called and any(allele != alleles[0] for allele in alleles[1:]):
+            return gt
+    return None
+
+
+@metrics.timed("count_hap")
 def count_hap(hap_df):
-    hap_df.loc[hap_df["GT"] == "0|1", "hap1"] = hap_df["refCount"] 
-    hap_df.loc[hap_df["GT"] == "0|1", "hap2"] = hap_df["altCount"] 
-    hap_df.loc[hap_df["GT"] == "1|0", "hap1"] = hap_df["altCount"] 
-    hap_df.loc[hap_df["GT"] == "1|0", "hap2"] = hap_df["refCount"] 
-    hap_df = hap_df.astype({"hap1": int, "hap2": int})
+    ref_on_hap1 = hap_df["GT"].map(PHASE).to_numpy() > 0
+    ref = hap_df["refCount"].to_numpy()
+    alt = hap_df["altCount"].to_numpy()
+    hap_df["hap1"] = np.where(ref_on_hap1, ref, alt).astype(int)
+    hap_df["hap2"] = np.where(ref_on_hap1, alt, ref).astype(int)
     return hap_df
 
 
-def haplotype_imbalance(gene_table, haplotypes):  
+@metrics.timed("gene_sums")
+def gene_sums(counted):
+    # only the counts are summed, the text columns of the sites are not meaningful per gene
+    grouped = counted.groupby("gene_id", sort=True, observed=True)
+    gene_table = grouped[list(counted.select_dtypes("number").columns)].sum()
+    gene_table["positions"] = grouped.size()
+    return gene_table.reset_index()
+
+
+@metrics.timed("gene_sums")
+def mapped_gene_sums(counted, gene_map):
+    """
+    The sums of gene_sums for the genes of a site-to-gene mapping, as the product of the transposed sites x genes
+    matrix of the counted sites and their counts, without a row per site and gene.
+    """
+    sites = counted["site"].to_numpy()
+    columns = [column for column in counted.select_dtypes("number").columns if column != "site"]
+    genes = gene_map.matrix(sites).T.tocsr()
+    positions = genes @ np.ones(len(sites), dtype=np.int64)
+    found = np.nonzero(positions > 0)[0]
+
+    gene_table = pd.DataFrame({"gene_id": gene_map.gene_ids[found]})
+    for column in columns:
+        values = counted[column].to_numpy()
+        if values.dtype.kind in "iub":
+            values = values.astype(np.int64)
+        gene_table[column] = (genes @ values)[found]
+    gene_table["positions"] = positions[found]
+    return gene_table
+
+
+def haplotype_imbalance(gene_table):
     logging.info("Computing the imbalance between haplotypes.")
-    gene_table["HSE_ratio"] = haplotypes["hap1"] / haplotypes["totalCount"] 
-    gene_table["HEI_pval"] = np.array([sp.stats.binomtest(k=gene_table.hap1[idx], n=gene_table.totalCount[idx], p=.5).pvalue for idx in gene_table.index], dtype="float")
-    gene_table["HEI_padj"] = sm.stats.multipletests(gene_table['HEI_pval'], method="fdr_bh")[1]
+    gene_table["HSE_ratio"] = gene_table["hap1"] / gene_table["totalCount"]
+    gene_table["HEI_pval"] = binom_test_batch(gene_table["hap1"].to_numpy(), gene_table["totalCount"].to_numpy(), .5)
+    gene_table["HEI_padj"] = bh_adjust(gene_table["HEI_pval"])
 
 
 if __name__ == '__main__':
@@ -29,7 +29,7 @@
 /* this block is auto-generated based on info from pkg.json where   */
 /* changes can be made if needed, do NOT modify this block manually */
 nextflow.enable.dsl = 2
-version = '0.1.0'  // package version
+version = '0.2.0'  // package version
 
 container = [
     'ghcr.io': 'ghcr.io/icgc-argo-workflows/allele-specific-expression.ase-gene-annotation'
@@ -53,6 +53,11 @@ params.input_file = ""
 params.vcf_file = ""
 params.gtf_file = "/home/ubuntu/gencode.v40.chr_patch_hapl_scaff.annotation.gtf"
 params.assembly = "GRCh38"
+params.annotation_cache = ""  // SQLite file on the node caching the genes of the sites across runs, empty disables it
+params.annotation_cache_size = 10000000  // sites
+params.checkpoint_dir = ""  // directory kept across task retries for checkpoints of the annotation, empty disables them
+params.regions = ""  // BED file of the regions to annotate, empty string annotates all sites
+params.gene_map = false  // write the sites once with a site-to-gene mapping instead of a row per site and gene
 
 
 process aseGeneAnnotation {
@@ -72,16 +77,29 @@ process aseGeneAnnotation {
     path("${input_file.baseName}.gene.log"), emit: gene_log
     path("${input_file.baseName}.hap.tsv"), emit: hap_table
     path("${input_file.baseName}.hap.log"), emit: hap_log
+    path("${input_file.baseName}.gene_ase.tsv"), emit: gene_ase_table
+    path("${input_file.baseName}.gene_ase.log"), emit: gene_ase_log
+    path("${input_file.baseName}.gene.metrics.json"), emit: gene_metrics
+    path("${input_file.baseName}.hap.metrics.json"), emit: hap_metrics
+    path("${input_file.baseName}.gene_ase.metrics.json"), emit: gene_ase_metrics
+    path("${input_file.baseName}.genemap"), optional: true, emit: gene_map
 
   script:
     // add and initialize variables here as needed
+    cache_args = params.annotation_cache ? "--cache ${params.annotation_cache} --cache_size ${params.annotation_cache_size}" : ""
+    checkpoint_args = params.checkpoint_dir ? "--checkpoint ${params.checkpoint_dir}/${input_file.baseName}.gene.checkpoint" : ""
+    regions = params.regions ? "--regions ${params.regions}" : ""
+    gene_map = params.gene_map ? "--gene_map ${input_file.baseName}.genemap" : ""
 
     """
 
-    gene_annotation.py -I $input_file -O ${input_file.baseName}.tsv --gtf $params.gtf_file --ref $params.assembly
+    annotate_hap.py -I $input_file -V $vcf_file -O ${input_file.baseName}.tsv -H ${input_file.baseName}.hap.tsv -G ${input_file.baseName}.gene_ase.tsv --gtf $params.gtf_file --ref $params.assembly --workers ${task.cpus} $cache_args $checkpoint_args $regions $gene_map
     mv gene_annotation.log ${input_file.baseName}.gene.log
-    hap_table.py -I ${input_file.baseName}.tsv -V $vcf_file -O ${input_file.baseName}.hap.tsv
+    mv gene_annotation.metrics.json ${input_file.baseName}.gene.metrics.json
     mv hap_table.log ${input_file.baseName}.hap.log
+    mv hap_table.metrics.json ${input_file.baseName}.hap.metrics.json
+    mv gene_ase.log ${input_file.baseName}.gene_ase.log
+    mv gene_ase.metrics.json ${input_file.baseName}.gene_ase.metrics.json
     """
 }
 
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import sys
+import json
+import time
+import resource
+import functools
+from contextlib import contextmanager
+
+
+# Metrics of the current script run, a flat list of stage records in the order the stages finished
+_run = {}
+_active = []
+
+
+def reset(script):
+    """Start collecting the metrics of a new script run, discarding any collected before."""
+    _run.clear()
+    _run.update({"script": script, "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "stages": [],
+                 "_wall": time.perf_counter(), "_cpu": time.process_time()})
+    del _active[:]
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Measure a stage of the script. The yielded record takes the rows_out and any named counts of the stage, counts
+    added through count go to the innermost running stage.
+    """
+    record = {"stage": name, "wall_s": None, "cpu_s": None, "peak_rss_mb": None, "rows_in": rows_in,
+              "rows_out": None, "counts": {}}
+    _active.append(record)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record["wall_s"] = round(time.perf_counter() - wall, 6)
+        record["cpu_s"] = round(time.process_time() - cpu, 6)
+        record["peak_rss_mb"] = peak_rss_mb()
+        _active.pop()
+        if _run:
+            _run["stages"].append(record)
+
+
+def timed(name):
+    """Decorator measuring every call of a function as a stage, with the rows of the first table argument as its
+    input rows and the rows of the returned value as its output rows."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows_in = next((rows for rows in map(_rows, args) if rows is not None), None)
+            with stage(name, rows_in) as record:
+                result = func(*args, **kwargs)
+                record["rows_out"] = _rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def count(name, value):
+    """Add a named count, e.g. the number of sites removed by a filter, to the innermost running stage."""
+    if _active:
+        _active[-1]["counts"][name] = value.item() if hasattr(value, "item") else value
+
+
+def write(path):
+    """Write the metrics collected since reset as a JSON file, with the totals of the whole run."""
+    if not _run:
+        return
+    metrics = {key: value for key, value in _run.items() if not key.startswith("_")}
+    metrics["wall_s"] = round(time.perf_counter() - _run["_wall"], 6)
+    metrics["cpu_s"] = round(time.process_time() - _run["_cpu"], 6)
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    with open(path, "w") as metrics_file:
+        json.dump(metrics, metrics_file, indent=2)
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process so far, it never decreases between stages."""
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def _rows(value):
+    return len(value) if hasattr(value, "__len__") and not isinstance(value, (str, bytes)) else None
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import numpy as np
+
+
+# Columns of the ASEReadCounter table (.read). Contigs, alleles and ids repeat a few values over millions of sites
+# and are kept as categoricals, positions and read counts fit 32 bits.
+READ_DTYPES = {
+    "contig": "category",
+    "position": np.int32,
+    "variantID": "category",
+    "refAllele": "category",
+    "altAllele": "category",
+    "refCount": np.int32,
+    "altCount": np.int32,
+    "totalCount": np.int32,
+    "lowMAPQDepth": np.int32,
+    "lowBaseQDepth": np.int32,
+    "rawDepth": np.int32,
+    "otherBases": np.int32,
+    "improperPairs": np.int32,
+}
+# Columns added by ase-cleanup (.clean)
+CLEAN_DTYPES = dict(READ_DTYPES, ase_ratio=np.float64, mappability=np.float64, ref_bias=np.float64,
+                    AEI_pval=np.float64, AEI_padj=np.float64)
+# Columns added by gene_annotation.py (.tsv)
+ANNOTATED_DTYPES = dict(CLEAN_DTYPES, gene_id="category", feature="category")
+# Columns of the mappability table of the format (contig, pos, mappability), the mappability is read as text since
+# bedtools map writes "." for the sites without a score, it is converted to numbers with NaN for them
+MAPPABILITY_DTYPES = {"contig": "category", "pos": np.int32, "mappability": str}
+
+# Columns of the gene-annotated table the haplotype table is computed from
+HAP_COLUMNS = ["contig", "position", "gene_id", "refCount", "altCount", "totalCount"]
+# Columns of the gene-annotated table the gene-level allelic imbalance is computed from
+GENE_ASE_COLUMNS = ["gene_id", "refCount", "altCount", "totalCount", "AEI_pval"]
+
+
+def dtypes(schema, columns=None):
+    """The dtypes of a schema, restricted to the given columns."""
+    return schema if columns is None else {column: schema[column] for column in columns if column in schema}
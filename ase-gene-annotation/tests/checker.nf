@@ -34,7 +34,7 @@
 /* this block is auto-generated based on info from pkg.json where   */
 /* changes can be made if needed, do NOT modify this block manually */
 nextflow.enable.dsl = 2
-version = '0.1.0'  // package version
+version = '0.2.0'  // package version
 
 container = [
     'ghcr.io': 'ghcr.io/icgc-argo-workflows/allele-specific-expression.ase-gene-annotation'
@@ -52,6 +52,11 @@ params.input_file = ""
 params.vcf_file = ""
 params.gtf_file = "/home/ubuntu/gencode.v40.chr_patch_hapl_scaff.annotation.gtf"
 params.assembly = "GRCh38"
+params.annotation_cache = ""
+params.annotation_cache_size = 10000000
+params.checkpoint_dir = ""
+params.regions = ""
+params.gene_map = false
 params.expected_output = ""
 params.expected_table = ""
 
@@ -0,0 +1,86 @@
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+
+import numpy as np
+import pytest
+import annotation_cache
+from annotation_cache import AnnotationCache
+
+
+@pytest.fixture
+def gtf_file(tmp_path):
+    path = tmp_path / "test.gtf"
+    path.write_text('chr1\ttest\tgene\t100\t500\t.\t+\t.\tgene_id "G3";\n')
+    return str(path)
+
+
+def test_get_put(tmp_path, gtf_file):
+    cache = AnnotationCache(str(tmp_path / "cache.db"), gtf_file)
+    contigs, positions = np.array(["chr1", "chr1", "chr2"]), np.array([150, 600, 150])
+    # the first site in two genes, the second one in none, the third one never annotated
+    cache.put(contigs[:2], positions[:2], np.array([0, 0]), np.array(["G10", "G3"], dtype=object),
+              np.array([False, True]))
+    cache.close()
+
+    cache = AnnotationCache(str(tmp_path / "cache.db"), gtf_file)
+    sites, gene_ids, exonic, found = cache.get(contigs[::-1], positions[::-1])
+    assert list(found) == [False, True, True]
+    assert list(sites) == [2, 2] and list(gene_ids) == ["G10", "G3"] and list(exonic) == [False, True]
+    assert (cache.hits, cache.misses) == (2, 1)
+    cache.close()
+
+
+def test_annotation_key(tmp_path, gtf_file):
+    cache = AnnotationCache(str(tmp_path / "cache.db"), gtf_file)
+    cache.put(["chr1"], [150], np.array([0]), np.array(["G3"], dtype=object), np.array([True]))
+    cache.close()
+
+    # the same annotation under another path shares the sites, another annotation does not
+    same = tmp_path / "same.gtf"
+    same.write_bytes(open(gtf_file, "rb").read())
+    other = tmp_path / "other.gtf"
+    other.write_text('chr1\ttest\tgene\t100\t600\t.\t+\t.\tgene_id "G3";\n')
+    for path, expected in [(same, [True]), (other, [False])]:
+        cache = AnnotationCache(str(tmp_path / "cache.db"), str(path))
+        assert list(cache.get(["chr1"], [150])[3]) == expected
+        cache.close()
+
+
+def test_eviction(tmp_path, gtf_file, monkeypatch):
+    # a clock ticking on every call, so that no two uses of the sites share a time
+    clock = iter(range(1000))
+    monkeypatch.setattr(annotation_cache.time, "time", lambda: float(next(clock)))
+    cache = AnnotationCache(str(tmp_path / "cache.db"), gtf_file, max_sites=2)
+    no_genes = (np.empty(0, dtype=np.int64), np.empty(0, dtype=object), np.empty(0, dtype=bool))
+    for position in [1, 2, 3]:
+        cache.put(["chr1"], [position], *no_genes)
+    # the first site is used again, so the second one is the least recently used
+    cache.get(["chr1"], [1])
+    cache.close()
+
+    cache = AnnotationCache(str(tmp_path / "cache.db"), gtf_file, max_sites=2)
+    assert list(cache.get(["chr1"] * 3, [1, 2, 3])[3]) == [True, False, True]
+    cache.close()
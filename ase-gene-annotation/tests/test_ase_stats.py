@@ -0,0 +1,105 @@
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+
+import numpy as np
+import pytest
+import ase_stats
+from ase_stats import binom_test_batch, bh_adjust, bh_adjust_columns, fisher_combine
+
+stats = pytest.importorskip("scipy.stats")
+
+
+@pytest.mark.parametrize("alternative", ["two-sided", "greater", "less"])
+def test_binom_test_batch(alternative):
+    rng = np.random.default_rng(1)
+    n = rng.integers(0, 200, 300)
+    k = rng.binomial(n, 0.4)
+    p = rng.choice([0.3, 0.45, 0.5, 0.8], len(n))
+    expected = [stats.binomtest(int(ki), int(ni), pi, alternative=alternative).pvalue if ni > 0 else 1.0
+                for ki, ni, pi in zip(k, n, p)]
+    assert np.allclose(binom_test_batch(k, n, p, alternative=alternative), expected, rtol=1e-10, atol=0)
+
+
+def test_binom_test_batch_shapes():
+    k = np.array([[3, 7], [0, 10]])
+    pvals = binom_test_batch(k, 10, 0.5)
+    assert pvals.shape == (2, 2)
+    assert np.allclose(pvals, [[stats.binomtest(int(ki), 10, 0.5).pvalue for ki in row] for row in k])
+    assert binom_test_batch([], [], 0.5).shape == (0,)
+    with pytest.raises(ValueError):
+        binom_test_batch(k, 10, 0.5, alternative="both")
+
+
+@pytest.mark.parametrize("n_max", [100, 2**31])
+def test_unique_triples(n_max):
+    # counts too large to pack into a single integer key fall back to sorting the rows
+    rng = np.random.default_rng(2)
+    n = rng.integers(0, 20, 500) * (n_max // 20)
+    k = np.minimum(rng.integers(0, 20, 500) * (n_max // 20), n)
+    p = rng.choice([0.25, 0.5, 0.6], 500)
+    uk, un, up, inverse = ase_stats._unique_triples(k.astype("float"), n.astype("float"), p)
+    unique = np.unique(np.column_stack([k, n, p]), axis=0)
+    assert sorted(zip(uk, un, up)) == sorted(map(tuple, unique))
+    assert np.array_equal(uk[inverse], k) and np.array_equal(un[inverse], n) and np.array_equal(up[inverse], p)
+
+
+def test_bh_adjust():
+    multitest = pytest.importorskip("statsmodels.stats.multitest")
+    pvals = np.random.default_rng(3).uniform(0, 0.2, 200)
+    pvals[:20] = pvals[20:40]
+    pvals[-5:] = [0, 1, 1, 0.5, 0.5]
+    assert np.allclose(bh_adjust(pvals), multitest.multipletests(pvals, method="fdr_bh")[1], rtol=1e-12, atol=0)
+    assert bh_adjust([]).shape == (0,)
+
+
+def test_bh_adjust_columns():
+    rng = np.random.default_rng(4)
+    columns = [rng.uniform(0, 0.1, n) for n in [50, 3, 1, 0, 50]]
+    padded = np.full((50, len(columns)), np.nan)
+    for i, column in enumerate(columns):
+        padded[:len(column), i] = column
+    adjusted = bh_adjust_columns(padded)
+    for i, column in enumerate(columns):
+        assert np.allclose(adjusted[:len(column), i], bh_adjust(column), rtol=1e-12, atol=0)
+        assert np.all(np.isnan(adjusted[len(column):, i]))
+
+
+def test_bh_adjust_columns_untested():
+    padded = np.array([[0.01, np.nan], [0.04, np.nan]])
+    with np.errstate(all="raise"):
+        adjusted = bh_adjust_columns(padded)
+    assert np.allclose(adjusted[:, 0], [0.02, 0.04]) and np.all(np.isnan(adjusted[:, 1]))
+    assert bh_adjust_columns(np.full((3, 2), np.nan)).shape == (3, 2)
+
+
+def test_fisher_combine():
+    rng = np.random.default_rng(5)
+    groups = [rng.uniform(0, 1, n) for n in [1, 2, 10, 200]] + [np.array([1e-300, 1e-10]), np.array([1.0, 1.0])]
+    log_pvals = [np.sum(np.log(pvals)) for pvals in groups]
+    combined = fisher_combine(log_pvals + [0.0], [len(pvals) for pvals in groups] + [0])
+    expected = [stats.combine_pvalues(pvals, method="fisher")[1] for pvals in groups]
+    assert np.allclose(combined[:-1], expected, rtol=1e-10, atol=0)
+    assert np.isnan(combined[-1])
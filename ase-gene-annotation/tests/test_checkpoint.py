@@ -0,0 +1,94 @@
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+
+import os
+from checkpoint import Checkpoint
+
+
+def test_resume(tmp_path):
+    path = str(tmp_path / "annotation.ckpt")
+    checkpoint = Checkpoint(path, ["input", 1], interval=0)
+    assert checkpoint.load() == ([], None)
+    checkpoint.add((0, 10), {"sites": 10})
+    checkpoint.add((10, 20), {"sites": 20})
+    checkpoint.close()
+
+    checkpoint = Checkpoint(path, ["input", 1], interval=0)
+    assert checkpoint.load() == ([(0, 10), (10, 20)], {"sites": 20})
+    checkpoint.add((20, 30), {"sites": 30})
+    checkpoint.close()
+    assert Checkpoint(path, ["input", 1]).load() == ([(0, 10), (10, 20), (20, 30)], {"sites": 30})
+
+
+def test_pending_blocks(tmp_path):
+    path = str(tmp_path / "annotation.ckpt")
+    checkpoint = Checkpoint(path, "input", interval=3600)
+    checkpoint.load()
+    checkpoint.add((0, 10), 10)
+    checkpoint.close()
+    # the block was not written before the interval passed
+    checkpoint = Checkpoint(path, "input", interval=3600)
+    assert checkpoint.load() == ([], None)
+    checkpoint.add((0, 10), 10)
+    checkpoint.save()
+    checkpoint.close()
+    assert Checkpoint(path, "input").load() == ([(0, 10)], 10)
+
+
+def test_cut_record(tmp_path):
+    path = str(tmp_path / "annotation.ckpt")
+    checkpoint = Checkpoint(path, "input", interval=0)
+    checkpoint.load()
+    checkpoint.add((0, 10), 10)
+    checkpoint.close()
+    size = os.path.getsize(path)
+    checkpoint = Checkpoint(path, "input", interval=0)
+    checkpoint.load()
+    checkpoint.add((10, 20), 20)
+    checkpoint.close()
+
+    # the process was killed while writing the second record
+    with open(path, "r+b") as checkpoint_file:
+        checkpoint_file.truncate(os.path.getsize(path) - 3)
+    checkpoint = Checkpoint(path, "input", interval=0)
+    assert checkpoint.load() == ([(0, 10)], 10)
+    assert os.path.getsize(path) == size
+    checkpoint.add((10, 20), 20)
+    checkpoint.close()
+    assert Checkpoint(path, "input").load() == ([(0, 10), (10, 20)], 20)
+
+
+def test_other_inputs(tmp_path):
+    path = str(tmp_path / "annotation.ckpt")
+    checkpoint = Checkpoint(path, "input", interval=0)
+    checkpoint.load()
+    checkpoint.add((0, 10), 10)
+    checkpoint.close()
+
+    checkpoint = Checkpoint(path, "other input", interval=0)
+    assert checkpoint.load() == ([], None)
+    checkpoint.remove()
+    assert not os.path.exists(path)
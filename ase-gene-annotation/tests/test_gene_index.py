@@ -0,0 +1,94 @@
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+
+import numpy as np
+import pytest
+from gene_index import GeneIndex
+
+# Genes in neither gene id nor start order, G10 sorting before G2
+GTF = [
+    ("chr1", "gene", 100, 500, "+", 'gene_id "G3"; gene_name "C";'),
+    ("chr1", "exon", 100, 200, "+", 'gene_id "G3"; transcript_id "T3"; exon_number "1"; exon_id "E3";'),
+    ("chr1", "gene", 150, 400, "-", 'gene_id "G10"; gene_name "A";'),
+    ("chr1", "exon", 300, 400, "-", 'gene_id "G10"; transcript_id "T10"; exon_number "1"; exon_id "E10";'),
+    ("chr1", "gene", 50, 450, "+", 'gene_id "G2"; gene_name "B";'),
+    ("chr1", "exon", 440, 450, "+", 'gene_id "G2"; transcript_id "T2"; exon_number "1"; exon_id "E2";'),
+    ("chr2", "gene", 10, 20, "+", 'gene_id "G1"; gene_name "D";'),
+]
+POSITIONS = [("chr1", position) for position in [49, 50, 99, 100, 160, 200, 201, 300, 401, 445, 450, 451, 500, 501]] + \
+            [("chr2", 15), ("2", 20), ("chr3", 15)]
+
+
+def gene_records(feature):
+    return [(contig, start, end, attributes.split('"')[1]) for contig, kind, start, end, _, attributes in GTF
+            if kind == feature]
+
+
+def annotations(index):
+    contigs, positions = zip(*POSITIONS)
+    sites, gene_ids, exonic = index.annotate(contigs, positions)
+    result = [[] for _ in POSITIONS]
+    for site, gene_id, is_exon in zip(sites, gene_ids, exonic):
+        result[site].append((gene_id, bool(is_exon)))
+    return result
+
+
+def test_annotate_order():
+    result = annotations(GeneIndex.from_records(gene_records("gene"), gene_records("exon")))
+    # genes at a site are in gene id order, as sorted by pyensembl's genes_at_locus
+    assert result[4] == [("G10", False), ("G2", False), ("G3", True)]
+    assert result[1] == [("G2", False)] and result[0] == []
+    assert result[10] == [("G2", True), ("G3", False)] and result[11] == [("G3", False)] and result[13] == []
+    assert result[14] == [("G1", False)] and result[15] == result[16] == []
+
+
+def test_annotate_as_pyensembl(tmp_path, monkeypatch):
+    pyensembl = pytest.importorskip("pyensembl")
+    monkeypatch.setenv("PYENSEMBL_CACHE_DIR", str(tmp_path / "cache"))
+    gtf = tmp_path / "test.gtf"
+    gtf.write_text("".join(f"{contig}\ttest\t{kind}\t{start}\t{end}\t.\t{strand}\t.\t{attributes}\n"
+                           for contig, kind, start, end, strand, attributes in GTF))
+    genome = pyensembl.Genome(reference_name="test", annotation_name="test", gtf_path_or_url=str(gtf))
+    genome.index()
+
+    expected = []
+    for contig, position in POSITIONS:
+        exon_genes = {exon.gene_id for exon in genome.exons_at_locus(contig=contig, position=position)}
+        expected.append([(gene.gene_id, gene.gene_id in exon_genes)
+                         for gene in genome.genes_at_locus(contig=contig, position=position)])
+    assert annotations(GeneIndex.from_genome(genome)) == expected
+
+
+def test_save_load(tmp_path):
+    index = GeneIndex.from_records(gene_records("gene"), gene_records("exon"))
+    index.save(str(tmp_path / "test.idx"))
+    loaded = GeneIndex.load(str(tmp_path / "test.idx"))
+    assert list(loaded.gene_ids) == ["G1", "G10", "G2", "G3"]
+    assert loaded.contigs == index.contigs
+    for name in ["gene_start", "gene_end", "gene_maxend", "gene_code", "exon_start", "exon_end", "exon_maxend",
+                 "exon_code"]:
+        assert np.array_equal(getattr(loaded, name), getattr(index, name))
+    assert annotations(loaded) == annotations(index)
@@ -29,7 +29,7 @@
 /* this block is auto-generated based on info from pkg.json where   */
 /* changes can be made if needed, do NOT modify this block manually */
 nextflow.enable.dsl = 2
-version = '0.1.0'  // package version
+version = '0.2.0'  // package version
 
 container = [
     'ghcr.io': 'ghcr.io/icgc-argo-workflows/allele-specific-expression.ase-read-counter'
@@ -55,6 +55,9 @@ params.min_depth = 8
 params.min_mapping_quality = 20
 params.min_base_quality = 10
 params.fa_path = "/home/ubuntu/GRCh38_Verily_v1.genome.fa.gz"
+params.scatter_count = 1  // number of interval chunks run in parallel, 1 disables the scatter
+params.scatter_by = "variants"  // "variants" balances the chunks by variant count, "contig" keeps whole contigs
+params.regions = ""  // BED file of the regions to count, empty string counts all variants
 
 process aseReadCounter {
   container "${params.container ?: container[params.container_registry ?: default_container_registry]}:${params.container_version ?: version}"
@@ -71,18 +74,32 @@ process aseReadCounter {
     path("${bam.baseName}.read"), emit: output_file
 
   script:
-    cat_cmd = "$vcf".endsWith(".gz") ? "zcat" : "cat"
-    filtered_vcf = "${vcf.baseName}.filtered.vcf"
+    filtered_vcf = "${vcf.baseName}.filtered.vcf.gz"
+    // the parallel chunks share the memory of the task
+    chunk_mem = (int) (params.mem * 1024 * 0.8 / Math.max(1, Math.min(params.scatter_count, params.cpus)))
+    regions_arg = params.regions ? "--regions ${params.regions}" : ""
+    // the chunks only hold variants of the regions already, the regions are intersected to skip the reads around them
+    intervals = params.regions ? "-L ${params.regions} --interval-set-rule INTERSECTION" : ""
 
     """        
     samtools index $bam 
-    $cat_cmd $vcf | cut -f 1,2 | sort -V -k1,1V -k2,2n | uniq -u > chr_file      
-    bcftools view $vcf --min-alleles 2 --max-alleles 2 -T chr_file -O v -o $filtered_vcf    
-    gatk IndexFeatureFile -I $filtered_vcf
-    gatk ASEReadCounter -R $params.fa_path -I $bam -V $filtered_vcf -O ${bam.baseName}.read \
-        --min-depth-of-non-filtered-base $params.min_depth \
-        --min-mapping-quality $params.min_mapping_quality \
-        --min-base-quality $params.min_base_quality
+    prefilter_vcf.py -V $vcf -O $filtered_vcf $regions_arg
+    if [ ${params.scatter_count} -gt 1 ]; then
+        split_intervals.py -V $filtered_vcf -n ${params.scatter_count} --by ${params.scatter_by} -O chunk
+    fi
+    if ls chunk_*.bed > /dev/null 2>&1; then
+        ls chunk_*.bed | xargs -P ${task.cpus} -I {} \
+            gatk --java-options "-Xmx${chunk_mem}m" ASEReadCounter -R $params.fa_path -I $bam -V $filtered_vcf -L {} $intervals -O {}.read \
+                --min-depth-of-non-filtered-base $params.min_depth \
+                --min-mapping-quality $params.min_mapping_quality \
+                --min-base-quality $params.min_base_quality
+        merge_ase_tables.py -V $filtered_vcf -O ${bam.baseName}.read chunk_*.bed.read
+    else
+        gatk ASEReadCounter -R $params.fa_path -I $bam -V $filtered_vcf $intervals -O ${bam.baseName}.read \
+            --min-depth-of-non-filtered-base $params.min_depth \
+            --min-mapping-quality $params.min_mapping_quality \
+            --min-base-quality $params.min_base_quality
+    fi
     """
 }
 
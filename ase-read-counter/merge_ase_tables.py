@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import heapq
+import argparse
+from vcf_io import contig_order
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the ASEReadCounter tables of the chunks of a VCF into the "
+                                     "table of a single run over the whole VCF.")
+    parser.add_argument("-V", "--vcf", required=True, help="The VCF the chunks were made from, for the order of the contigs.")
+    parser.add_argument("-O", "--output", required=True, help="Merged ASEReadCounter table.")
+    parser.add_argument("tables", nargs="+", help="ASEReadCounter tables of the chunks.")
+    args = parser.parse_args()
+
+    merge_tables(args.tables, args.output, contig_order(args.vcf))
+
+
+def merge_tables(tables, output_path, order):
+    """
+    K-way merge of tables sorted by contig and position into a single sorted table with one header line.
+
+    Each table is streamed, so only one line per table is held in memory.
+    """
+    files = [open(table) for table in tables]
+    try:
+        headers = [table_file.readline() for table_file in files]
+        if len(set(headers)) > 1:
+            raise Exception("The ASEReadCounter tables have different columns.")
+        # contigs missing from the VCF go after the known ones, in the order they are met
+        unknown = {}
+
+        def rank(contig):
+            if contig not in order:
+                unknown.setdefault(contig, len(order) + len(unknown))
+            return order.get(contig, unknown.get(contig))
+
+        def rows(table_file):
+            for line in table_file:
+                contig, position, _ = line.split("\t", 2)
+                yield rank(contig), int(position), line
+
+        with open(output_path, "w") as output:
+            output.write(headers[0])
+            for _, _, line in heapq.merge(*[rows(table_file) for table_file in files]):
+                output.write(line)
+    finally:
+        for table_file in files:
+            table_file.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import argparse
+from vcf_io import open_vcf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split the sites of a coordinate-sorted VCF into balanced chunks, "
+                                     "written as BED files to run ASEReadCounter on each chunk with -L.")
+    parser.add_argument("-V", "--vcf", required=True, help="Coordinate-sorted VCF, plain or gzipped.")
+    parser.add_argument("-n", "--chunks", required=True, type=int, help="Numeric, maximum number of chunks.")
+    parser.add_argument("--by", default="variants", choices=["variants", "contig"],
+                        help="balance the chunks by the number of variants, splitting contigs between chunks, or keep "
+                        "whole contigs in a chunk, default=variants")
+    parser.add_argument("-O", "--prefix", default="chunk", help="Chunks are written to <prefix>_<index>.bed")
+    args = parser.parse_args()
+
+    chunks = split_by_variants(args.vcf, args.chunks) if args.by == "variants" else split_by_contig(args.vcf, args.chunks)
+    for index, spans in enumerate(chunks):
+        write_bed(spans, "{}_{:03d}.bed".format(args.prefix, index))
+
+
+def read_sites(vcf_path):
+    """Stream the (contig, position) of the VCF records."""
+    with open_vcf(vcf_path) as vcf:
+        for line in vcf:
+            if not line.startswith("#"):
+                contig, position, _ = line.split("\t", 2)
+                yield contig, int(position)
+
+
+def split_by_variants(vcf_path, n_chunks):
+    """
+    Split the records into consecutive chunks of about the same number of records, each chunk a list of
+    (contig, first position, last position) spans.
+
+    Records at the same position always stay in one chunk, so the spans of different chunks never overlap.
+    """
+    total = sum(1 for _ in read_sites(vcf_path))
+    n_chunks = min(n_chunks, total)
+    chunks = []
+    spans = []
+    previous = None
+    for index, (contig, position) in enumerate(read_sites(vcf_path)):
+        chunk_end = (len(chunks) + 1) * total // n_chunks if n_chunks else total
+        if index >= chunk_end and (contig, position) != previous:
+            chunks.append(spans)
+            spans = []
+        if spans and spans[-1][0] == contig:
+            spans[-1][2] = position
+        else:
+            spans.append([contig, position, position])
+        previous = (contig, position)
+    if spans:
+        chunks.append(spans)
+    return chunks
+
+
+def split_by_contig(vcf_path, n_chunks):
+    """Assign whole contigs to the chunks, the contig with most records first to the chunk with fewest records."""
+    counts = {}
+    spans = {}
+    for contig, position in read_sites(vcf_path):
+        counts[contig] = counts.get(contig, 0) + 1
+        first, last = spans.get(contig, (position, position))
+        spans[contig] = (min(first, position), max(last, position))
+
+    n_chunks = min(n_chunks, len(counts))
+    loads = [0] * n_chunks
+    members = [[] for _ in range(n_chunks)]
+    for contig in sorted(counts, key=lambda contig: -counts[contig]):
+        chunk = loads.index(min(loads))
+        loads[chunk] += counts[contig]
+        members[chunk].append(contig)
+    # keep the contigs of a chunk in the order of the VCF
+    order = {contig: rank for rank, contig in enumerate(counts)}
+    return [[[contig] + list(spans[contig]) for contig in sorted(chunk, key=order.get)] for chunk in members]
+
+
+def write_bed(spans, bed_path):
+    with open(bed_path, "w") as bed:
+        for contig, first, last in spans:
+            # BED intervals are 0-based and half-open
+            bed.write("{}\t{}\t{}\n".format(contig, first - 1, last))
+
+
+if __name__ == "__main__":
+    main()
@@ -34,7 +34,7 @@
 /* this block is auto-generated based on info from pkg.json where   */
 /* changes can be made if needed, do NOT modify this block manually */
 nextflow.enable.dsl = 2
-version = '0.1.0'  // package version
+version = '0.2.0'  // package version
 
 container = [
     'ghcr.io': 'ghcr.io/icgc-argo-workflows/allele-specific-expression.ase-read-counter'
@@ -54,6 +54,9 @@ params.min_depth = 8
 params.min_mapping_quality = 20
 params.min_base_quality = 10
 params.fa_path = "/home/ubuntu/GRCh38_Verily_v1.genome.fa.gz"
+params.scatter_count = 1
+params.scatter_by = "variants"
+params.regions = ""
 
 params.expected_output  = ""
 
@@ -0,0 +1,57 @@
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+
+import pytest
+from merge_ase_tables import merge_tables
+from vcf_io import contig_order
+
+HEADER = "contig\tposition\tvariantID\trefAllele\taltAllele\trefCount\taltCount\n"
+
+
+def table_row(contig, position):
+    return f"{contig}\t{position}\t.\tA\tT\t1\t1\n"
+
+
+@pytest.mark.parametrize("contig_lines", ["", "##contig=<ID=chr1,length=1000>\n"])
+def test_merge_tables_contig_order(tmp_path, contig_lines):
+    # chr1 comes from the header when it has ##contig lines, the unplaced contigs only from the records
+    body = [("chr1", 5), ("chr1", 9), ("chrUn_b", 3), ("chrUn_a", 1), ("chrUn_a", 7)]
+    (tmp_path / "input.vcf").write_text("##fileformat=VCFv4.2\n" + contig_lines +
+                                        "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n" +
+                                        "".join(f"{contig}\t{position}\t.\tA\tT\t50\tPASS\t.\n"
+                                                for contig, position in body))
+    assert contig_order(str(tmp_path / "input.vcf")) == {"chr1": 0, "chrUn_b": 1, "chrUn_a": 2}
+
+    # the chunks are listed with the later contigs first, as the scatter orders them by size
+    chunks = [[("chrUn_a", 1), ("chrUn_a", 7)], [("chrUn_b", 3)], [("chr1", 5), ("chr1", 9)]]
+    tables = []
+    for i, chunk in enumerate(chunks):
+        table = tmp_path / f"chunk_{i}.bed.read"
+        table.write_text(HEADER + "".join(table_row(contig, position) for contig, position in chunk))
+        tables.append(str(table))
+    merge_tables(tables, str(tmp_path / "merged.read"), contig_order(str(tmp_path / "input.vcf")))
+
+    assert (tmp_path / "merged.read").read_text() == HEADER + "".join(table_row(*site) for site in body)
@@ -0,0 +1,66 @@
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+
+import pytest
+from prefilter_vcf import prefilter
+from regions import Regions
+
+HEADER = "##fileformat=VCFv4.2\n##contig=<ID=chr1>\n##contig=<ID=chr2>\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+RECORDS = [
+    "chr1\t100\t.\tA\tC\t50\tPASS\t.\n",
+    "chr1\t150\t.\tA\tC\t50\tPASS\t.\n",
+    "chr1\t150\t.\tA\tG\t50\tPASS\t.\n",
+    "chr1\t200\t.\tA\tC,G\t50\tPASS\t.\n",
+    "chr1\t201\t.\tG\tT\t50\tPASS\t.\n",
+    "chr1\t300\t.\tG\tT\t50\tPASS\t.\n",
+    "chr2\t100\t.\tT\tA\t50\tPASS\t.\n",
+]
+
+
+@pytest.fixture
+def vcf_file(tmp_path):
+    path = tmp_path / "input.vcf"
+    path.write_text(HEADER + "".join(RECORDS))
+    return str(path)
+
+
+def test_prefilter(vcf_file, tmp_path):
+    output = str(tmp_path / "output.vcf")
+    stats = prefilter(vcf_file, output)
+    with open(output) as vcf:
+        assert vcf.read() == HEADER + "".join(RECORDS[i] for i in [0, 4, 5, 6])
+    assert stats == {"read": 7, "duplicate": 2, "non_biallelic": 1, "outside_regions": 0, "kept": 4}
+
+
+def test_prefilter_regions(vcf_file, tmp_path):
+    bed = tmp_path / "regions.bed"
+    # the regions hold the 1-based positions 100 and 201 to 300 of chr1
+    bed.write_text("chr1\t250\t300\nchr1\t99\t100\nchr1\t200\t260\n")
+    output = str(tmp_path / "output.vcf")
+    stats = prefilter(vcf_file, output, Regions.from_bed(str(bed)))
+    with open(output) as vcf:
+        assert vcf.read() == HEADER + "".join(RECORDS[i] for i in [0, 4, 5])
+    assert stats == {"read": 7, "duplicate": 2, "non_biallelic": 1, "outside_regions": 1, "kept": 3}
@@ -0,0 +1,50 @@
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+
+import gzip
+import shutil
+import pytest
+from prefilter_vcf import prefilter
+
+
+@pytest.mark.skipif(not (shutil.which("bgzip") and shutil.which("tabix")), reason="bgzip and tabix of htslib needed")
+def test_bgzipped_output(tmp_path):
+    pysam = pytest.importorskip("pysam")
+    header = "##fileformat=VCFv4.2\n" + "".join(f"##contig=<ID={contig}>\n" for contig in ["chr1", "chr2", "chrX"]) + \
+             "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+    records = [f"{contig}\t{position}\t.\tA\tT\t50\tPASS\t.\n"
+               for contig, n in [("chr1", 30000), ("chr2", 10), ("chrX", 5000)] for position in range(1, n * 100, 100)]
+    (tmp_path / "input.vcf").write_text(header + "".join(records))
+    output = str(tmp_path / "output.vcf.gz")
+    assert prefilter(str(tmp_path / "input.vcf"), output)["kept"] == len(records)
+
+    with gzip.open(output, "rt") as vcf:
+        assert vcf.read() == header + "".join(records)
+    with pysam.TabixFile(output, index=output + ".tbi") as tabix:
+        assert list(tabix.contigs) == ["chr1", "chr2", "chrX"]
+        # fetch takes 0-based half-open coordinates, the 1-based positions 1001 to 1300
+        assert list(tabix.fetch("chrX", 1000, 1300)) == [f"chrX\t{position}\t.\tA\tT\t50\tPASS\t."
+                                                          for position in [1001, 1101, 1201]]
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import gzip
+import subprocess
+import contextlib
+
+
+def open_vcf(path):
+    """Open a plain, gzipped or bgzipped VCF as text, the compression is detected from the content of the file."""
+    with open(path, "rb") as raw:
+        is_gzip = raw.read(2) == b"\x1f\x8b"
+    return gzip.open(path, "rt") if is_gzip else open(path)
+
+
+def contig_order(vcf_path):
+    """
+    Contigs of a VCF in the order of its ##contig header lines, which follows the sequence dictionary of the reference.
+
+    Contigs of the records missing from the header, or all of them without ##contig lines, follow in the order of their
+    first record, the order of a sorted VCF.
+    """
+    order = {}
+    with open_vcf(vcf_path) as vcf:
+        for line in vcf:
+            if line.startswith("##contig=<"):
+                fields = dict(field.split("=", 1) for field in _split_header_fields(line.strip()[len("##contig=<"):-1]))
+                order.setdefault(fields["ID"], len(order))
+            elif not line.startswith("#"):
+                order.setdefault(line.split("\t", 1)[0], len(order))
+    return order
+
+
+def _split_header_fields(fields):
+    """Split the key=value fields of a structured header line on the commas outside of quotes."""
+    parts, current, quoted = [], [], False
+    for char in fields:
+        if char == '"':
+            quoted = not quoted
+        if char == "," and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current))
+    return [part for part in parts if "=" in part]
+
+
+@contextlib.contextmanager
+def bgzip_writer(path):
+    """Text file compressed by bgzip, the blocked gzip format readable by gzip and indexable by tabix."""
+    with open(path, "wb") as output:
+        bgzip = subprocess.Popen(["bgzip", "-c"], stdin=subprocess.PIPE, stdout=output, universal_newlines=True)
+        try:
+            yield bgzip.stdin
+        finally:
+            bgzip.stdin.close()
+            if bgzip.wait() != 0:
+                raise Exception("bgzip failed to compress {}.".format(path))
+
+
+def tabix_index(path):
+    """Index a bgzipped VCF to <path>.tbi with tabix."""
+    subprocess.run(["tabix", "-f", "-p", "vcf", path], check=True)
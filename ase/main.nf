@@ -26,7 +26,7 @@
 */
 
 nextflow.enable.dsl = 2
-version = '0.1.0'  // package version
+version = '0.2.0'  // package version
 
 // universal params go here, change default value as needed
 params.container = ""
@@ -39,11 +39,13 @@ params.publish_dir = ""  // set to empty string will disable publishDir
 // tool specific parmas go here, add / change as needed
 params.bam = ""
 params.vcf = ""
+params.sample_sheet = ""  // CSV with sample_id,bam,vcf columns, runs all samples instead of bam and vcf
 params.cleanup = true
+params.regions = ""  // BED file restricting the read counting, cleanup and annotation to its regions
 
-include { aseReadCounter } from './wfpr_modules/github.com/icgc-argo-workflows/allele-specific-expression/ase-read-counter@0.1.0/main.nf'
-include { aseCleanup } from './wfpr_modules/github.com/icgc-argo-workflows/allele-specific-expression/ase-cleanup@0.1.0/main.nf'
-include { aseGeneAnnotation } from './wfpr_modules/github.com/icgc-argo-workflows/allele-specific-expression/ase-gene-annotation@0.1.0/main.nf'
+include { aseReadCounter } from './wfpr_modules/github.com/icgc-argo-workflows/allele-specific-expression/ase-read-counter@0.2.0/main.nf'
+include { aseCleanup } from './wfpr_modules/github.com/icgc-argo-workflows/allele-specific-expression/ase-cleanup@0.2.0/main.nf'
+include { aseGeneAnnotation } from './wfpr_modules/github.com/icgc-argo-workflows/allele-specific-expression/ase-gene-annotation@0.2.0/main.nf'
 
 
 // please update workflow code as needed
@@ -65,11 +67,74 @@ workflow Ase {
 }
 
 
+// the per-sample outputs of the processes are named after the BAM, and are keyed by sample ID through that name
+def outputName(output_file, suffix) {
+  output_file.name.substring(0, output_file.name.length() - suffix.length())
+}
+
+
+// reads the samples of a sample sheet, the BAM and VCF paths are relative to the sheet
+def sampleSheet(sample_sheet) {
+  def sheet = file(sample_sheet)
+  def rows = sheet.splitCsv(header: true)
+  if (!rows) {
+    error "Sample sheet ${sample_sheet} lists no samples."
+  }
+  rows.each { row ->
+    if (!row.sample_id || !row.bam || !row.vcf) {
+      error "Sample sheet ${sample_sheet} needs the sample_id, bam and vcf columns, got: ${row}"
+    }
+  }
+  if (rows.collect { it.sample_id }.unique().size() != rows.size()) {
+    error "Sample sheet ${sample_sheet} has duplicated sample IDs."
+  }
+  def samples = rows.collect { row -> tuple(row.sample_id, file(sheet.parent.resolve(row.bam)), file(sheet.parent.resolve(row.vcf))) }
+  if (samples.collect { it[1].baseName }.unique().size() != samples.size()) {
+    error "Sample sheet ${sample_sheet} has BAM files with the same name, the outputs would clash."
+  }
+  Channel.fromList(samples)
+}
+
+
+// runs the samples of a channel of (sample_id, bam, vcf) tuples concurrently, the outputs are keyed by sample ID
+workflow AseSamples {
+  take:
+    samples
+
+
+  main:
+    read_out = aseReadCounter(samples.map { it[1] }, samples.map { it[2] })
+    clean_out = aseCleanup(read_out.output_file)
+    // the cleaned tables finish in any order, each is paired with the VCF of its sample by the BAM name,
+    // the table is <name>.clean or with parquet set <name>.parquet
+    names = samples.map { sample_id, bam, vcf -> tuple(bam.baseName, sample_id, vcf) }
+    cleaned = clean_out.output_file.map { tuple(it.baseName, it) }.join(names)
+    annotate_out = aseGeneAnnotation(cleaned.map { it[1] }, cleaned.map { it[3] })
+
+    sample_ids = names.map { name, sample_id, vcf -> tuple(name, sample_id) }
+    keyed = { outputs, suffix -> outputs.map { tuple(outputName(it, suffix), it) }.join(sample_ids).map { name, output_file, sample_id -> tuple(sample_id, output_file) } }
+    output_ase = keyed(annotate_out.gene_table, '.tsv')
+    output_hse = keyed(annotate_out.hap_table, '.hap.tsv')
+    output_vaf = keyed(clean_out.vaf_file, params.plot_backend == 'numpy' ? '.vaf.svg' : '.vaf.png')
+
+  emit:
+    output_ase
+    output_hse
+    output_vaf
+}
+
+
 // this provides an entry point for this main script, so it can be run directly without clone the repo
 // using this command: nextflow run <git_acc>/<repo>/<pkg_name>/<main_script>.nf -r <pkg_name>.v<pkg_version> --params-file xxx
 workflow {
-  Ase(
-    file(params.bam),
-    file(params.vcf)
-  )
+  if (params.sample_sheet) {
+    AseSamples(
+      sampleSheet(params.sample_sheet)
+    )
+  } else {
+    Ase(
+      file(params.bam),
+      file(params.vcf)
+    )
+  }
 }
\ No newline at end of file
@@ -31,7 +31,7 @@
 */
 
 nextflow.enable.dsl = 2
-version = '0.1.0'  // package version
+version = '0.2.0'  // package version
 
 // universal params
 params.publish_dir = ""
@@ -44,9 +44,11 @@ params.bam = ""
 params.vcf = ""
 params.expected_output = ""
 params.expected_table = ""
+params.sample_sheet = ""
+params.expected_dir = ""  // expected.<sample_id>.tsv and expected.<sample_id>.hap.tsv of the sample sheet runs
 params.cleanup = false
 
-include { Ase } from '../main'
+include { Ase; AseSamples; sampleSheet } from '../main'
 // include section starts
 // include section ends
 
@@ -91,11 +93,38 @@ workflow checker {
 }
 
 
+workflow checker_samples {
+  take:
+    samples
+    expected_dir
+
+  main:
+    AseSamples(
+      samples
+    )
+
+    outputs = AseSamples.out.output_ase.join(AseSamples.out.output_hse)
+    file_smart_diff(
+      outputs.map { it[1] },
+      outputs.map { it[2] },
+      outputs.map { file("${expected_dir}/expected.${it[0]}.tsv") },
+      outputs.map { file("${expected_dir}/expected.${it[0]}.hap.tsv") }
+    )
+}
+
+
 workflow {
-  checker(
-    file(params.bam),
-    file(params.vcf),
-    file(params.expected_output),    
-    file(params.expected_table)
-  )
+  if (params.sample_sheet) {
+    checker_samples(
+      sampleSheet(params.sample_sheet),
+      file(params.expected_dir)
+    )
+  } else {
+    checker(
+      file(params.bam),
+      file(params.vcf),
+      file(params.expected_output),    
+      file(params.expected_table)
+    )
+  }
 }
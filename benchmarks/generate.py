@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import os
+import gzip
+import argparse
+import numpy as np
+import pandas as pd
+
+
+# One site every SITE_SPACING bp on average, so 10M sites still fit on the human autosomes
+SITE_SPACING = 250
+MEAN_GENE_LENGTH = 100000
+CONTIGS = [f"chr{i}" for i in range(1, 23)]
+BASES = np.array(list("ACGT"))
+READ_COLUMNS = ["contig", "position", "variantID", "refAllele", "altAllele", "refCount", "altCount", "totalCount",
+                "lowMAPQDepth", "lowBaseQDepth", "rawDepth", "otherBases", "improperPairs"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic ASEReadCounter table with a matching VCF, "
+                                     "GTF and mappability bedgraph for benchmarking the ASE scripts.")
+    parser.add_argument("--sites", required=True, type=int, help="Numeric, number of sites of the ASE table")
+    parser.add_argument("--outdir", required=True, help="output directory")
+    parser.add_argument("--seed", default=42, type=int, help="Numeric, random seed")
+    args = parser.parse_args()
+
+    generate(args.sites, args.outdir, args.seed)
+
+
+def generate(n_sites, outdir, seed=42):
+    """Write sample.read, sample.vcf, sample.mapp, mappability.bedgraph.gz and annotation.gtf to outdir."""
+    os.makedirs(outdir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    sites = generate_sites(rng, n_sites)
+    sites[READ_COLUMNS].to_csv(os.path.join(outdir, "sample.read"), sep="\t", index=False)
+    write_vcf(rng, sites, os.path.join(outdir, "sample.vcf"))
+    write_mappability(rng, sites, os.path.join(outdir, "sample.mapp"), os.path.join(outdir, "mappability.bedgraph.gz"))
+    write_gtf(rng, sites, os.path.join(outdir, "annotation.gtf"))
+    return {name: os.path.join(outdir, name) for name in
+            ["sample.read", "sample.vcf", "sample.mapp", "mappability.bedgraph.gz", "annotation.gtf"]}
+
+
+def generate_sites(rng, n_sites):
+    """Het sites in the format of the ase-cleanup test inputs, spread over the autosomes in coordinate order."""
+    per_contig = np.bincount(rng.integers(0, len(CONTIGS), n_sites), minlength=len(CONTIGS))
+    contigs, positions = [], []
+    for contig, n in zip(CONTIGS, per_contig):
+        gaps = rng.integers(1, 2 * SITE_SPACING, n)
+        positions.append(100000 + np.cumsum(gaps))
+        contigs.append(np.full(n, contig, dtype=object))
+    contigs = np.concatenate(contigs)
+    positions = np.concatenate(positions)
+
+    ref = rng.integers(0, 4, n_sites)
+    alt = (ref + rng.integers(1, 4, n_sites)) % 4
+    total = rng.negative_binomial(2, 0.06, n_sites) + 1
+    # mostly balanced het sites, some with allelic imbalance and some genotyping errors
+    ratio = rng.choice([0.5, 0.52, 0.25, 0.75, 0.99], n_sites, p=[0.6, 0.2, 0.07, 0.07, 0.06])
+    ref_count = rng.binomial(total, ratio)
+    other = rng.poisson(0.05, n_sites)
+    low_mapq = rng.poisson(0.2, n_sites)
+
+    return pd.DataFrame({
+        "contig": contigs,
+        "position": positions,
+        "variantID": ".",
+        "refAllele": BASES[ref],
+        "altAllele": BASES[alt],
+        "refCount": ref_count,
+        "altCount": total - ref_count,
+        "totalCount": total,
+        "lowMAPQDepth": low_mapq,
+        "lowBaseQDepth": 0,
+        "rawDepth": total + other + low_mapq,
+        "otherBases": other,
+        "improperPairs": 0
+    })
+
+
+def write_vcf(rng, sites, vcf_file):
+    """Single-sample VCF of the ASE sites plus as many other variants, most of them phased hets."""
+    other = sites[["contig", "position", "refAllele", "altAllele"]].copy()
+    other["position"] += rng.integers(1, SITE_SPACING // 2, len(other))
+    variants = pd.concat([sites[["contig", "position", "refAllele", "altAllele"]], other])
+    variants["order"] = variants["contig"].map({contig: i for i, contig in enumerate(CONTIGS)})
+    variants = variants.sort_values(["order", "position"], kind="stable").drop_duplicates(["contig", "position"])
+
+    gt = rng.choice(["0|1", "1|0", "0/1", "1/1"], len(variants), p=[0.45, 0.45, 0.05, 0.05])
+    body = pd.DataFrame({
+        "#CHROM": variants["contig"].to_numpy(),
+        "POS": variants["position"].to_numpy(),
+        "ID": ".",
+        "REF": variants["refAllele"].to_numpy(),
+        "ALT": variants["altAllele"].to_numpy(),
+        "QUAL": 100,
+        "FILTER": "PASS",
+        "INFO": ".",
+        "FORMAT": "GT:DP",
+        "SAMPLE": np.char.add(gt.astype(str), ":20")
+    })
+    with open(vcf_file, "w") as vcf:
+        vcf.write("##fileformat=VCFv4.2\n")
+        vcf.write('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        vcf.write('##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read depth">\n')
+        for contig in CONTIGS:
+            vcf.write(f"##contig=<ID={contig}>\n")
+        body.to_csv(vcf, sep="\t", index=False)
+
+
+def write_mappability(rng, sites, mapp_file, bedgraph_file):
+    """Bedgraph tiling the span of the sites with intervals of random mappability, and its per-site table."""
+    intervals = []
+    for contig, positions in sites.groupby("contig", sort=False)["position"]:
+        end = positions.max() + 1000
+        bounds = np.unique(np.concatenate([[0, end], rng.integers(1, end, max(len(positions) // 2, 1))]))
+        intervals.append(pd.DataFrame({"contig": contig, "start": bounds[:-1], "end": bounds[1:]}))
+    intervals = pd.concat(intervals, ignore_index=True)
+    intervals["value"] = rng.choice([0.0, 0.02, 0.25, 0.5, 1.0], len(intervals), p=[0.05, 0.05, 0.1, 0.2, 0.6])
+    with gzip.open(bedgraph_file, "wt") as bedgraph:
+        intervals.to_csv(bedgraph, sep="\t", index=False, header=False)
+
+    mapp = []
+    for contig, contig_sites in sites.groupby("contig", sort=False):
+        tiles = intervals[intervals["contig"] == contig]
+        tile = np.searchsorted(tiles["start"].to_numpy(), contig_sites["position"].to_numpy() - 1, side="right") - 1
+        mapp.append(pd.DataFrame({"contig": contig, "pos": contig_sites["position"].to_numpy(),
+                                  "mappability": tiles["value"].to_numpy()[tile]}))
+    pd.concat(mapp).to_csv(mapp_file, sep="\t", index=False)
+
+
+def write_gtf(rng, sites, gtf_file):
+    """Genes over the span of the sites, each with a transcript and a handful of exons, some genes overlapping."""
+    # about one gene per MEAN_GENE_LENGTH of sites, like the genome's gene density
+    n_genes = int(np.clip(len(sites) * SITE_SPACING // MEAN_GENE_LENGTH, 50, 20000))
+    spans = sites.groupby("contig", sort=False)["position"].agg(["min", "max"])
+    contig = rng.choice(spans.index.to_numpy(), n_genes)
+    start = rng.integers(spans.loc[contig, "min"].to_numpy(), spans.loc[contig, "max"].to_numpy() + 1)
+    length = rng.integers(2000, 2 * MEAN_GENE_LENGTH, n_genes)
+    strand = rng.choice(["+", "-"], n_genes)
+
+    with open(gtf_file, "w") as gtf:
+        for i in range(n_genes):
+            gene_id = f"ENSG{i:011d}.1"
+            end = start[i] + length[i]
+            attributes = f'gene_id "{gene_id}"; gene_type "protein_coding"; gene_name "GENE{i}";'
+            transcript = attributes + f' transcript_id "ENST{i:011d}.1"; transcript_type "protein_coding"; transcript_name "GENE{i}-201";'
+            gtf.write(f"{contig[i]}\tSYNTHETIC\tgene\t{start[i]}\t{end}\t.\t{strand[i]}\t.\t{attributes}\n")
+            gtf.write(f"{contig[i]}\tSYNTHETIC\ttranscript\t{start[i]}\t{end}\t.\t{strand[i]}\t.\t{transcript}\n")
+            exon_starts = np.sort(rng.integers(start[i], end, rng.integers(1, 12)))
+            for j, exon_start in enumerate(exon_starts):
+                exon_end = min(exon_start + int(rng.integers(50, 2000)), end)
+                exon = transcript + f' exon_number "{j + 1}"; exon_id "ENSE{i:08d}{j:03d}.1";'
+                gtf.write(f"{contig[i]}\tSYNTHETIC\texon\t{exon_start}\t{exon_end}\t.\t{strand[i]}\t.\t{exon}\n")
+
+
+if __name__ == "__main__":
+    main()
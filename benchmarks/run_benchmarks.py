@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import resource
+import subprocess
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "ase-cleanup"), os.path.join(ROOT, "ase-gene-annotation")]
+
+import numpy as np
+import pandas as pd
+import generate
+import main as cleanup
+import gene_annotation
+import hap_table
+from gene_index import GeneIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the stages of ase-cleanup, ase-gene-annotation gene_annotation "
+                                     "and hap_table on synthetic data and report wall time, CPU time and peak memory.")
+    parser.add_argument("--sizes", nargs="+", default=[1000, 10000, 100000], type=int,
+                        help="Numeric, numbers of ASE sites to benchmark")
+    parser.add_argument("--workdir", default="benchmark_data", help="directory of the generated inputs")
+    parser.add_argument("--repeat", default=3, type=int, help="Numeric, runs per stage, the fastest one is reported")
+    parser.add_argument("--no_memory", action="store_true", help="skip the traced run measuring the peak memory")
+    parser.add_argument("--output", default="benchmark.json", help="JSON results file")
+    parser.add_argument("--compare", help="JSON results file of an earlier run to compare the wall times against")
+    parser.add_argument("--threshold", default=1.25, type=float,
+                        help="Numeric, slowdown ratio against --compare reported as a regression")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)-8s %(message)s', force=True)
+
+    results = {"meta": metadata(), "results": []}
+    for size in args.sizes:
+        print(f"Benchmarking {size} sites.", flush=True)
+        files = generate.generate(size, os.path.join(args.workdir, str(size)))
+        results["results"] += Benchmark(size, args.repeat, not args.no_memory).run(files)
+        # the maximum resident set size of the process is never reset, so it is reported per size cumulatively
+        results["meta"].setdefault("max_rss_mb", {})[size] = max_rss_mb()
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print_table(results["results"])
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(json.load(baseline)["results"], results["results"], args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+class Benchmark:
+    """Runs the stages of the three scripts on the files of one generated data set, feeding each stage the output
+    of the previous one like the scripts do."""
+
+    def __init__(self, size, repeat, memory):
+        self.size = size
+        self.repeat = repeat
+        self.memory = memory
+        self.records = []
+
+    def stage(self, name, run, setup=lambda: (), rows_in=None):
+        """
+        Time run(*setup()) repeat times and keep the fastest run, setup prepares fresh inputs outside of the timing.
+
+        The peak memory is measured in one more run under tracemalloc, which slows the run down and is therefore not
+        part of the timing. Returns the output of the last run.
+        """
+        wall, cpu = float("inf"), float("inf")
+        for _ in range(self.repeat):
+            inputs = setup()
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            output = run(*inputs)
+            wall = min(wall, time.perf_counter() - wall_start)
+            cpu = min(cpu, time.process_time() - cpu_start)
+
+        peak_mb = None
+        if self.memory:
+            inputs = setup()
+            tracemalloc.start()
+            try:
+                output = run(*inputs)
+                peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            finally:
+                tracemalloc.stop()
+
+        self.records.append({
+            "size": self.size, "stage": name, "wall_s": round(wall, 6), "cpu_s": round(cpu, 6),
+            "peak_mem_mb": None if peak_mb is None else round(peak_mb, 3),
+            "rows_in": rows_in, "rows_out": len(output) if hasattr(output, "__len__") else None})
+        return output
+
+    def run(self, files):
+        # ase-cleanup, in the order of clean_sample
+        ase = self.stage("cleanup.read_ase", lambda: cleanup.read_ase(files["sample.read"]), rows_in=self.size)
+        n_ase = len(ase)
+        self.stage("cleanup.add_mapp", lambda a: cleanup.add_mapp(a, files["sample.mapp"]),
+                   lambda: (ase.copy(),), n_ase)
+        # the first run builds the cached index, the later ones only open it
+        cache_dir = os.path.join(os.path.dirname(files["sample.read"]), "mapp_cache")
+        os.makedirs(cache_dir, exist_ok=True)
+        ase = self.stage("cleanup.add_mapp_bedgraph",
+                         lambda a: cleanup.add_mapp_bedgraph(a, files["mappability.bedgraph.gz"], cache_dir),
+                         lambda: (ase.copy(),), n_ase)
+        ref_bias_table = self.stage("cleanup.calc_ref_bias", lambda: cleanup.calc_ref_bias(ase, 10), rows_in=n_ase)
+
+        def merge_ref_bias(a):
+            ase_rb = pd.merge(a, ref_bias_table, how="left", on=["refAllele", "altAllele"])
+            ase_rb["ref_bias"] = ase_rb["ref_bias"].fillna(float(0.5))
+            ase_rb.set_index(a.index, inplace=True)
+            return ase_rb
+        ase_rb = self.stage("cleanup.merge_ref_bias", merge_ref_bias, lambda: (ase,), n_ase)
+        ase_ai = self.stage("cleanup.allelic_imbalance", cleanup.allelic_imbalance, lambda: (ase_rb.copy(),), n_ase)
+        perror = ase.otherBases.sum() / ase.rawDepth.sum()
+        ase_het = self.stage("cleanup.het_test", lambda a: cleanup.het_test(a, perror), lambda: (ase_ai.copy(),), n_ase)
+        ase_clean = self.stage("cleanup.clean_up", lambda a: cleanup.clean_up(a, 0.05, 20, perror),
+                               lambda: (ase_het.copy(),), n_ase)
+        plot_file = os.path.join(os.path.dirname(files["sample.read"]), "sample.vaf.png")
+        self.stage("cleanup.vaf_plot", lambda: cleanup.vaf_plot(ase_clean, plot_file), rows_in=len(ase_clean))
+        self.stage("cleanup.vaf_plot_numpy", lambda: cleanup.vaf_plot(ase_clean, plot_file, "numpy"),
+                   rows_in=len(ase_clean))
+
+        # ase-gene-annotation gene_annotation, the index is built through the pyensembl database like createGtfDB.py
+        clean = ase_clean.reset_index()
+        genome = self.stage("annotation.pyensembl_db", lambda: pyensembl_genome(files["annotation.gtf"]))
+        index = self.stage("annotation.index_build", lambda: GeneIndex.from_genome(genome))
+        index_file = f"{files['annotation.gtf']}.idx"
+        self.stage("annotation.index_save", lambda: index.save(index_file))
+        index = self.stage("annotation.index_load", lambda: GeneIndex.load(index_file))
+        gene_table = self.stage("annotation.create_gene_table",
+                                lambda: gene_annotation.create_gene_table(index, clean),
+                                rows_in=len(clean))
+        annotated = pd.merge(clean, gene_table, how="left", on=["contig", "position"])
+
+        # ase-gene-annotation hap_table, in the order of its main
+        ase_filtered = hap_table.filter_unmatched(annotated)
+        gts = self.stage("hap.get_genotypes", lambda: hap_table.get_genotypes(files["sample.vcf"], ase_filtered),
+                         rows_in=len(ase_filtered))
+        genotyped = pd.merge(ase_filtered, gts, how="inner", on=["position", "contig"])
+        gen_filtered = hap_table.filter_genotypes(genotyped)
+        simplified = gen_filtered.drop(columns=["position", "variantID", "refAllele", "altAllele", "ase_ratio",
+                                                "ref_bias", "AEI_pval", "AEI_padj"])
+        counted = self.stage("hap.count_hap", hap_table.count_hap, lambda: (simplified.copy(),), len(simplified))
+        gene_table = self.stage("hap.gene_sums", hap_table.gene_sums, lambda: (counted,), len(counted))
+        self.stage("hap.haplotype_imbalance", lambda g: hap_table.haplotype_imbalance(g) or g,
+                   lambda: (gene_table.copy(),), len(gene_table))
+
+        return self.records
+
+
+def pyensembl_genome(gtf):
+    """Index the GTF into a pyensembl database kept next to it, as createGtfDB.py does."""
+    os.environ["PYENSEMBL_CACHE_DIR"] = os.path.join(os.path.dirname(os.path.abspath(gtf)), "pyensembl")
+    import pyensembl
+    genome = pyensembl.Genome(reference_name="GRCh38", annotation_name="genome_annotation", gtf_path_or_url=gtf)
+    genome.index(overwrite=True)
+    return genome
+
+
+def metadata():
+    versions = {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__}
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit or None, "machine": platform.machine(),
+            "cpus": os.cpu_count(), "versions": versions}
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def print_table(records):
+    print(f"{'size':>10} {'stage':<32} {'wall_s':>10} {'cpu_s':>10} {'peak_mb':>10} {'rows_in':>10} {'rows_out':>10}")
+    for r in records:
+        peak = "-" if r["peak_mem_mb"] is None else f"{r['peak_mem_mb']:.1f}"
+        print(f"{r['size']:>10} {r['stage']:<32} {r['wall_s']:>10.4f} {r['cpu_s']:>10.4f} {peak:>10} "
+              f"{str(r['rows_in'] if r['rows_in'] is not None else '-'):>10} "
+              f"{str(r['rows_out'] if r['rows_out'] is not None else '-'):>10}")
+
+
+def compare(baseline, current, threshold):
+    """Report the stages whose wall time grew by more than the threshold ratio against the baseline run."""
+    # stages faster than this are dominated by noise
+    min_wall = 0.01
+    previous = {(r["size"], r["stage"]): r for r in baseline}
+    regressions = []
+    for r in current:
+        before = previous.get((r["size"], r["stage"]))
+        if before is None or max(before["wall_s"], r["wall_s"]) < min_wall:
+            continue
+        ratio = r["wall_s"] / max(before["wall_s"], 1e-9)
+        if ratio > threshold:
+            regressions.append(r)
+            print(f"REGRESSION {r['size']} {r['stage']}: {before['wall_s']:.4f}s -> {r['wall_s']:.4f}s ({ratio:.2f}x)")
+    print(f"{len(regressions)} regression(s) over {threshold:.2f}x.")
+    return regressions
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# The images of the packages are built with the package directory as the Docker build context and `COPY *.py /tools/`,
+# so a module used by several packages has to be a file in each of them. The module is only edited in its canonical
+# package and copied from there to the others with this script, the copies keeping the license header of their
+# package. With --check, the copies that differ from the canonical module are listed instead, as in the CI.
+# The canonical modules have to run on the python 3.6 of the ase-read-counter image.
+
+import os
+import sys
+import argparse
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module path in the package -> (canonical package, packages with a copy)
+SHARED_MODULES = {
+    "regions.py": ("ase-cleanup", ["ase-gene-annotation", "ase-read-counter"]),
+    "tests/test_regions.py": ("ase-cleanup", ["ase-gene-annotation", "ase-read-counter"]),
+    "array_file.py": ("ase-cleanup", ["ase-gene-annotation"]),
+    "tests/test_array_file.py": ("ase-cleanup", ["ase-gene-annotation"]),
+}
+
+
+def split_header(text):
+    """Split a module into its license header, up to the end of the first docstring and the blank lines after, and its code."""
+    lines = text.splitlines(True)
+    quotes = [i for i, line in enumerate(lines) if line.strip() == '"""']
+    if len(quotes) < 2:
+        raise Exception("The module has no license docstring.")
+    end = quotes[1] + 1
+    while end < len(lines) and not lines[end].strip():
+        end += 1
+    return "".join(lines[:end]), "".join(lines[end:])
+
+
+def read(path):
+    with open(path, encoding="utf-8") as module:
+        return module.read()
+
+
+def synced_copies():
+    """The path and the synced text of every copy of the shared modules."""
+    for module, (canonical, packages) in SHARED_MODULES.items():
+        _, code = split_header(read(os.path.join(ROOT, canonical, module)))
+        for package in packages:
+            path = os.path.join(ROOT, package, module)
+            header, _ = split_header(read(path))
+            yield path, header + code
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Copy the shared modules from their canonical package to the others.')
+    parser.add_argument('--check', action='store_true', help='only list the copies that differ, exit with 1 if any do')
+    args = parser.parse_args()
+
+    differing = []
+    for path, text in synced_copies():
+        if read(path) != text:
+            differing.append(os.path.relpath(path, ROOT))
+            if not args.check:
+                with open(path, "w", encoding="utf-8") as module:
+                    module.write(text)
+
+    for path in differing:
+        print(('differs from the canonical module: ' if args.check else 'synced: ') + path)
+    if args.check and differing:
+        sys.exit(1)
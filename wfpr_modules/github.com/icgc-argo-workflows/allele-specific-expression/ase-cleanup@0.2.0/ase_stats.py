@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+import numpy as np
+
+
+# Relative tolerance used by scipy when comparing the probability of the observed count against the other tail of
+# the distribution in the two-sided test.
+_RERR = 1 + 1e-7
+
+
+def binom_test_batch(k, n, p, alternative="two-sided"):
+    """Exact binomial test over whole arrays of successes k, trials n and probabilities p.
+
+    The arrays are broadcast against each other, so a scalar p can be used for all sites. Every distinct (k, n, p)
+    triple is evaluated only once. The p-values are the same as the ones of scipy.stats.binomtest.
+    """
+    k, n, p = np.broadcast_arrays(np.asarray(k, dtype="float"), np.asarray(n, dtype="float"),
+                                  np.asarray(p, dtype="float"))
+    shape = k.shape
+    if k.size == 0:
+        return np.empty(shape, dtype="float")
+
+    uk, un, up, inverse = _unique_triples(k.ravel(), n.ravel(), p.ravel())
+
+    # scipy.stats is imported only here, it takes longer to import than numpy
+    from scipy.stats import binom
+    if alternative == "two-sided":
+        pvals = _two_sided(uk, un, up)
+    elif alternative == "greater":
+        pvals = binom.sf(uk - 1, un, up)
+    elif alternative == "less":
+        pvals = binom.cdf(uk, un, up)
+    else:
+        raise ValueError("alternative must be one of 'two-sided', 'greater' or 'less'")
+
+    return np.minimum(pvals, 1.0)[inverse.reshape(-1)].reshape(shape)
+
+
+def _unique_triples(k, n, p):
+    """
+    The distinct (k, n, p) triples and the index of the triple of every element.
+
+    Counts and the few distinct probabilities are packed into a single integer key, which np.unique sorts much faster
+    than the rows of a triple array, the rows are only sorted if the key would overflow.
+    """
+    up_values, p_codes = np.unique(p, return_inverse=True)
+    limit = np.max(n, initial=0) + 1
+    integral = np.all(k == np.floor(k)) and np.all(n == np.floor(n)) and np.min(k, initial=0) >= 0
+    if integral and len(up_values) * limit * limit < 2**62:
+        limit = int(limit)
+        key = (p_codes.reshape(-1).astype(np.int64) * limit + n.astype(np.int64)) * limit + k.astype(np.int64)
+        unique, inverse = np.unique(key, return_inverse=True)
+        return (unique % limit).astype("float"), (unique // limit % limit).astype("float"), \
+            up_values[unique // (limit * limit)], inverse
+    unique, inverse = np.unique(np.column_stack([k, n, p]), axis=0, return_inverse=True)
+    return unique[:, 0], unique[:, 1], unique[:, 2], inverse
+
+
+def _two_sided(k, n, p):
+    # The p-value is the probability of all counts at most as likely as the observed one. The pmf is unimodal with the
+    # mode between floor(n*p) and ceil(n*p), so on the opposite side of the mode it is monotonic and the boundary of
+    # the "at most as likely" counts can be found by a binary search run over all triples at once.
+    from scipy.stats import binom
+    d = binom.pmf(k, n, p) * _RERR
+    mean = n * p
+    pvals = np.ones_like(k)
+
+    # observed count below the mean, the pmf is non-increasing on [ceil(n*p), n]
+    below = k < mean
+    if below.any():
+        kb, nb, pb = k[below], n[below], p[below]
+        first = _search(np.ceil(mean[below]), nb + 1,
+                        lambda i, valid: ~valid | (binom.pmf(i, nb, pb) <= d[below]))
+        pvals[below] = binom.cdf(kb, nb, pb) + binom.sf(first - 1, nb, pb)
+
+    # observed count above the mean, the pmf is non-decreasing on [0, floor(n*p)]
+    above = k > mean
+    if above.any():
+        ka, na, pa = k[above], n[above], p[above]
+        upper = np.floor(mean[above]) + 1
+        first = _search(np.zeros_like(ka), upper,
+                        lambda i, valid: ~valid | (binom.pmf(i, na, pa) > d[above]))
+        pvals[above] = binom.cdf(first - 1, na, pa) + binom.sf(ka - 1, na, pa)
+
+    return pvals
+
+
+def bh_adjust(pvals):
+    """Benjamini/Hochberg adjusted p-values, the same as the ones of statsmodels' multipletests(method="fdr_bh")."""
+    pvals = np.asarray(pvals, dtype="float")
+    order = np.argsort(pvals)
+    ranked = pvals[order] / (np.arange(1, len(pvals) + 1) / float(len(pvals)))
+    ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    ranked[ranked > 1] = 1
+    adjusted = np.empty_like(ranked)
+    adjusted[order] = ranked
+    return adjusted
+
+
+def bh_adjust_columns(pvals):
+    """
+    bh_adjust of every column of a 2D array at once, the NaN entries padding the shorter columns are left out. Columns
+    without p-values stay NaN.
+    """
+    pvals = np.asarray(pvals, dtype="float")
+    n = np.sum(~np.isnan(pvals), axis=0)
+    tested = n > 0
+    # NaN sorts last, so the p-values of each column are ranked first
+    order = np.argsort(pvals, axis=0)
+    ranked = np.take_along_axis(pvals, order, axis=0)
+    ranked[:, tested] /= np.arange(1, len(pvals) + 1)[:, None] / n[tested].astype("float")
+    ranked = np.fmin.accumulate(ranked[::-1], axis=0)[::-1]
+    ranked[ranked > 1] = 1
+    adjusted = np.empty_like(ranked)
+    np.put_along_axis(adjusted, order, ranked, axis=0)
+    return adjusted
+
+
+def _search(lo, hi, predicate):
+    """Find the smallest i in [lo, hi] where the monotonic predicate holds, the predicate is taken to hold at hi."""
+    lo, hi = lo.copy(), hi.copy()
+    limit = hi.copy()
+    while True:
+        active = lo < hi
+        if not active.any():
+            return lo
+        mid = np.floor((lo + hi) / 2)
+        holds = predicate(mid, mid < limit)
+        hi = np.where(active & holds, mid, hi)
+        lo = np.where(active & ~holds, mid + 1, lo)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+import os
+import logging
+import numpy as np
+import pandas as pd
+import array_file
+from schema import READ_DTYPES
+
+
+# Magic of the array file of the matrix, its JSON header is only known once the arrays are filled
+MATRIX_MAGIC = b"ASECMAT1"
+# site x sample matrices, stored sample by sample so that the sites of a block of samples are contiguous
+COUNTS = ["refCount", "altCount", "totalCount", "otherBases", "rawDepth"]
+LABEL = "label"
+# Bytes of matrix values processed at once, bounding the samples of a block
+BLOCK_BYTES = 1 << 28
+
+
+class CountMatrix:
+    """
+    Read counts of many ASE tables aligned on (contig, position), as memory-mapped site x sample matrices.
+
+    The sites are the union of the sites of the tables, ordered by contig and position. A site that a table has several
+    rows of, which the cleanup of a single table keeps as they are, has as many consecutive slots as the most rows any
+    table has of it, the n-th row of the site in a table going to its n-th slot. Every sample has a column of
+    refCount, altCount, totalCount, otherBases and rawDepth, 0 where the sample has no site, and a column of labels,
+    the index of the (variantID, refAllele, altAllele) of the site in the sample, -1 where it has none. The rows of
+    each sample are also kept in the order of its table, so that its outputs can be written in that order.
+    """
+
+    def __init__(self, samples, contigs, positions, labels, arrays, row_offsets, rows, inputs=None):
+        self.samples = samples
+        # contig -> (first site, last site + 1)
+        self.contigs = contigs
+        self.positions = positions
+        # label -> (variantID, refAllele, altAllele)
+        self.labels = labels
+        self.arrays = arrays
+        self.row_offsets = row_offsets
+        self.rows = rows
+        self.inputs = inputs
+
+    @classmethod
+    def open(cls, ase_files, path):
+        """Open the matrix of the tables at path, building it unless it was built from the same versions of them."""
+        if os.path.exists(path):
+            matrix = cls.load(path)
+            if matrix.inputs == _fingerprint(ase_files):
+                logging.info(f"Opening count matrix {path}.")
+                return matrix
+            logging.info(f"Count matrix {path} was built from other tables, rebuilding it.")
+        cls.build(ase_files, path)
+        return cls.load(path)
+
+    @classmethod
+    def build(cls, ase_files, path):
+        logging.info(f"Building count matrix {path} of {len(ase_files)} ASE tables.")
+        # Pass one: the union of the sites, only the site columns are read
+        # contig -> (positions, the most rows of each position in a table)
+        sites, n_rows = {}, []
+        for ase_file in ase_files:
+            table = pd.read_csv(ase_file, sep="\t", usecols=[0, 1], dtype={0: str, 1: np.int64})
+            table.columns = ["contig", "position"]
+            for contig, positions in table.groupby("contig", sort=False)["position"]:
+                new_positions, new_counts = np.unique(positions.to_numpy(), return_counts=True)
+                old_positions, old_counts = sites.get(contig, (np.empty(0, dtype=np.int64),) * 2)
+                union = np.union1d(old_positions, new_positions)
+                counts = np.zeros(len(union), dtype=np.int64)
+                counts[np.searchsorted(union, old_positions)] = old_counts
+                new_idx = np.searchsorted(union, new_positions)
+                counts[new_idx] = np.maximum(counts[new_idx], new_counts)
+                sites[contig] = (union, counts)
+            n_rows.append(len(table))
+        contigs, offset = {}, 0
+        for contig, (positions, counts) in sites.items():
+            sites[contig] = np.repeat(positions, counts)
+            contigs[contig] = (offset, offset + len(sites[contig]))
+            offset += len(sites[contig])
+        positions = np.concatenate(list(sites.values())) if sites else np.empty(0, dtype=np.int64)
+        n_sites, n_samples = len(positions), len(ase_files)
+        row_offsets = np.concatenate([[0], np.cumsum(n_rows)]).astype(np.int64)
+
+        layout = {"position": ((n_sites,), np.int64), "rows": ((int(row_offsets[-1]),), np.int32),
+                  **{name: ((n_sites, n_samples), np.int32) for name in COUNTS + [LABEL]}}
+        with array_file.create(path, MATRIX_MAGIC, layout) as (arrays, header):
+            if n_sites > 0:
+                arrays["position"][:] = positions
+                arrays[LABEL][:] = -1
+
+            # Pass two: the counts and labels of every sample
+            labels = {}
+            for sample, ase_file in enumerate(ase_files):
+                table = pd.read_csv(ase_file, sep="\t", dtype=READ_DTYPES)
+                rows = np.empty(len(table), dtype=np.int64)
+                # the n-th row of a site goes to its n-th slot
+                repeat = table.groupby(["contig", "position"], sort=False, observed=True).cumcount().to_numpy()
+                for contig, positions_idx in table.groupby("contig", sort=False, observed=True).indices.items():
+                    lo, hi = contigs[contig]
+                    rows[positions_idx] = lo + np.searchsorted(positions[lo:hi], table["position"].to_numpy()[positions_idx]) \
+                        + repeat[positions_idx]
+                for name in COUNTS:
+                    arrays[name][rows, sample] = table[name].to_numpy()
+                codes, triples = pd.MultiIndex.from_arrays([table["variantID"], table["refAllele"], table["altAllele"]]).factorize()
+                global_codes = np.array([labels.setdefault(triple, len(labels)) for triple in triples], dtype=np.int32)
+                if len(rows) > 0:
+                    arrays[LABEL][rows, sample] = global_codes[codes]
+                    arrays["rows"][row_offsets[sample]:row_offsets[sample + 1]] = rows
+                logging.info(f"Added {len(rows)} sites of {ase_file}.")
+
+            header.update({"samples": [_sample_name(ase_file) for ase_file in ase_files],
+                           "inputs": _fingerprint(ase_files), "contigs": contigs, "labels": list(labels),
+                           "row_offsets": row_offsets.tolist()})
+        logging.info(f"Count matrix of {n_sites} sites and {n_samples} samples saved to {path}.")
+
+    @classmethod
+    def load(cls, path):
+        """Open a matrix written by build, the arrays are memory-mapped rather than read."""
+        header, arrays = array_file.load(path, MATRIX_MAGIC, "count matrix")
+        return cls(header["samples"], {contig: tuple(bounds) for contig, bounds in header["contigs"].items()},
+                   arrays.pop("position"), [tuple(label) for label in header["labels"]], arrays,
+                   np.array(header["row_offsets"], dtype=np.int64), arrays.pop("rows"), header["inputs"])
+
+    def __getitem__(self, name):
+        """The site x sample matrix of a count column or of the labels."""
+        return self.arrays[name]
+
+    def sample_rows(self, sample):
+        """The sites of a sample in the order of its table."""
+        return self.rows[self.row_offsets[sample]:self.row_offsets[sample + 1]]
+
+    def site_contigs(self):
+        contigs = np.empty(len(self.positions), dtype=object)
+        for contig, (lo, hi) in self.contigs.items():
+            contigs[lo:hi] = contig
+        return contigs
+
+    def locate(self, contig, positions):
+        """
+        Indices of the sites of a contig at the given positions, -1 where no sample has the site.
+
+        A site with several slots is located at its first one.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        lo, hi = self.contigs.get(contig, (0, 0))
+        idx = lo + np.searchsorted(self.positions[lo:hi], positions)
+        found = idx < hi
+        found[found] = np.asarray(self.positions)[idx[found]] == positions[found]
+        return np.where(found, idx, -1)
+
+    def sample_blocks(self):
+        """Ranges of samples whose matrix values of all columns fit BLOCK_BYTES together."""
+        per_sample = max(len(self.positions), 1) * 4 * (len(COUNTS) + 1)
+        size = max(1, BLOCK_BYTES // per_sample)
+        return [range(start, min(start + size, len(self.samples))) for start in range(0, len(self.samples), size)]
+
+
+def _sample_name(ase_file):
+    return os.path.splitext(os.path.basename(ase_file))[0]
+
+
+def _fingerprint(ase_files):
+    """
+    Identifies the tables by their file names, sizes and modification times.
+
+    The directories are left out, as Nextflow stages the same tables in a new work directory on every run.
+    """
+    return [[os.path.basename(ase_file), os.stat(ase_file).st_size, os.stat(ase_file).st_mtime_ns] for ase_file in ase_files]
@@ -0,0 +1,186 @@
+#!/usr/bin/env nextflow
+
+/*
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+*/
+
+/********************************************************************/
+/* this block is auto-generated based on info from pkg.json where   */
+/* changes can be made if needed, do NOT modify this block manually */
+nextflow.enable.dsl = 2
+version = '0.2.0'  // package version
+
+container = [
+    'ghcr.io': 'ghcr.io/icgc-argo-workflows/allele-specific-expression.ase-cleanup'
+]
+default_container_registry = 'ghcr.io'
+/********************************************************************/
+
+
+// universal params go here
+params.container_registry = ""
+params.container_version = ""
+params.container = ""
+
+params.cpus = 1
+params.mem = 1  // GB
+params.publish_dir = ""  // set to empty string will disable publishDir
+
+
+// tool specific parmas go here, add / change as needed
+params.input_file = ""
+params.mapp_file = "/home/ubuntu/k50.umap.bedgraph.gz"
+params.mapp_cache_dir = ""  // directory of the binary mappability index, empty string uses the bedgraph directory
+params.min_mappability = 0.05
+params.min_SNP_depth = 16
+params.chunk_size = 0  // read the ASE table in chunks of this many sites, 0 reads the whole table
+params.plot_backend = "matplotlib"  // VAF plot writer, "numpy" skips the matplotlib import and writes the plot as SVG
+params.parquet = false  // write the cleaned table as Parquet instead of tab separated, for ase-gene-annotation to read
+params.regions = ""  // BED file of the regions to clean, empty string keeps all sites
+params.ref_bias_summary = ""  // cohort reference bias summary merged by aseRefBiasCohort, empty string estimates the bias per sample
+params.count_matrix_dir = ""  // directory keeping the count matrix of aseCleanupCohort across runs, empty string builds it in the work directory
+
+
+process aseCleanup {
+  container "${params.container ?: container[params.container_registry ?: default_container_registry]}:${params.container_version ?: version}"
+  publishDir "${params.publish_dir}/${task.process.replaceAll(':', '_')}", mode: "copy", enabled: params.publish_dir
+
+  cpus params.cpus
+  memory "${params.mem} GB"
+
+    input:
+    path(ase)
+
+    output:
+    path(params.parquet ? "*.parquet" : "*.clean"), emit: output_file
+    path("*.log"), emit: log_file
+    path("*.vaf.{png,svg}"), emit: vaf_file
+    path("*.metrics.json"), emit: metrics_file
+    path("*.refbias.tsv"), emit: ref_bias_file
+
+    script:
+      mapp_cache = params.mapp_cache_dir ? "--mappability_cache ${params.mapp_cache_dir}" : ""
+      chunk_size = params.chunk_size ? "--chunk_size ${params.chunk_size}" : ""
+      output = params.parquet ? "--output_parquet ${ase.baseName}.parquet" : "--output ${ase.baseName}.clean"
+      plot_format = params.plot_backend == "numpy" ? "svg" : "png"
+      regions = params.regions ? "--regions ${params.regions}" : ""
+      ref_bias = params.ref_bias_summary ? "--ref_bias_summary ${params.ref_bias_summary}" : ""
+      """ 
+      main.py --ase $ase --min_SNP_depth $params.min_SNP_depth  $output --ref_bias_output ${ase.baseName}.refbias.tsv $ref_bias --mappability_bedgraph $params.mapp_file $mapp_cache --filter_mapp $params.min_mappability --plot ${ase.baseName}.vaf.${plot_format} --plot_backend $params.plot_backend $chunk_size $regions
+      mv ase_cleanup.log ${ase.baseName}.ase.log
+      mv ase_cleanup.metrics.json ${ase.baseName}.ase.metrics.json
+      """
+}
+
+
+// processes many ASE tables in one task, with a worker per cpu, for cohort reruns
+process aseCleanupBatch {
+  container "${params.container ?: container[params.container_registry ?: default_container_registry]}:${params.container_version ?: version}"
+  publishDir "${params.publish_dir}/${task.process.replaceAll(':', '_')}", mode: "copy", enabled: params.publish_dir
+
+  cpus params.cpus
+  memory "${params.mem} GB"
+
+    input:
+    path(ases)
+
+    output:
+    path(params.parquet ? "*.parquet" : "*.clean"), emit: output_file
+    path("*.ase.log"), emit: log_file
+    path("*.vaf.{png,svg}"), emit: vaf_file
+    path("*.ase.metrics.json"), emit: metrics_file
+    path("*.refbias.tsv"), emit: ref_bias_file
+
+    script:
+      mapp_cache = params.mapp_cache_dir ? "--mappability_cache ${params.mapp_cache_dir}" : ""
+      chunk_size = params.chunk_size ? "--chunk_size ${params.chunk_size}" : ""
+      parquet = params.parquet ? "--parquet" : ""
+      regions = params.regions ? "--regions ${params.regions}" : ""
+      ref_bias = params.ref_bias_summary ? "--ref_bias_summary ${params.ref_bias_summary}" : ""
+      """ 
+      main.py --ase $ases --workers $task.cpus --output_dir . $parquet --write_ref_bias $ref_bias --min_SNP_depth $params.min_SNP_depth --mappability_bedgraph $params.mapp_file $mapp_cache --filter_mapp $params.min_mappability --plot_backend $params.plot_backend $chunk_size $regions
+      """
+}
+
+
+// tests many ASE tables together over their site x sample count matrix, which is published for cross-sample queries
+process aseCleanupCohort {
+  container "${params.container ?: container[params.container_registry ?: default_container_registry]}:${params.container_version ?: version}"
+  publishDir "${params.publish_dir}/${task.process.replaceAll(':', '_')}", mode: "copy", enabled: params.publish_dir
+
+  cpus params.cpus
+  memory "${params.mem} GB"
+
+    input:
+    path(ases)
+
+    output:
+    path(params.parquet ? "*.parquet" : "*.clean"), emit: output_file
+    path("ase_cleanup.log"), emit: log_file
+    path("*.vaf.{png,svg}"), emit: vaf_file
+    path("ase_cleanup.metrics.json"), emit: metrics_file
+    path("*.refbias.tsv"), emit: ref_bias_file
+    path("cohort.counts"), emit: count_matrix
+
+    script:
+      mapp_cache = params.mapp_cache_dir ? "--mappability_cache ${params.mapp_cache_dir}" : ""
+      parquet = params.parquet ? "--parquet" : ""
+      regions = params.regions ? "--regions ${params.regions}" : ""
+      ref_bias = params.ref_bias_summary ? "--ref_bias_summary ${params.ref_bias_summary}" : ""
+      count_matrix = params.count_matrix_dir ? "${params.count_matrix_dir}/cohort.counts" : "cohort.counts"
+      """ 
+      main.py --ase $ases --cohort_matrix $count_matrix --output_dir . $parquet --write_ref_bias $ref_bias --min_SNP_depth $params.min_SNP_depth --mappability_bedgraph $params.mapp_file $mapp_cache --filter_mapp $params.min_mappability --plot_backend $params.plot_backend $regions
+      if [ ! -e cohort.counts ]; then ln -s $count_matrix cohort.counts; fi
+      """
+}
+
+
+// merges the reference bias summaries of samples, and of an earlier cohort to update it, into a cohort summary
+process aseRefBiasCohort {
+  container "${params.container ?: container[params.container_registry ?: default_container_registry]}:${params.container_version ?: version}"
+  publishDir "${params.publish_dir}/${task.process.replaceAll(':', '_')}", mode: "copy", enabled: params.publish_dir
+
+  cpus params.cpus
+  memory "${params.mem} GB"
+
+    input:
+    path(summaries, stageAs: "summaries/*")
+
+    output:
+    path("cohort.refbias.tsv"), emit: ref_bias_summary
+
+    script:
+      """
+      ref_bias.py -O cohort.refbias.tsv $summaries
+      """
+}
+
+
+// this provides an entry point for this main script, so it can be run directly without clone the repo
+// using this command: nextflow run <git_acc>/<repo>/<pkg_name>/<main_script>.nf -r <pkg_name>.v<pkg_version> --params-file xxx
+workflow {
+  aseCleanup(
+    file(params.input_file)
+  )
+}
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+import os
+import logging
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+
+COLUMNS = ["refAllele", "altAllele", "ratio_sum", "sites"]
+
+
+class RefBiasSummary:
+    """
+    The reference bias estimate of calc_ref_bias kept as its sufficient statistics, the sum of the reference allele
+    ratios and the number of the source sites of each (refAllele, altAllele) pair.
+
+    The sums of samples add up to the summary of the cohort, so a cohort prior is built by one merge of the sample
+    summaries and updated by merging the summaries of new samples into it.
+    """
+
+    def __init__(self, sums=None):
+        # (refAllele, altAllele) -> (ratio sum, number of sites)
+        self.sums = sums if sums is not None else {}
+
+    @classmethod
+    def from_sites(cls, ref_alleles, alt_alleles, ratios):
+        sites = pd.DataFrame({"refAllele": np.asarray(ref_alleles, dtype=object),
+                              "altAllele": np.asarray(alt_alleles, dtype=object),
+                              "ratio": np.asarray(ratios, dtype=np.float64)})
+        grouped = sites.groupby(["refAllele", "altAllele"], sort=True)["ratio"].agg(["sum", "count"])
+        return cls({pair: (float(ratio_sum), int(count)) for pair, ratio_sum, count in
+                    zip(grouped.index, grouped["sum"], grouped["count"])})
+
+    @classmethod
+    def load(cls, path):
+        summary = pd.read_csv(path, sep="\t", dtype={"refAllele": str, "altAllele": str, "ratio_sum": np.float64,
+                                                     "sites": np.int64})
+        missing = set(COLUMNS) - set(summary.columns)
+        if missing:
+            raise Exception(f"{path} is not a reference bias summary, it misses the columns {', '.join(sorted(missing))}.")
+        return cls({(ref, alt): (float(ratio_sum), int(sites)) for ref, alt, ratio_sum, sites in
+                    zip(summary["refAllele"], summary["altAllele"], summary["ratio_sum"], summary["sites"])})
+
+    def merge(self, other):
+        for pair, (ratio_sum, sites) in other.sums.items():
+            total_sum, total_sites = self.sums.get(pair, (0.0, 0))
+            self.sums[pair] = (total_sum + ratio_sum, total_sites + sites)
+        return self
+
+    def save(self, path):
+        """Write the summary under a temporary name and move it in place, so it can replace one of its inputs."""
+        rows = [(ref, alt, repr(ratio_sum), sites) for (ref, alt), (ratio_sum, sites) in sorted(self.sums.items())]
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as summary:
+                summary.write("\t".join(COLUMNS) + "\n")
+                for row in rows:
+                    summary.write("\t".join(map(str, row)) + "\n")
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def table(self):
+        """The mean reference allele ratio of each pair, in the ref_bias table format of calc_ref_bias."""
+        pairs = [(ref, alt, ratio_sum / sites) for (ref, alt), (ratio_sum, sites) in sorted(self.sums.items()) if sites > 0]
+        return pd.DataFrame(pairs, columns=["refAllele", "altAllele", "ref_bias"])
+
+    @property
+    def n_sites(self):
+        return sum(sites for _, sites in self.sums.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge reference bias summaries of samples written by main.py "
+                                     "--ref_bias_output into a cohort summary. To add samples to a cohort, pass the "
+                                     "cohort summary along with the new sample summaries.")
+    parser.add_argument("summaries", nargs="+", help="reference bias summaries to merge")
+    parser.add_argument("-O", "--output", required=True, help="merged summary, may be one of the inputs")
+    args = parser.parse_args()
+
+    cohort = RefBiasSummary()
+    for path in args.summaries:
+        cohort.merge(RefBiasSummary.load(path))
+    cohort.save(args.output)
+    logging.info(f"Merged {len(args.summaries)} summaries of {cohort.n_sites} sites into {args.output}.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s')
+    main()
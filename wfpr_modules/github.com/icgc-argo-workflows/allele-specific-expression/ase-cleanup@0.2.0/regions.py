@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+  Copyright (c) 2021, ICGC ARGO
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+  Authors:
+    Adam Streck
+"""
+
+
+# Shared module, only edited in ase-cleanup and copied to the other packages by scripts/sync_shared_modules.py
+
+import gzip
+import bisect
+
+
+class Regions:
+    """
+    Genomic regions of a BED file, merged and kept as per-contig lists of sorted, disjoint 0-based half-open
+    intervals, so that the sites inside them are found by binary search.
+
+    Reading the regions and testing single sites only needs the standard library, testing arrays of sites needs numpy.
+    """
+
+    def __init__(self, intervals):
+        # contig -> (starts, ends)
+        self.intervals = intervals
+        self._arrays = {}
+
+    @classmethod
+    def from_bed(cls, bed_file):
+        by_contig = {}
+        opener = gzip.open if _is_gzip(bed_file) else open
+        with opener(bed_file, "rt") as bed:
+            for line in bed:
+                if not line.strip() or line.startswith(("track", "browser", "#")):
+                    continue
+                contig, start, end = line.rstrip("\n").split("\t", 3)[:3]
+                by_contig.setdefault(contig, []).append((int(start), int(end)))
+
+        intervals = {}
+        for contig, contig_intervals in by_contig.items():
+            starts, ends = [], []
+            # overlapping and touching intervals are merged
+            for start, end in sorted(contig_intervals):
+                if starts and start <= ends[-1]:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            intervals[contig] = (starts, ends)
+        return cls(intervals)
+
+    def contains_site(self, contig, position):
+        """Whether the 1-based site lies in one of the regions."""
+        if contig not in self.intervals:
+            return False
+        starts, ends = self.intervals[contig]
+        # the last region starting at or before the 0-based site is the only one that can contain it
+        region = bisect.bisect_right(starts, position - 1) - 1
+        return region >= 0 and position - 1 < ends[region]
+
+    def contains(self, contigs, positions):
+        """Mask of the 1-based sites that lie in one of the regions."""
+        import numpy as np
+        positions = np.asarray(positions, dtype=np.int64)
+        inside = np.zeros(len(positions), dtype=bool)
+        contig_names, contig_idx = np.unique(np.asarray(contigs, dtype=object), return_inverse=True)
+        contig_idx = contig_idx.reshape(-1)
+        for i, contig in enumerate(contig_names):
+            if contig not in self.intervals:
+                continue
+            starts, ends = self._contig_arrays(contig)
+            selected = np.nonzero(contig_idx == i)[0]
+            site = positions[selected] - 1
+            region = np.searchsorted(starts, site, side="right") - 1
+            inside[selected] = (region >= 0) & (site < ends[np.maximum(region, 0)])
+        return inside
+
+    def _contig_arrays(self, contig):
+        if contig not in self._arrays:
+            import numpy as np
+            starts, ends = self.intervals[contig]
+            self._arrays[contig] = (np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64))
+        return self._arrays[contig]
+
+    def __len__(self):
+        return sum(len(starts) for starts, _ in self.intervals.values())
+
+
+def _is_gzip(path):
+    with open(path, "rb") as raw:
+        return raw.read(2) == b"\x1f\x8b"
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import argparse
+import metrics
+import gene_annotation
+import hap_table
+import gene_ase
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Annotate genomic positions with the overlapping genes and construct '
+                                     'the table counting expression of either parental haplotype from the annotated '
+                                     'positions, in a single process. Writes the outputs and logs of gene_annotation.py '
+                                     'and hap_table.py, and of gene_ase.py if its output file is given.')
+    parser.add_argument("--gtf", required=True, help="Annotation file as GFT format, in case pyensembl install failed")
+    parser.add_argument("-I", "--genomic_position_file", required=True, help="File with single base genomic position coordinates as first as second column. Format (tab-separated, with header, or Parquet): contig, pos, ...")
+    parser.add_argument("-V", "--variants_file", required=True, help="Variants Calling File with genotype annotation (GT).")
+    parser.add_argument("-O", "--output_file", required=True, help="Gene table output file. Format (tab-separated, with header): contig, pos, gene_id, ...")
+    parser.add_argument("-H", "--hap_output_file", required=True, help="Haplotype table output file.")
+    parser.add_argument("-G", "--gene_ase_file", help="Gene allelic imbalance table output file, of the genes of all positions regardless of their phase.")
+    parser.add_argument("--output_parquet", help="Also write the gene table as Parquet.")
+    gene_annotation.add_gene_map_argument(parser)
+    parser.add_argument("--ref", help="Reference name")
+    parser.add_argument("--index", help="Binary gene index created by createGtfDB.py, default: the GTF path with the .idx suffix. Falls back to the pyensembl database if missing.")
+    gene_annotation.add_cache_arguments(parser)
+    gene_annotation.add_workers_argument(parser)
+    gene_annotation.add_checkpoint_arguments(parser)
+    gene_annotation.add_regions_argument(parser)
+    args = parser.parse_args()
+
+    # the annotated table is handed to the haplotype table in memory rather than read back from the output
+    gene_annotation.setup_logging("gene_annotation.log")
+    metrics.reset("gene_annotation")
+    try:
+        annotated, gene_map = gene_annotation.annotate(args)
+    finally:
+        metrics.write("gene_annotation.metrics.json")
+
+    if args.gene_ase_file:
+        gene_ase.setup_logging("gene_ase.log")
+        metrics.reset("gene_ase")
+        try:
+            gene_ase.write_gene_ase(annotated, args.gene_ase_file, gene_map=gene_map)
+        finally:
+            metrics.write("gene_ase.metrics.json")
+
+    hap_table.setup_logging("hap_table.log")
+    metrics.reset("hap_table")
+    try:
+        hap_table.write_hap_table(annotated, args.variants_file, args.hap_output_file, gene_map=gene_map)
+    finally:
+        metrics.write("hap_table.metrics.json")
+
+
+if __name__ == '__main__':
+    main()
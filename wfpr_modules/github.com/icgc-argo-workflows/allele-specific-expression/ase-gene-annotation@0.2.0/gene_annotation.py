@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import os
+import hashlib
+import argparse
+import logging
+import multiprocessing
+import numpy as np
+import pandas as pd
+import metrics
+from gene_index import GeneIndex, index_path
+from annotation_cache import AnnotationCache, DEFAULT_MAX_SITES
+from checkpoint import Checkpoint, DEFAULT_INTERVAL
+from gene_map import GeneMap
+from table_io import read_table, write_parquet
+from schema import CLEAN_DTYPES
+from regions import Regions
+
+
+# Sites are annotated in blocks of this size, progress is logged after each block.
+LOG_INTERVAL = 10000
+GENE_COLUMNS = ["contig", "position", "gene_id", "feature"]
+
+
+def main():
+    setup_logging("gene_annotation.log")
+
+    # Register arguments
+    parser = argparse.ArgumentParser(description='Command line utility to '
+                                     'create a gene table with contig, pos, gene_id, ... columns from a '
+                                     'genomic postion file with contig, pos, ... columns. Genomic positions '
+                                     'overlapping multiple genes will be duplicated for each gene. Genomic '
+                                     'positions without overlap will not be included in output.')
+    parser.add_argument("--gtf", required=True, help="Annotation file as GFT format, in case pyensembl install failed")
+    parser.add_argument("-I", "--genomic_position_file", required=True, help="File with single base genomic position coordinates as first as second column. Format (tab-separated, with header, or Parquet): contig, pos, ...")
+    parser.add_argument("-O", "--output_file", required=True, help="Gene table output file. Format (tab-separated, with header): contig, pos, gene_id, ...")
+    parser.add_argument("--output_parquet", help="Also write the gene table as Parquet, which hap_table.py reads without parsing the text.")
+    add_gene_map_argument(parser)
+    parser.add_argument("--ref", help="Reference name")
+    parser.add_argument("--index", help="Binary gene index created by createGtfDB.py, default: the GTF path with the .idx suffix. Falls back to the pyensembl database if missing.")
+    add_cache_arguments(parser)
+    add_workers_argument(parser)
+    add_checkpoint_arguments(parser)
+    add_regions_argument(parser)
+
+    args = parser.parse_args()
+
+    metrics.reset("gene_annotation")
+    try:
+        annotate(args)
+    finally:
+        metrics.write("gene_annotation.metrics.json")
+
+
+def setup_logging(log_file):
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        datefmt='%a, %d %b %Y %H:%M:%S', 
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ], 
+        force=True)
+
+
+def add_cache_arguments(parser):
+    parser.add_argument("--cache", help="SQLite file caching the genes of the annotated sites across runs, only the sites missing from it are looked up. Safe to share between concurrent tasks on a node.")
+    parser.add_argument("--cache_size", default=DEFAULT_MAX_SITES, type=int, help=f"Numeric, maximum number of sites kept in the cache, the least recently used ones are evicted, default={DEFAULT_MAX_SITES}")
+
+
+def add_workers_argument(parser):
+    parser.add_argument("--workers", default=1, type=int, help="Numeric, number of processes annotating the sites of the different contigs in parallel, default=1")
+
+
+def add_checkpoint_arguments(parser):
+    parser.add_argument("--checkpoint", help="File the annotated sites are saved to periodically. A run of the same inputs resumes from it, it is removed once the output is written.")
+    parser.add_argument("--checkpoint_interval", default=DEFAULT_INTERVAL, type=int, help=f"Numeric, seconds between two saves of the checkpoint, default={DEFAULT_INTERVAL}")
+
+
+def add_gene_map_argument(parser):
+    parser.add_argument("--gene_map", help="Write the genes of the sites to this site-to-gene mapping file instead. The output file is then the table of the sites, each once, without the gene_id and feature columns.")
+
+
+def add_regions_argument(parser):
+    parser.add_argument("--regions", help="BED file of the regions to process, the sites outside of them are dropped as the input is read.")
+
+
+def in_regions(table, bed_file):
+    """The rows of a table with contig and position columns that lie in the regions of a BED file."""
+    regions = Regions.from_bed(bed_file)
+    logging.info(f"Processing the sites in {len(regions)} regions of {bed_file}.")
+    inside = regions.contains(table["contig"].to_numpy(), table["position"].to_numpy())
+    metrics.count("sites_in_regions", int(inside.sum()))
+    return table[inside].reset_index(drop=True)
+
+
+def annotate(args):
+    with metrics.stage("read_input") as record:
+        ase = read_table(args.genomic_position_file, dtype=CLEAN_DTYPES)
+        if args.regions:
+            ase = in_regions(ase, args.regions)
+        record["rows_out"] = len(ase)
+
+    indices = ["contig", "position"]
+
+    index_file = args.index or index_path(args.gtf)
+    data = load_gene_index(args.gtf, args.ref, index_file)
+   
+    cache = AnnotationCache(args.cache, args.gtf, args.cache_size) if args.cache else None
+    checkpoint = None
+    if args.checkpoint:
+        checkpoint = Checkpoint(args.checkpoint,
+                                run_fingerprint(args.genomic_position_file, args.gtf, index_file, args.regions),
+                                args.checkpoint_interval)
+    try:
+        # workers open the memory-mapped index file themselves rather than receiving a copy of the index
+        annotation = annotate_table(data, ase, cache, args.workers, index_file if os.path.exists(index_file) else None,
+                                    checkpoint)
+    finally:
+        if cache is not None:
+            cache.close()
+        if checkpoint is not None:
+            checkpoint.close()
+
+    gene_map = None
+    if args.gene_map:
+        # the sites are written as they are, their genes only go to the mapping
+        result = ase
+        gene_map = GeneMap.from_annotation(len(ase), *annotation)
+    else:
+        gene_table = gene_block(ase["contig"].to_numpy(), ase["position"].to_numpy(), *annotation)
+        with metrics.stage("merge", len(ase)) as record:
+            result = pd.merge(ase, gene_table, how='left', left_on=indices, right_on=indices)
+            record["rows_out"] = len(result)
+
+    ## Export resulting gene table
+    with metrics.stage("write_output", len(result)) as record:
+        logging.info("Exporting data to file %s.", args.output_file)
+        result.to_csv(args.output_file, sep="\t", index=False)
+        if args.output_parquet is not None:
+            write_parquet(result, args.output_parquet)
+        if gene_map is not None:
+            logging.info("Exporting the site-to-gene mapping to file %s.", args.gene_map)
+            gene_map.save(args.gene_map)
+        record["rows_out"] = len(result)
+    if checkpoint is not None:
+        checkpoint.remove()
+    logging.info("Done.")
+    return result, gene_map
+
+
+def run_fingerprint(input_file, gtf, index_file, regions=None):
+    """Identifies the inputs of a run by the content of the input table and regions and the version of the annotation."""
+    annotation = index_file if os.path.exists(index_file) else gtf
+    stat = os.stat(annotation)
+    return {"input": _sha1(input_file), "regions": _sha1(regions) if regions else None,
+            "annotation": [os.path.basename(annotation), stat.st_size, stat.st_mtime_ns], "block_size": LOG_INTERVAL}
+
+
+def _sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as content:
+        for chunk in iter(lambda: content.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+@metrics.timed("load_gene_index")
+def load_gene_index(gtf, ref, index_file):
+    if os.path.exists(index_file):
+        logging.info("Opening gene index %s.", index_file)
+        return GeneIndex.load(index_file)
+
+    logging.info("Gene index %s not found, loading the annotation through pyensembl.", index_file)
+    import pyensembl
+    genome = pyensembl.Genome(reference_name=ref, annotation_name='genome_annotation', gtf_path_or_url=gtf)
+    return GeneIndex.from_genome(genome)
+
+
+def create_gene_table(data, ase, cache=None, workers=1, index_file=None, checkpoint=None):
+    """The (contig, position, gene_id, feature) rows of the genes overlapping the sites, one per site and gene."""
+    return gene_block(ase["contig"].to_numpy(), ase["position"].to_numpy(),
+                      *annotate_table(data, ase, cache, workers, index_file, checkpoint))
+
+
+@metrics.timed("create_gene_table")
+def annotate_table(data, ase, cache=None, workers=1, index_file=None, checkpoint=None):
+    """The GeneIndex.annotate output of all sites of the ASE table, as the site indices, gene ids and exon flags."""
+    contigs = ase["contig"].to_numpy()
+    positions = ase["position"].to_numpy()
+    n_sites = len(ase)
+
+    stats_sites = 0
+    stats_multigene_sites = 0
+    stats_duplicates = 0
+    stats_sites_lost = 0
+    saved_blocks = []
+
+    if checkpoint is not None:
+        saved_blocks, state = checkpoint.load()
+        if state is not None:
+            stats_sites, stats_multigene_sites, stats_duplicates, stats_sites_lost = state
+            logging.info('Resuming from checkpoint %s at %s sites.', checkpoint.path, stats_sites)
+            metrics.count("resumed_sites", stats_sites)
+
+    logging.info('Processing sites.')
+
+    blocks = list(saved_blocks)
+    for block_start, block_end, sites, gene_ids, exonic in annotated_blocks(data, cache, contigs, positions, workers,
+                                                                             index_file, stats_sites):
+        genes_per_site = np.bincount(sites - block_start, minlength=block_end - block_start)
+        stats_duplicates += int(np.sum(genes_per_site[genes_per_site > 1] - 1))
+        stats_multigene_sites += int(np.sum(genes_per_site > 1))
+        stats_sites_lost += int(np.sum(genes_per_site == 0))
+        stats_sites = block_end
+
+        blocks.append((sites, gene_ids, exonic))
+        if checkpoint is not None:
+            checkpoint.add((sites, gene_ids, exonic),
+                           (stats_sites, stats_multigene_sites, stats_duplicates, stats_sites_lost))
+        if(stats_sites % LOG_INTERVAL == 0):
+            logging.info('%s sites (%.2f%%) processed.', stats_sites,
+                         float(stats_sites)/float(n_sites)*100)
+    if checkpoint is not None:
+        checkpoint.save()
+
+    annotation = merge_annotations(blocks)
+
+    # Log stats
+    logging.info('%s sites processed.', stats_sites)
+    logging.info('%s multigene sites found.', stats_multigene_sites)
+    logging.info('%s position duplicates added at multigene sites.', stats_duplicates)
+    logging.info('%s sites lost.', stats_sites_lost)
+    metrics.count("sites", stats_sites)
+    metrics.count("multigene_sites", stats_multigene_sites)
+    metrics.count("multigene_duplicates", stats_duplicates)
+    metrics.count("sites_lost", stats_sites_lost)
+    if cache is not None:
+        logging.info('%s sites found in the annotation cache, %s looked up.', cache.hits, cache.misses)
+        metrics.count("cache_hits", cache.hits)
+        metrics.count("cache_misses", cache.misses)
+
+    return annotation
+
+
+def gene_block(contigs, positions, sites, gene_ids, exonic):
+    return pd.DataFrame({
+        "contig": contigs[sites],
+        "position": positions[sites].astype(int),
+        "gene_id": gene_ids,
+        "feature": np.where(exonic, 'exon', 'intron')
+    }, columns=GENE_COLUMNS)
+
+
+def annotated_blocks(data, cache, contigs, positions, workers=1, index_file=None, first_site=0):
+    """
+    Annotate the sites in consecutive blocks of LOG_INTERVAL sites, yielding the bounds of each block with the
+    GeneIndex.annotate output of its sites, indexed in the whole table.
+
+    With more than one worker, the sites of each block are split by contig and annotated in a process pool, the blocks
+    are still yielded in order.
+    """
+    n_sites = len(positions)
+    bounds = [(start, min(start + LOG_INTERVAL, n_sites)) for start in range(first_site, n_sites, LOG_INTERVAL)]
+    if workers <= 1:
+        for start, end in bounds:
+            sites, gene_ids, exonic = annotate_sites(data, cache, contigs[start:end], positions[start:end])
+            yield start, end, sites + start, gene_ids, exonic
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(index_file or data,)) as pool:
+        # all blocks are submitted first, so that the workers never wait for the blocks to be collected
+        pending = []
+        for start, end in bounds:
+            block_contigs, block_positions = contigs[start:end], positions[start:end]
+            if cache is not None:
+                cached_sites, cached_genes, cached_exonic, found = cache.get(block_contigs, block_positions)
+                cached = [(cached_sites, cached_genes, cached_exonic)]
+                missing = np.nonzero(~found)[0]
+            else:
+                cached, missing = [], np.arange(end - start)
+            parts = []
+            for contig in pd.unique(block_contigs[missing]):
+                contig_sites = missing[block_contigs[missing] == contig]
+                parts.append((contig_sites, pool.apply_async(_annotate_contig, (contig, block_positions[contig_sites]))))
+            pending.append((start, end, cached, missing, parts))
+
+        for start, end, cached, missing, parts in pending:
+            looked_up = [(contig_sites[sites], gene_ids, exonic) for contig_sites, result in parts
+                         for sites, gene_ids, exonic in [result.get()]]
+            sites, gene_ids, exonic = merge_annotations(looked_up)
+            if cache is not None:
+                cache.put(contigs[start:end][missing], positions[start:end][missing], np.searchsorted(missing, sites),
+                          gene_ids, exonic)
+            sites, gene_ids, exonic = merge_annotations(cached + [(sites, gene_ids, exonic)])
+            yield start, end, sites + start, gene_ids, exonic
+
+
+def annotate_sites(data, cache, contigs, positions):
+    """GeneIndex.annotate of the sites, looking up only the sites missing from the cache if there is one."""
+    if cache is None:
+        return data.annotate(contigs, positions)
+
+    cached_sites, cached_genes, cached_exonic, found = cache.get(contigs, positions)
+    missing = np.nonzero(~found)[0]
+    sites, gene_ids, exonic = data.annotate(contigs[missing], positions[missing])
+    cache.put(contigs[missing], positions[missing], sites, gene_ids, exonic)
+    return merge_annotations([(cached_sites, cached_genes, cached_exonic), (missing[sites], gene_ids, exonic)])
+
+
+def merge_annotations(annotations):
+    """Join the GeneIndex.annotate outputs of disjoint sets of sites into one ordered by site."""
+    if not annotations:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=object), np.empty(0, dtype=bool)
+    # the genes of a site all come from the same output, so a stable sort by site keeps their order
+    sites = np.concatenate([sites for sites, _, _ in annotations])
+    order = np.argsort(sites, kind="stable")
+    return (sites[order], np.concatenate([gene_ids for _, gene_ids, _ in annotations])[order],
+            np.concatenate([exonic for _, _, exonic in annotations])[order])
+
+
+# Gene index of a worker process, opened once by the pool initializer
+_worker_index = None
+
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = GeneIndex.load(index) if isinstance(index, str) else index
+
+
+def _annotate_contig(contig, positions):
+    return _worker_index.annotate(np.full(len(positions), contig, dtype=object), positions)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import logging
+import numpy as np
+import array_file
+
+
+# Magic of the array file of the index
+INDEX_MAGIC = b"ASEGIDX2"
+ARRAYS = ["gene_start", "gene_end", "gene_maxend", "gene_code", "exon_start", "exon_end", "exon_maxend", "exon_code"]
+
+
+def index_path(gtf_path):
+    """Location of the binary index created next to the annotation by createGtfDB.py."""
+    return f"{gtf_path}.idx"
+
+
+def normalize_contig(contig):
+    """Contig naming used by pyensembl, so that sites are matched the same way as by genes_at_locus."""
+    contig = str(contig)
+    if contig.startswith("chr") and "_" not in contig:
+        return "chr" + contig[3:].upper()
+    elif contig.isalpha():
+        return contig.upper()
+    return contig
+
+
+class GeneIndex:
+    """
+    Gene and exon intervals of an annotation, kept as per-contig arrays sorted by start.
+
+    Genes are identified by a code, the position of their id in the sorted gene_ids array. Alongside the ends, each
+    contig keeps the running maximum of the ends so that the intervals overlapping a position form a contiguous
+    range of candidates that can be found by binary search.
+    """
+
+    def __init__(self, gene_ids, contigs, gene_start, gene_end, gene_code, exon_start, exon_end, exon_code,
+                 gene_maxend=None, exon_maxend=None):
+        self.gene_ids = np.asarray(gene_ids, dtype=object)
+        # contig -> (first gene, last gene + 1, first exon, last exon + 1)
+        self.contigs = contigs
+        self.gene_start = gene_start
+        self.gene_end = gene_end
+        self.gene_code = gene_code
+        self.gene_maxend = _running_max(gene_end, contigs, 0) if gene_maxend is None else gene_maxend
+        self.exon_start = exon_start
+        self.exon_end = exon_end
+        self.exon_code = exon_code
+        self.exon_maxend = _running_max(exon_end, contigs, 2) if exon_maxend is None else exon_maxend
+
+    @classmethod
+    def from_records(cls, genes, exons):
+        """Build the index from iterables of (contig, start, end, gene_id) records of genes and exons."""
+        genes = list(genes)
+        exons = list(exons)
+        gene_ids = np.array(sorted({record[3] for record in genes}), dtype=object)
+        codes = {gene_id: code for code, gene_id in enumerate(gene_ids)}
+
+        def columns(records):
+            contig = np.array([normalize_contig(record[0]) for record in records], dtype=str)
+            start = np.array([record[1] for record in records], dtype=np.int32)
+            end = np.array([record[2] for record in records], dtype=np.int32)
+            code = np.array([codes.get(record[3], -1) for record in records], dtype=np.int32)
+            # exons of genes missing from the gene records could never be reported
+            keep = code >= 0
+            contig, start, end, code = contig[keep], start[keep], end[keep], code[keep]
+            order = np.lexsort((end, start, contig))
+            return contig[order], start[order], end[order], code[order]
+
+        gene_contig, gene_start, gene_end, gene_code = columns(genes)
+        exon_contig, exon_start, exon_end, exon_code = columns(exons)
+
+        contigs = {}
+        for contig in np.unique(np.concatenate([gene_contig, exon_contig])):
+            contigs[str(contig)] = (int(np.searchsorted(gene_contig, contig, side="left")),
+                                    int(np.searchsorted(gene_contig, contig, side="right")),
+                                    int(np.searchsorted(exon_contig, contig, side="left")),
+                                    int(np.searchsorted(exon_contig, contig, side="right")))
+
+        return cls(gene_ids, contigs, gene_start, gene_end, gene_code, exon_start, exon_end, exon_code)
+
+    @classmethod
+    def from_genome(cls, genome):
+        """Build the index from the database of a pyensembl Genome, with a single query per feature."""
+        logging.info("Loading gene and exon intervals.")
+        query = "SELECT seqname, start, end, gene_id FROM %s"
+        genes = genome.db.run_sql_query(query % "gene")
+        exons = genome.db.run_sql_query(query % "exon")
+        logging.info("Loaded %s genes and %s exons.", len(genes), len(exons))
+        return cls.from_records(genes, exons)
+
+    @classmethod
+    def load(cls, path):
+        """Open a binary index written by save, the interval arrays are memory-mapped rather than read."""
+        header, arrays = array_file.load(path, INDEX_MAGIC, "gene index")
+        contigs = {contig: tuple(bounds) for contig, bounds in header["contigs"].items()}
+        return cls(header["gene_ids"], contigs, **arrays)
+
+    def save(self, path):
+        """Write the index as an array file of the interval arrays and a JSON header of the contigs and gene ids."""
+        array_file.save(path, INDEX_MAGIC, {"contigs": self.contigs, "gene_ids": self.gene_ids.tolist()},
+                        {name: getattr(self, name) for name in ARRAYS})
+
+    def annotate(self, contigs, positions):
+        """
+        Find the genes overlapping each site, together with whether the site lies in one of the gene's exons.
+
+        Returns the site indices, gene ids and exon flags of all (site, gene) overlaps, ordered by site and gene id.
+        This is the order of pyensembl's genes_at_locus, which sorts the ids of the genes at a locus, so the rows of
+        multigene sites keep the order of the tables annotated through pyensembl.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        contig_names, contig_idx = np.unique(np.asarray(contigs, dtype=object), return_inverse=True)
+        contig_idx = contig_idx.reshape(-1)
+
+        sites, codes, exonic = [], [], []
+        for i, contig in enumerate(contig_names):
+            bounds = self.contigs.get(normalize_contig(contig))
+            if bounds is None:
+                continue
+            gene_lo, gene_hi, exon_lo, exon_hi = bounds
+            selected = np.nonzero(contig_idx == i)[0]
+            pos = positions[selected]
+
+            gene_site, gene_hit = _overlaps(self.gene_start[gene_lo:gene_hi], self.gene_end[gene_lo:gene_hi],
+                                            self.gene_maxend[gene_lo:gene_hi], pos)
+            gene_code = np.asarray(self.gene_code[gene_lo:gene_hi])[gene_hit].astype(np.int64)
+            exon_site, exon_hit = _overlaps(self.exon_start[exon_lo:exon_hi], self.exon_end[exon_lo:exon_hi],
+                                            self.exon_maxend[exon_lo:exon_hi], pos)
+            exon_code = np.asarray(self.exon_code[exon_lo:exon_hi])[exon_hit].astype(np.int64)
+
+            # a gene is exonic at a site if any of its exons overlaps the site
+            n_genes = len(self.gene_ids)
+            is_exon = np.isin(gene_site * n_genes + gene_code, exon_site * n_genes + exon_code)
+
+            sites.append(selected[gene_site])
+            codes.append(gene_code)
+            exonic.append(is_exon)
+
+        if not sites:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=object), np.empty(0, dtype=bool)
+
+        sites = np.concatenate(sites)
+        codes = np.concatenate(codes)
+        exonic = np.concatenate(exonic)
+        order = np.lexsort((codes, sites))
+        return sites[order], self.gene_ids[codes[order]], exonic[order]
+
+
+def _running_max(ends, contigs, lo_field):
+    """Running maximum of the interval ends, restarted at the beginning of every contig."""
+    maxend = np.empty(len(ends), dtype=np.int32)
+    for bounds in contigs.values():
+        lo, hi = bounds[lo_field], bounds[lo_field + 1]
+        maxend[lo:hi] = np.maximum.accumulate(ends[lo:hi]) if hi > lo else ends[lo:hi]
+    return maxend
+
+
+def _overlaps(starts, ends, maxends, positions):
+    """All (site, interval) pairs with start <= position <= end, for intervals sorted by start."""
+    # intervals before lo end before the position, intervals from hi on start after it
+    hi = np.searchsorted(starts, positions, side="right")
+    lo = np.minimum(np.searchsorted(maxends, positions, side="left"), hi)
+    counts = hi - lo
+    sites = np.repeat(np.arange(len(positions)), counts)
+    offsets = np.cumsum(counts) - counts
+    candidates = lo[sites] + np.arange(counts.sum()) - offsets[sites]
+    hit = np.asarray(ends)[candidates] >= positions[sites]
+    return sites[hit], candidates[hit]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import numpy as np
+import array_file
+
+
+# Magic of the array file of the mapping
+MAP_MAGIC = b"ASEGMAP2"
+ARRAYS = ["indptr", "gene_code", "exonic"]
+
+
+class GeneMap:
+    """
+    Mapping of the sites of an ASE table to their overlapping genes in compressed sparse row form.
+
+    The genes of site i are gene_ids[gene_code[indptr[i]:indptr[i + 1]]], ordered by gene id, and exonic tells for
+    each (site, gene) edge whether the site lies in one of the gene's exons. A site overlapping several genes is kept
+    once in the site table and only its edges repeat, where the gene table repeats the whole row for every gene.
+    """
+
+    def __init__(self, gene_ids, indptr, gene_code, exonic):
+        self.gene_ids = np.asarray(gene_ids, dtype=object)
+        self.indptr = indptr
+        self.gene_code = gene_code
+        self.exonic = exonic
+
+    @classmethod
+    def from_annotation(cls, n_sites, sites, gene_ids, exonic):
+        """Build the mapping from the GeneIndex.annotate output of the n_sites sites of a table, ordered by site."""
+        unique_ids, gene_code = np.unique(np.asarray(gene_ids, dtype=object), return_inverse=True)
+        indptr = np.zeros(n_sites + 1, dtype=np.int64)
+        np.cumsum(np.bincount(np.asarray(sites, dtype=np.int64), minlength=n_sites), out=indptr[1:])
+        return cls(unique_ids, indptr, gene_code.reshape(-1).astype(np.int32), np.asarray(exonic, dtype=bool))
+
+    @classmethod
+    def load(cls, path):
+        """Open a mapping written by save, the arrays are memory-mapped rather than read."""
+        header, arrays = array_file.load(path, MAP_MAGIC, "site-to-gene mapping")
+        return cls(header["gene_ids"], **arrays)
+
+    def save(self, path):
+        """Write the mapping as an array file of its arrays and a JSON header of the gene ids."""
+        array_file.save(path, MAP_MAGIC, {"gene_ids": self.gene_ids.tolist()},
+                        {name: getattr(self, name) for name in ARRAYS})
+
+    @property
+    def n_sites(self):
+        return len(self.indptr) - 1
+
+    def genes_per_site(self):
+        return np.diff(self.indptr)
+
+    def matrix(self, sites=None):
+        """
+        The sites x genes 0/1 matrix of the mapping as a scipy CSR matrix, restricted to the rows of the given site
+        indices, which may repeat, if there are any.
+        """
+        from scipy import sparse
+        matrix = sparse.csr_matrix((np.ones(len(self.gene_code), dtype=np.int64), np.asarray(self.gene_code),
+                                    np.asarray(self.indptr)), shape=(self.n_sites, len(self.gene_ids)))
+        return matrix if sites is None else matrix[np.asarray(sites)]
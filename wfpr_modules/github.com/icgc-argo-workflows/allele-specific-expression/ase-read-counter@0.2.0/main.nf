@@ -0,0 +1,114 @@
+#!/usr/bin/env nextflow
+
+/*
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+*/
+
+/********************************************************************/
+/* this block is auto-generated based on info from pkg.json where   */
+/* changes can be made if needed, do NOT modify this block manually */
+nextflow.enable.dsl = 2
+version = '0.2.0'  // package version
+
+container = [
+    'ghcr.io': 'ghcr.io/icgc-argo-workflows/allele-specific-expression.ase-read-counter'
+]
+default_container_registry = 'ghcr.io'
+/********************************************************************/
+
+
+// universal params go here
+params.container_registry = ""
+params.container_version = ""
+params.container = ""
+
+params.cpus = 1
+params.mem = 1  // GB
+params.publish_dir = ""  // set to empty string will disable publishDir
+
+
+// tool specific parmas go here, add / change as needed
+params.bam = ""
+params.vcf = ""
+params.min_depth = 8
+params.min_mapping_quality = 20
+params.min_base_quality = 10
+params.fa_path = "/home/ubuntu/GRCh38_Verily_v1.genome.fa.gz"
+params.scatter_count = 1  // number of interval chunks run in parallel, 1 disables the scatter
+params.scatter_by = "variants"  // "variants" balances the chunks by variant count, "contig" keeps whole contigs
+params.regions = ""  // BED file of the regions to count, empty string counts all variants
+
+process aseReadCounter {
+  container "${params.container ?: container[params.container_registry ?: default_container_registry]}:${params.container_version ?: version}"
+  publishDir "${params.publish_dir}/${task.process.replaceAll(':', '_')}", mode: "copy", enabled: params.publish_dir
+
+  cpus params.cpus
+  memory "${params.mem} GB"
+
+  input:
+    path(bam)
+    path(vcf)
+
+  output:
+    path("${bam.baseName}.read"), emit: output_file
+
+  script:
+    filtered_vcf = "${vcf.baseName}.filtered.vcf.gz"
+    // the parallel chunks share the memory of the task
+    chunk_mem = (int) (params.mem * 1024 * 0.8 / Math.max(1, Math.min(params.scatter_count, params.cpus)))
+    regions_arg = params.regions ? "--regions ${params.regions}" : ""
+    // the chunks only hold variants of the regions already, the regions are intersected to skip the reads around them
+    intervals = params.regions ? "-L ${params.regions} --interval-set-rule INTERSECTION" : ""
+
+    """        
+    samtools index $bam 
+    prefilter_vcf.py -V $vcf -O $filtered_vcf $regions_arg
+    if [ ${params.scatter_count} -gt 1 ]; then
+        split_intervals.py -V $filtered_vcf -n ${params.scatter_count} --by ${params.scatter_by} -O chunk
+    fi
+    if ls chunk_*.bed > /dev/null 2>&1; then
+        ls chunk_*.bed | xargs -P ${task.cpus} -I {} \
+            gatk --java-options "-Xmx${chunk_mem}m" ASEReadCounter -R $params.fa_path -I $bam -V $filtered_vcf -L {} $intervals -O {}.read \
+                --min-depth-of-non-filtered-base $params.min_depth \
+                --min-mapping-quality $params.min_mapping_quality \
+                --min-base-quality $params.min_base_quality
+        merge_ase_tables.py -V $filtered_vcf -O ${bam.baseName}.read chunk_*.bed.read
+    else
+        gatk ASEReadCounter -R $params.fa_path -I $bam -V $filtered_vcf $intervals -O ${bam.baseName}.read \
+            --min-depth-of-non-filtered-base $params.min_depth \
+            --min-mapping-quality $params.min_mapping_quality \
+            --min-base-quality $params.min_base_quality
+    fi
+    """
+}
+
+
+// this provides an entry point for this main script, so it can be run directly without clone the repo
+// using this command: nextflow run <git_acc>/<repo>/<pkg_name>/<main_script>.nf -r <pkg_name>.v<pkg_version> --params-file xxx
+workflow {
+  aseReadCounter(
+    file(params.bam),
+    file(params.vcf)
+  )
+}
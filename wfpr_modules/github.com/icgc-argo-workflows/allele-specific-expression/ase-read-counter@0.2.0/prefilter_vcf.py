@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""
+  Copyright (c) 2021, Max Delbrück Center for Molecular Medicine in the Helmholtz Association
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy
+  of this software and associated documentation files (the "Software"), to deal
+  in the Software without restriction, including without limitation the rights
+  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+  copies of the Software, and to permit persons to whom the Software is
+  furnished to do so, subject to the following conditions:
+
+  The above copyright notice and this permission notice shall be included in all
+  copies or substantial portions of the Software.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+  SOFTWARE.
+
+  Authors:
+    Adam Streck
+"""
+
+import logging
+import argparse
+import itertools
+from vcf_io import open_vcf, bgzip_writer, tabix_index
+from regions import Regions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the biallelic records of a coordinate-sorted VCF whose position "
+                                     "has a single record, in one streaming pass.")
+    parser.add_argument("-V", "--vcf", required=True, help="Coordinate-sorted VCF, plain or gzipped.")
+    parser.add_argument("-O", "--output", required=True,
+                        help="Filtered VCF, bgzipped and tabix-indexed to <output>.tbi if the name ends with .gz")
+    parser.add_argument("--regions", help="BED file, only the records of the positions inside the regions are kept.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s %(message)s',
+                        datefmt='%a, %d %b %Y %H:%M:%S')
+
+    stats = prefilter(args.vcf, args.output, Regions.from_bed(args.regions) if args.regions else None)
+    logging.info("Read {read} records, removed {duplicate} at duplicated positions, {non_biallelic} non-biallelic and "
+                 "{outside_regions} outside of the regions, kept {kept}.".format(**stats))
+
+
+def prefilter(vcf_path, output_path, regions=None):
+    """
+    Write the records of the VCF that are alone at their position and have exactly two alleles, and lie in the
+    Regions if given.
+
+    This is the filter of `cut -f 1,2 | sort | uniq -u` followed by `bcftools view --min-alleles 2 --max-alleles 2 -T`.
+    The records of a position are adjacent in a sorted VCF, so a position is complete as soon as the next one starts
+    and only its records are held in memory.
+    """
+    stats = {"read": 0, "duplicate": 0, "non_biallelic": 0, "outside_regions": 0, "kept": 0}
+    compressed = output_path.endswith(".gz")
+    with open_vcf(vcf_path) as vcf, (bgzip_writer(output_path) if compressed else open(output_path, "w")) as output:
+        line = vcf.readline()
+        while line.startswith("#"):
+            output.write(line)
+            line = vcf.readline()
+
+        for group in _position_groups(itertools.chain([line] if line else [], vcf), stats):
+            if len(group) > 1:
+                stats["duplicate"] += len(group)
+            elif _n_alleles(group[0]) != 2:
+                stats["non_biallelic"] += 1
+            elif regions is not None and not _in_regions(regions, group[0]):
+                stats["outside_regions"] += 1
+            else:
+                stats["kept"] += 1
+                output.write(group[0])
+
+    if compressed:
+        tabix_index(output_path)
+    return stats
+
+
+def _in_regions(regions, line):
+    contig, position, _ = line.split("\t", 2)
+    return regions.contains_site(contig, int(position))
+
+
+def _position_groups(lines, stats):
+    """Group the data lines into the lists of records of each position."""
+    done_contigs = set()
+    group, current = [], None
+    for line in lines:
+        stats["read"] += 1
+        contig, position, _ = line.split("\t", 2)
+        site = (contig, int(position))
+        if site != current:
+            if group:
+                yield group
+            if current is not None and contig != current[0]:
+                done_contigs.add(current[0])
+            if contig in done_contigs or (current is not None and contig == current[0] and site[1] < current[1]):
+                raise Exception("The VCF is not sorted by coordinates at {}:{}.".format(contig, position))
+            group, current = [], site
+        group.append(line)
+    if group:
+        yield group
+
+
+def _n_alleles(line):
+    """Number of alleles of a record as bcftools counts them, REF plus the ALT alleles with '.' being none."""
+    alt = line.split("\t", 5)[4]
+    return 1 if alt == "." else alt.count(",") + 2
+
+
+if __name__ == "__main__":
+    main()